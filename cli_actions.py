@@ -5,6 +5,8 @@ import json
 from typing_extensions import deprecated
 import tqdm
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from engine.pdf_engine import PdfEngine
 from engine.pdf_renderer import BaseRenderer
 from engine.pdf_stream_parser import PDFStreamParser
@@ -396,6 +398,12 @@ def show_question(args: CmdArgs):
     clean = args.clean
     total_error = 0
     SCALING = 4
+    if is_extract and args.workers > 1:
+        total_error = extract_questions_in_workers(
+            args, debugging, clean, SCALING
+        )
+        print("\n\n\ntotal error files = ", total_error)
+        return
     engine: PdfEngine = PdfEngine(SCALING, clean)
     # print(args.data, type(args.data))
     engine.set_files(args.data)
@@ -419,34 +427,20 @@ def show_question(args: CmdArgs):
 
         if not is_ok:
             break
-        try:
-            engine.extract_questions_from_pdf(debugging, clean)
-        except Exception as e:
-            print(traceback.format_exc())
-            print("Error > SKipping file :", e)
-            total_error += 1
-            continue
         if is_extract:
-            out = [
-                q.__to_dict__() for q in engine.question_detector.question_list
-            ]
-            out_path = (
-                f"{igcse_path}{sep}{sub_id}{sep}pdf-extraction{sep}{exam_id}"
-            )
-            os.makedirs(out_path, exist_ok=True)
-            with open(f"{out_path}{sep}v1.json", "w", encoding="utf-8") as f:
-                out_dict = {
-                    "scale": SCALING,
-                    "page_width": engine.pages[1].mediabox.width,
-                    "page_height": engine.pages[1].mediabox.height,
-                    "line_height": engine.line_height,
-                    "questions": out,
-                }
-                # pprint.pprint(out_dict)
-                f.write(json.dumps(out_dict, ensure_ascii=False, indent=4))
+            # same steps as a worker, see `extract_exam_in_worker`
+            error = extract_exam(engine, debugging, clean, SCALING)
+            total_error += report_exam_error(error)
             # print(f"saved successfully in {out_path}")
             # engine.question_detector.print_final_results(engine.pdf_path)
         else:
+            try:
+                engine.extract_questions_from_pdf(debugging, clean)
+            except Exception as e:
+                print(traceback.format_exc())
+                print("Error > SKipping file :", e)
+                total_error += 1
+                continue
             for nr in args.range:
                 q_surf = engine.render_a_question(nr)
                 gui.show_page(q_surf, True)
@@ -454,6 +448,85 @@ def show_question(args: CmdArgs):
     print("\n\n\ntotal error files = ", total_error)
 
 
+def extract_exam(engine: PdfEngine, debugging, clean, scaling):
+    """extract and save the questions of the current exam of `engine`;
+    returns None, or (traceback, error message) if the exam failed"""
+    try:
+        engine.extract_questions_from_pdf(debugging, clean)
+    except Exception as e:
+        return traceback.format_exc(), str(e)
+    save_extracted_questions(engine, scaling)
+    return None
+
+
+def report_exam_error(error) -> int:
+    """print an error of `extract_exam`, returns the number of errors"""
+    if error is None:
+        return 0
+    trace, message = error
+    print(trace)
+    print("Error > SKipping file :", message)
+    return 1
+
+
+def save_extracted_questions(engine: PdfEngine, scaling):
+    sub_id = engine.pdf_name.split("_")[0]
+    exam_id = engine.pdf_name.split(".")[0]
+    out = [q.__to_dict__() for q in engine.question_detector.question_list]
+    out_path = f"{igcse_path}{sep}{sub_id}{sep}pdf-extraction{sep}{exam_id}"
+    os.makedirs(out_path, exist_ok=True)
+    with open(f"{out_path}{sep}v1.json", "w", encoding="utf-8") as f:
+        out_dict = {
+            "scale": scaling,
+            "page_width": engine.pages[1].mediabox.width,
+            "page_height": engine.pages[1].mediabox.height,
+            "line_height": engine.line_height,
+            "questions": out,
+        }
+        # pprint.pprint(out_dict)
+        f.write(json.dumps(out_dict, ensure_ascii=False, indent=4))
+
+
+# ****************** extract-questions --workers ************************
+# every worker process keeps one engine and extracts whole exams with it;
+# results come back in the order of args.data, so the log (and the error
+# count) is the same as for a sequential run.
+
+worker_engine: PdfEngine | None = None
+
+
+def init_extract_worker(scaling, clean):
+    global worker_engine
+    worker_engine = PdfEngine(scaling, clean)
+
+
+def extract_exam_in_worker(pdf, debugging, clean, scaling):
+    """`extract_exam` for one exam of args.data"""
+    engine = worker_engine
+    engine.set_files([pdf])
+    engine.proccess_next_pdf_file()
+    return extract_exam(engine, debugging, clean, scaling)
+
+
+def extract_questions_in_workers(args: CmdArgs, debugging, clean, scaling):
+    total_error = 0
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=init_extract_worker,
+        initargs=(scaling, clean),
+    ) as pool:
+        results = pool.map(
+            extract_exam_in_worker,
+            args.data,
+            repeat(debugging),
+            repeat(clean),
+            repeat(scaling),
+        )
+        for error in tqdm.tqdm(results, total=len(args.data)):
+            total_error += report_exam_error(error)
+    return total_error
+
+
 def show_page(args: CmdArgs):
     debugging = args.debug and PdfEngine.M_DEBUG
     clean = args.clean  # args.clean and(  PdfEngine.O_CLEAN_HEADER_FOOTER )
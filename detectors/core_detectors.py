@@ -26,6 +26,35 @@ class BaseDetector:
         pass
 
 
+class SequenceRecorder(BaseDetector):
+    """stores what a page feeds its detectors, so the pages can be
+    executed elsewhere (worker processes) and replayed later, in page
+    order, into the real detectors with `replay`"""
+
+    def __init__(self, id: int) -> None:
+        super().__init__(id)
+        self.sequences: list[SymSequence] = []
+
+    def attach(self, page_width, page_height, page: int):
+        super().attach(page_width, page_height, page)
+        self.sequences = []
+
+    def handle_sequence(self, seq: SymSequence, page: int):
+        self.sequences.append(seq)
+
+    def get_page_record(self):
+        return (self.width, self.height, self.curr_page, self.sequences)
+
+    @staticmethod
+    def replay(record, detectors: list[BaseDetector]):
+        width, height, page, sequences = record
+        for detector in detectors:
+            detector.attach(width, height, page)
+        for seq in sequences:
+            for detector in detectors:
+                detector.handle_sequence(seq, page)
+
+
 class LineDetector(BaseDetector):
     pass
 
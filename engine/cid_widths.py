@@ -0,0 +1,113 @@
+from bisect import bisect_right
+
+
+class CidWidths:
+    """widths of a composite (Type0) font, stored as sorted cid intervals.
+
+    every `/W` entry becomes one interval: `c [w1 w2 ...]` keeps its list,
+    `c_first c_last w` keeps a single width, so a range of thousands of
+    cids costs one entry. lookups bisect the interval starts; recently
+    used cids are kept in a small dict.
+    """
+
+    HOT_CACHE_SIZE = 512
+
+    def __init__(self, w_array: list | None = None):
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+        # a float (range entry) or a list of floats (array entry)
+        self.values: list = []
+        self.hot: dict[int, float] = {}
+        if w_array:
+            self.load_w_array(w_array)
+
+    def load_w_array(self, widths: list):
+        i = 0
+        while i < len(widths) - 1:
+            el = int(widths[i])
+            n_el = widths[i + 1]
+            if isinstance(n_el, list):
+                if n_el:
+                    values = [float(w) for w in n_el]
+                    self.add_interval(el, el + len(values) - 1, values)
+                i = i + 2
+            elif i + 2 < len(widths):
+                n_el = int(n_el)
+                n2_el = widths[i + 2]
+                if isinstance(n2_el, list):
+                    if len(n2_el) == 1:
+                        n2_el = n2_el[0]
+                    else:
+                        raise Exception
+                if n_el >= el:
+                    self.add_interval(el, n_el, float(n2_el))
+                i = i + 3
+            else:
+                break
+
+    def add_interval(self, start: int, end: int, value):
+        """insert [start, end]; like the old per-cid dict, the new entry
+        wins where it overlaps the ones already stored"""
+        i = bisect_right(self.ends, start - 1)  # first interval ending >= start
+        j = i
+        replacement = []
+        while j < len(self.starts) and self.starts[j] <= end:
+            s, e, v = self.starts[j], self.ends[j], self.values[j]
+            if s < start:
+                left = v[: start - s] if isinstance(v, list) else v
+                replacement.append((s, start - 1, left))
+            if e > end:
+                right = v[end + 1 - s :] if isinstance(v, list) else v
+                replacement.append((end + 1, e, right))
+            j += 1
+        replacement.append((start, end, value))
+        replacement.sort(key=lambda iv: iv[0])
+        self.starts[i:j] = [iv[0] for iv in replacement]
+        self.ends[i:j] = [iv[1] for iv in replacement]
+        self.values[i:j] = [iv[2] for iv in replacement]
+        self.hot.clear()
+
+    # ****************** lookup ************************
+
+    def get(self, cid: int, default=None):
+        width = self.hot.get(cid)
+        if width is not None:
+            return width
+        i = bisect_right(self.starts, cid) - 1
+        if i < 0 or cid > self.ends[i]:
+            return default
+        value = self.values[i]
+        width = value[cid - self.starts[i]] if isinstance(value, list) else value
+        if len(self.hot) >= self.HOT_CACHE_SIZE:
+            self.hot.clear()
+        self.hot[cid] = width
+        return width
+
+    def __getitem__(self, cid: int):
+        width = self.get(cid)
+        if width is None:
+            raise KeyError(cid)
+        return width
+
+    def __contains__(self, cid: int):
+        return self.get(cid) is not None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __eq__(self, other):
+        return isinstance(other, CidWidths) and (
+            self.starts,
+            self.ends,
+            self.values,
+        ) == (other.starts, other.ends, other.values)
+
+    def __getstate__(self):
+        return (self.starts, self.ends, self.values)
+
+    def __setstate__(self, state):
+        self.starts, self.ends, self.values = state
+        self.hot = {}
+
+    def __repr__(self):
+        return f"CidWidths({len(self.starts)} intervals)"
@@ -30,6 +30,77 @@ class PycairoContext(ct.Structure):
     ]
 
 
+def _initialize():
+    global _initialized
+    global _ft_lib
+    global _ft_destroy_key
+    global _surface
+
+    FT_Err_Ok = 0
+    if _initialized:
+        return
+
+    _cairo_so.cairo_ft_font_face_create_for_ft_face.restype = ct.c_void_p
+    _cairo_so.cairo_ft_font_face_create_for_ft_face.argtypes = [
+        ct.c_void_p,
+        ct.c_int,
+    ]
+    _cairo_so.cairo_font_face_get_user_data.restype = ct.c_void_p
+    _cairo_so.cairo_font_face_get_user_data.argtypes = (
+        ct.c_void_p,
+        ct.c_void_p,
+    )
+    _cairo_so.cairo_font_face_set_user_data.argtypes = (
+        ct.c_void_p,
+        ct.c_void_p,
+        ct.c_void_p,
+        ct.c_void_p,
+    )
+    _cairo_so.cairo_set_font_face.argtypes = [ct.c_void_p, ct.c_void_p]
+    _cairo_so.cairo_font_face_status.argtypes = [ct.c_void_p]
+    _cairo_so.cairo_font_face_destroy.argtypes = (ct.c_void_p,)
+    _cairo_so.cairo_status.argtypes = [ct.c_void_p]
+
+    _cairo_so.cairo_ft_scaled_font_lock_face.restype = ct.c_void_p
+    _cairo_so.cairo_ft_scaled_font_lock_face.argtypes = [ct.c_void_p]
+    _cairo_so.cairo_ft_scaled_font_unlock_face.argtypes = [ct.c_void_p]
+
+    _freetype_so.FT_New_Memory_Face.argtypes = [
+        ct.c_void_p,
+        ct.c_void_p,
+        ct.c_long,
+        ct.c_long,
+        ct.POINTER(ct.c_void_p),
+    ]
+    _freetype_so.FT_Done_Face.argtypes = [ct.c_void_p]
+    # initialize freetype
+    _ft_lib = ct.c_void_p()
+    status = _freetype_so.FT_Init_FreeType(ct.byref(_ft_lib))
+    if status != FT_Err_Ok:
+        raise RuntimeError("Error %d initializing FreeType library." % status)
+
+    _surface = cairo.ImageSurface(cairo.FORMAT_A8, 0, 0)
+    _ft_destroy_key = ct.c_int()  # dummy address
+    _initialized = True
+
+
+# ****************** in-memory faces ************************
+# FT_New_Memory_Face does not copy the font program, the buffer has to
+# live as long as the FT_Face. cairo owns the FT_Face (and may keep it in
+# its font cache after the python objects are gone), so the buffer is
+# kept here and only released by the destroy callback cairo calls.
+
+_memory_buffers: dict[int, ct.Array] = {}
+
+
+@ct.CFUNCTYPE(None, ct.c_void_p)
+def _done_memory_face(ft_face):
+    _freetype_so.FT_Done_Face(ft_face)
+    if isinstance(ft_face, ct.c_void_p):
+        ft_face = ft_face.value
+    _memory_buffers.pop(ft_face, None)
+
+
 def create_cairo_font_face_for_file(
     filename,
     faceindex=0,
@@ -38,67 +109,57 @@ def create_cairo_font_face_for_file(
     # encoding=ADBC
 ):
     "given the name of a font file, and optional faceindex to pass to FT_New_Face" " and loadoptions to pass to cairo_ft_font_face_create_for_ft_face, creates" " a cairo.FontFace object that may be used to render text with that font."
-    global _initialized
-    global _freetype_so
-    global _cairo_so
-    global _ft_lib
-    global _ft_destroy_key
-    global _surface
-
-    CAIRO_STATUS_SUCCESS = 0
+    _initialize()
     FT_Err_Ok = 0
-    cairo_ctx = None
-    if not _initialized:
-
-        _cairo_so.cairo_ft_font_face_create_for_ft_face.restype = ct.c_void_p
-        _cairo_so.cairo_ft_font_face_create_for_ft_face.argtypes = [
-            ct.c_void_p,
-            ct.c_int,
-        ]
-        _cairo_so.cairo_font_face_get_user_data.restype = ct.c_void_p
-        _cairo_so.cairo_font_face_get_user_data.argtypes = (
-            ct.c_void_p,
-            ct.c_void_p,
-        )
-        _cairo_so.cairo_font_face_set_user_data.argtypes = (
-            ct.c_void_p,
-            ct.c_void_p,
-            ct.c_void_p,
-            ct.c_void_p,
+    ft_face = ct.c_void_p()
+    status = _freetype_so.FT_New_Face(
+        _ft_lib, filename.encode("utf-8"), faceindex, ct.byref(ft_face)
+    )
+    if status != FT_Err_Ok:
+        print(f"Error while Trying to lead font: {filename}")
+        raise Exception(
+            "Error %d creating FreeType font face for %s" % (status, filename)
         )
-        _cairo_so.cairo_set_font_face.argtypes = [ct.c_void_p, ct.c_void_p]
-        _cairo_so.cairo_font_face_status.argtypes = [ct.c_void_p]
-        _cairo_so.cairo_font_face_destroy.argtypes = (ct.c_void_p,)
-        _cairo_so.cairo_status.argtypes = [ct.c_void_p]
-
-        _cairo_so.cairo_ft_scaled_font_lock_face.restype = ct.c_void_p
-        _cairo_so.cairo_ft_scaled_font_lock_face.argtypes = [ct.c_void_p]
-        _cairo_so.cairo_ft_scaled_font_unlock_face.argtypes = [ct.c_void_p]
-        # initialize freetype
-        _ft_lib = ct.c_void_p()
-        status = _freetype_so.FT_Init_FreeType(ct.byref(_ft_lib))
-        if status != FT_Err_Ok:
-            raise RuntimeError(
-                "Error %d initializing FreeType library." % status
-            )
+    return _create_cairo_font_face(
+        ft_face, filename, loadoptions, encoding, _freetype_so.FT_Done_Face
+    )
 
-        _surface = cairo.ImageSurface(cairo.FORMAT_A8, 0, 0)
-        _ft_destroy_key = ct.c_int()  # dummy address
-        _initialized = True
 
+def create_cairo_font_face_for_memory(
+    font_data: bytes,
+    faceindex=0,
+    loadoptions=0,
+    encoding=None,
+    name="<memory>",
+):
+    "same as create_cairo_font_face_for_file, but for a font program held in" " memory (FT_New_Memory_Face), no file is written or read."
+    _initialize()
+    FT_Err_Ok = 0
+    buffer = ct.create_string_buffer(font_data, len(font_data))
     ft_face = ct.c_void_p()
-    cr_face = None
-    try:
-        status = _freetype_so.FT_New_Face(
-            _ft_lib, filename.encode("utf-8"), faceindex, ct.byref(ft_face)
+    status = _freetype_so.FT_New_Memory_Face(
+        _ft_lib, buffer, len(font_data), faceindex, ct.byref(ft_face)
+    )
+    if status != FT_Err_Ok:
+        print(f"Error while Trying to lead font: {name}")
+        raise Exception(
+            "Error %d creating FreeType font face for %s" % (status, name)
         )
+    _memory_buffers[ft_face.value] = buffer
+    return _create_cairo_font_face(
+        ft_face, name, loadoptions, encoding, _done_memory_face
+    )
 
-        if status != FT_Err_Ok:
-            raise RuntimeError(
-                "Error %d creating FreeType font face for %s"
-                % (status, filename)
-            )
 
+def _create_cairo_font_face(ft_face, filename, loadoptions, encoding, done_face):
+    """wrap an already created FT_Face into a cairo.FontFace, cairo takes
+    over the FT_Face and calls `done_face` when it destroys the font face"""
+
+    CAIRO_STATUS_SUCCESS = 0
+    FT_Err_Ok = 0
+    cairo_ctx = None
+    cr_face = None
+    try:
         if encoding != None:
             status = _freetype_so.FT_Select_Charmap(ft_face, encoding)
             if status != FT_Err_Ok:
@@ -115,7 +176,6 @@ def create_cairo_font_face_for_file(
                 "Error %d creating cairo font face for %s" % (status, filename)
             )
 
-        # ++++++++++++++ unnecessary ++++++++++++++++++++++++++++++
         if (
             _cairo_so.cairo_font_face_get_user_data(
                 cr_face, ct.byref(_ft_destroy_key)
@@ -126,7 +186,7 @@ def create_cairo_font_face_for_file(
                 cr_face,
                 ct.byref(_ft_destroy_key),
                 ft_face,
-                _freetype_so.FT_Done_Face,
+                done_face,
             )
             if status != CAIRO_STATUS_SUCCESS:
                 raise RuntimeError(
@@ -149,7 +209,8 @@ def create_cairo_font_face_for_file(
         raise Exception(e)
     finally:
         _cairo_so.cairo_font_face_destroy(cr_face)
-        _freetype_so.FT_Done_Face(ft_face)
+        if ft_face is not None:
+            done_face(ft_face)
 
     if cairo_ctx is None:
         return None
@@ -6,7 +6,7 @@ import cairo
 import string
 
 from PIL import Image
-from pypdf.generic import DictionaryObject
+from pypdf.generic import DictionaryObject, IndirectObject
 
 from engine.pdf_utils import kill_with_taskkill, open_image_in_irfan
 from .pdf_operator import PdfOperator
@@ -22,6 +22,15 @@ from pypdf.filters import (
 )
 from cairo import Matrix
 from .pdf_encoding import PdfEncoding as pnc
+from .pdf_image import (
+    decode_jpeg,
+    image_to_bgra,
+    reduce_bgra,
+    reduction_factor,
+    resolve_color_space,
+)
+from .surface_cache import SurfaceCache
+from math import hypot
 import copy
 
 
@@ -56,6 +65,78 @@ class EngineState:
         FALLBACK_CS: [0, 0, 0],
     }
 
+    # ****************** operator table ************************
+    # operator -> (method name, *extra args), the methods are bound once at
+    # class level by `BaseRenderer.compile_dispatch`, never per instance.
+    OPERATOR_HANDLERS = {
+        # generall
+        "q": ("save_state",),
+        "Q": ("restore_state",),
+        "BT": ("begin_text",),
+        "ET": ("end_text",),
+        "gs": ("set_graphics_state",),
+        "Tr": ("set_text_rendering_mode",),
+        "Do": ("handle_Do",),
+        ## Positioning
+        "cm": ("set_ctm",),
+        "Tm": ("set_text_matrix",),
+        "Td": ("set_text_position",),
+        "TD": ("set_text_position_and_leading",),
+        "T*": ("move_with_leading",),
+        "TJ": ("clear_text_position_after_tj",),
+        "Tj": ("updata_missing_font_count",),
+        "'": ("move_with_leading",),
+        '"': ("move_with_leading_and_spacing",),
+        # font and text
+        "Tc": ("set_character_spacing",),
+        "Tw": ("set_word_spacing",),
+        "Tz": ("set_horizontal_scaling",),
+        "TL": ("set_leading",),
+        "Tf": ("set_font",),
+        "Ts": ("set_text_rize",),
+        # graphics state operators
+        "w": ("set_line_width",),
+        "d": ("set_dash_pattern",),
+        "J": ("set_line_cap",),
+        "j": ("set_line_join",),
+        "M": ("set_meter_limit",),
+        # -------------------
+        # inline image operators
+        "BI": ("begin_inline_image",),
+        "/W": ("set_inline_image_width",),
+        "/H": ("set_inline_image_height",),
+        "/BPC": ("set_inline_image_bits_per_component",),
+        "/CS": ("set_color_space", False, True),
+        "/F": ("set_inline_image_filter",),
+        "/IM": ("set_inline_image_mask",),
+        "/DP": ("set_inline_image_decode_params",),
+        "/D": ("ignore_operator",),
+        "/I": ("ignore_operator",),
+        "ID": ("decode_inline_image",),
+        "EI": ("end_inline_image",),
+        # -------------------
+        # Color Operators
+        "cs": ("set_color_space", True),
+        "CS": ("set_color_space", False),
+        "k": ("set_color", True, "/DeviceCMYK"),
+        "K": ("set_color", False, "/DeviceCMYK"),
+        "g": ("set_color", True, "/DeviceGray"),
+        "G": ("set_color", False, "/DeviceGray"),
+        "rg": ("set_color", True, "/DeviceRGB"),
+        "RG": ("set_color", False, "/DeviceRGB"),
+        "sc": ("set_color", True, None),
+        "SC": ("set_color", False, None),
+        "scn": ("set_color", True, None),
+        "SCN": ("set_color", False, None),
+        # ---- ---------
+        # Unkown Operatorso
+        "BX": ("ignore_operator",),
+        "EX": ("ignore_operator",),
+        "sh": ("handle_sh_operator",),
+        "d0": ("ignore_operator",),
+        "d1": ("ignore_operator",),
+    }
+
     def __init__(
         self,
         font_map: dict[str, PdfFont],
@@ -137,6 +218,14 @@ class EngineState:
         self.inline_image_filter = []
         self.inline_image_color_space = None
         self.inline_image_data: bytes = b""
+        # set by decoders that already produce cairo ready BGRA pixels
+        self.inline_image_bgra = None
+        # per document cache of decoded image xobjects (set by the engine)
+        self.image_cache: SurfaceCache | None = None
+        # detection only runs do not need image pixels at all
+        self.skip_images = False
+        # (y0, y1) device rows being rendered, images outside are skipped
+        self.band: tuple[float, float] | None = None
 
         # ************** EXTstate variables ********************
         self._stroke_alpha = 1
@@ -162,86 +251,12 @@ class EngineState:
         if initial_state:
             self.restore_state(None, initial_state)
 
-        self.functions_map = {
-            # generall
-            "q": self.save_state,
-            "Q": self.restore_state,
-            "BT": self.begin_text,
-            "ET": self.end_text,
-            "gs": self.set_graphics_state,
-            "Tr": self.set_text_rendering_mode,
-            "Do": self.handle_Do,
-            ## Positioning
-            "cm": self.set_ctm,
-            "Tm": self.set_text_matrix,
-            "Td": self.set_text_position,
-            "TD": self.set_text_position_and_leading,
-            "T*": self.move_with_leading,
-            "TJ": self.clear_text_position_after_tj,
-            "Tj": self.updata_missing_font_count,
-            "'": self.move_with_leading,
-            '"': self.move_with_leading_and_spacing,
-            # font and text
-            "Tc": self.set_character_spacing,
-            "Tw": self.set_word_spacing,
-            "Tz": self.set_horizontal_scaling,
-            "TL": self.set_leading,
-            "Tf": self.set_font,
-            "Ts": self.set_text_rize,
-            # graphics state operators
-            "w": self.set_line_width,
-            "d": self.set_dash_pattern,
-            "J": self.set_line_cap,
-            "j": self.set_line_join,
-            "M": self.set_meter_limit,
-            # -------------------
-            # inline image operators
-            "BI": self.begin_inline_image,
-            "/W": self.set_inline_image_width,
-            "/H": self.set_inline_image_height,
-            "/BPC": self.set_inline_image_bits_per_component,
-            "/CS": lambda x: self.set_color_space(x, False, True),
-            "/F": self.set_inline_image_filter,
-            # "/F": self.set_inline_image_dcode_filter,
-            "/IM": self.set_inline_image_mask,
-            "/DP": self.set_inline_image_decode_params,
-            "/D": lambda x: ("", True),
-            "ID": self.decode_inline_image,
-            "EI": self.end_inline_image,  # lambda _: (None, True),
-            # -------------------
-            # Color Operators
-            "cs": lambda x: self.set_color_space(x, True),
-            "CS": lambda x: self.set_color_space(x, False),
-            "k": lambda x: self.set_color(x, True, "/DeviceCMYK"),
-            "K": lambda x: self.set_color(x, False, "/DeviceCMYK"),
-            "g": lambda x: self.set_color(x, True, "/DeviceGray"),
-            "G": lambda x: self.set_color(x, False, "/DeviceGray"),
-            "rg": lambda x: self.set_color(x, True, "/DeviceRGB"),
-            "RG": lambda x: self.set_color(x, False, "/DeviceRGB"),
-            "sc": lambda x: self.set_color(x, True, None),
-            "SC": lambda x: self.set_color(x, False, None),
-            "scn": lambda x: self.set_color(x, True, None),
-            "SCN": lambda x: self.set_color(x, False, None),
-            # ---- ---------
-            # Unkown Operatorso
-            "BX": lambda x: ("", True),
-            "EX": lambda x: ("", True),
-            "sh": self.handle_sh_operator,
-            "d0": lambda x: ("", True),
-            "d1": lambda x: ("", True),
-            # ---- ---------
-            # Path  Construction
-            # cairo only
-            # "m" : self.move_position,
-            # "l" : self.draw_line_to
-            # "S" : self.stroke_path,
-            # "h": self.close_path,
-            # "c": self.curve_to,
-        }
-
     def handle_sh_operator(self, command: PdfOperator):
         return "", True
 
+    def ignore_operator(self, _: PdfOperator):
+        return "", True
+
     def set_color_space(
         self, command: PdfOperator, is_fill: bool, is_image: bool = False
     ):
@@ -362,8 +377,17 @@ class EngineState:
         subtype = xobj.get("/Subtype")
 
         if subtype == "/Image":
-            return "", True
-            self._draw_image_xobject(xobj)
+            if self.skip_images:
+                # nothing is decoded, the renderer still gets to see where
+                # the image would go (see `SymbolRenderer`)
+                self.draw_image(None)
+                return "", True
+            ref = xobj
+            if hasattr(xobjs, "raw_get"):
+                ref = xobjs.raw_get(xobj_name)
+            if not isinstance(ref, IndirectObject):
+                ref = getattr(xobj, "indirect_reference", None)
+            self._draw_image_xobject(xobj, ref)
         elif subtype == "/Form":
             # if xobj_name == self.stream_name:
             # print("not skipping (== handling ) recursive xobject stream !")
@@ -456,10 +480,7 @@ class EngineState:
 
         # Process form content stream
         # filters = xobj.get("/Filter", [])
-        data = xobj.get_data()
-        stream = (
-            pnc.bytes_to_string(data).encode("latin1").decode("unicode_escape")
-        )
+        stream = xobj.get_data()
         self.execute_xobject_stream(
             stream, initial_state, merged_resources, new_depth, xobj_name
         )
@@ -467,55 +488,55 @@ class EngineState:
         self.ctx.restore()
         # self.restore_state(None)
 
-    def _draw_image_xobject(self, xobj):
-
-        # self.ctx.save()
-        # self.save_state(None)
+    def _draw_image_xobject(self, xobj, ref=None):
 
         self.inline_image_width = int(xobj["/Width"])
         self.inline_image_height = int(xobj["/Height"])
         self.inline_image_color_space = xobj.get("/ColorSpace", "/DeviceRGB")
-        original_bits_per_component = int(xobj.get("/BitsPerComponent", 8))
         self.inline_image_decoder_param = xobj.get("/DecodeParms", {})
-        self.inline_image_bits_per_component = original_bits_per_component
-        self.inline_image_mask = False
+        self.inline_image_bits_per_component = int(
+            xobj.get("/BitsPerComponent", 8)
+        )
+        self.inline_image_mask = bool(xobj.get("/ImageMask", False))
+        if self.inline_image_mask:
+            self.inline_image_bits_per_component = 1
 
         self.inline_image_filter = xobj.get("/Filter", [])
         if not isinstance(self.inline_image_filter, list):
             self.inline_image_filter = [self.inline_image_filter]
-        data = xobj.get_data()
-        self.decode_inline_image(None, data)
-
-        if not self.inline_image_data:
+        self.inline_image_bgra = None
+        if self.is_image_outside_band():
             return
 
-        if self.inline_image_bits_per_component % 8 == 0:
-            soll_pixel_count = (
-                self.inline_image_height * self.inline_image_width
-            )
-            bytes_per_component = self.inline_image_bits_per_component // 8
-            ist_pixel_count = (
-                len(self.inline_image_data) // bytes_per_component
-            )
-
-            # print(f"soll-ist : {soll_pixel_count} vs {ist_pixel_count}")
-            if soll_pixel_count != ist_pixel_count:
-                raise Exception("This image is not OK")
-            cs = self.inline_image_color_space
-            if cs == "/DeviceRGB" and bytes_per_component != 3:
-                raise Exception("image values for RGB are not devidable by 3")
-                pass
-            elif cs == "/DeviceCMYK":
-                raise Exception("image values for CMYK are not devidable by 4")
-                pass
-        elif self.inline_image_bits_per_component != 1:
-            raise Exception(
-                "sub-deviding a single byte require using shifts '<<'\nwhich is currently not implemented"
+        # decoded pixels are shared by every `Do` of the same xobject at a
+        # similar device size; stencil masks depend on the fill color
+        key = None
+        if ref is not None and self.image_cache is not None:
+            factor = reduction_factor(
+                self.inline_image_width,
+                self.inline_image_height,
+                self.get_image_device_size(),
             )
+            key = (ref.idnum, ref.generation, factor)
+            if self.inline_image_mask:
+                key += tuple(self.fill_color)
+            pixels = self.image_cache.get(key)
+            if pixels is not None:
+                self.inline_image_bgra = pixels
+                self.draw_image(None)
+                return
+
+        self.decode_inline_image(None, xobj.get_data())
+        if not self.inline_image_data:
+            return
 
+        pixels = self.decode_image_pixels()
+        if pixels is None:
+            return
+        if key is not None:
+            self.image_cache.put(key, pixels)
+        self.inline_image_bgra = pixels
         self.draw_image(None)
-        # self.ctx.restore()
-        return
 
     def begin_text(self, _: PdfOperator):
 
@@ -586,15 +607,11 @@ class EngineState:
         # self.inline_image_color_space = "/DeviceRGB"
         return decoeded
 
+    @staticmethod
     def cmyk_to_bgrx(cmyk_data, width, height):
         """Convert CMYK to Cairo's BGRx format"""
         img = Image.frombytes("CMYK", (width, height), cmyk_data)
-        img = img.convert("RGB")
-        bgrx = bytearray()
-        for r, g, b in img.getdata():
-            bgrx.extend([b, g, r, 0])  # BGRx format
-
-        return bytes(bgrx)
+        return img.convert("RGB").tobytes("raw", "BGRX")
 
     def test_play_image(self, img):
         img_path = f"output{sep}temp-image.png"
@@ -603,25 +620,65 @@ class EngineState:
         input("waiting")
         kill_with_taskkill()
 
+    def get_image_device_size(self):
+        """size in device pixels the current image will cover: images
+        are drawn into the unit square of the current CTM"""
+        m = self.get_current_matrix()
+        return hypot(m.xx, m.yx), hypot(m.xy, m.yy)
+
+    def get_image_device_y_range(self):
+        """(y_min, y_max) of the unit square of the CTM, in device rows"""
+        m = self.get_current_matrix()
+        ys = [
+            m.transform_point(x, y)[1]
+            for x, y in ((0, 0), (1, 0), (0, 1), (1, 1))
+        ]
+        return min(ys), max(ys)
+
+    def is_image_outside_band(self):
+        """True if the unit square of the CTM misses the rendered band"""
+        if self.band is None:
+            return False
+        y_min, y_max = self.get_image_device_y_range()
+        return y_max < self.band[0] or y_min > self.band[1]
+
+    def decode_image_pixels(self):
+        """BGRA pixels of the current (inline or xobject) image, reduced
+        to the resolution it is drawn at; None if it cannot be drawn"""
+        pixels = self.inline_image_bgra
+        if pixels is None and not self.inline_image_data:
+            return None  # skipped, see `decode_inline_image`
+        if pixels is None:
+            color_space, palette = resolve_color_space(
+                self.inline_image_color_space
+            )
+            bpc = self.inline_image_bits_per_component
+            if bpc > 1 and color_space not in self.DEVICE_CS:
+                print("trying to draw image with non-spported color-spcae")
+                return None
+            pixels = image_to_bgra(
+                self.inline_image_data,
+                self.inline_image_width,
+                self.inline_image_height,
+                bpc,
+                color_space,
+                self.fill_color,
+                self.inline_image_mask,
+                palette,
+            )
+        height, width = pixels.shape[:2]
+        factor = reduction_factor(width, height, self.get_image_device_size())
+        return reduce_bgra(pixels, factor)
+
     def decode_dct(self, data: bytes):
-        img = Image.open(io.BytesIO(data))
-        # if img.has_transparency_data:
-        #     input("the image has transparency data")
-        img = img.convert("RGB")
-        width, height = img.size
-        bgrx_data = bytearray()
-        # rgb_data = bytearray()
-        for r, g, b in img.getdata():
-            bgrx_data.extend([b, g, r])  # 0 = unused alpha
-            # max_byte = max(r, g, b)
-            # f = 255 // max_byte
-            # rgb_data.extend([r * f, g * f, b * f])
-        # img2 = Image.frombytes("RGB", size=img.size, data=rgb_data)
-        # self.test_play_image(img2)
+        # decoded straight to BGRA, at a reduced scale when the image is
+        # drawn smaller than its stored size (see `decode_jpeg`)
+        pixels = decode_jpeg(data, self.get_image_device_size())
+        self.inline_image_bgra = pixels
         self.inline_image_bits_per_component = 24
         self.inline_image_color_space = "/DeviceRGB"
 
-        return bytes(bgrx_data)
+        return memoryview(pixels).cast("B")
 
     def decode_ascii85(self, data: bytes):
         return ASCII85Decode.decode(data)
@@ -651,6 +708,12 @@ class EngineState:
     def decode_inline_image(self, operator: PdfOperator, data=None):
         if operator and len(operator.args) == 0:
             raise ValueError("No image data found in inline image")
+        if self.skip_images or (
+            operator is not None and self.is_image_outside_band()
+        ):
+            self.inline_image_data = b""
+            self.inline_image_bgra = None
+            return "", True
         if not data:
             data = operator.args[0]
         if isinstance(data, str):
@@ -679,6 +742,7 @@ class EngineState:
         self.inline_image_bits_per_component = 0
         self.inline_image_color_space = None
         self.inline_image_mask = False
+        self.inline_image_bgra = None
         return "", True
 
     def end_inline_image(self, cmd: PdfOperator):
@@ -728,7 +792,7 @@ class EngineState:
             "word_spacing": copy.copy(self.word_spacing),
             "horizontal_scaling": copy.copy(self.horizontal_scaling),
             "leading": copy.copy(self.leading),
-            "font_name": copy.copy(self.font.font_name) if self.font else None,
+            "font": self.font,  # fonts are shared, never copied
             "font_size": copy.copy(self.font_size),
             "text_rize": copy.copy(self.text_rize),
             "line_width": copy.copy(self.line_width),
@@ -772,15 +836,6 @@ class EngineState:
         for key, value in state.items():
             if key == "cm_matrix" or key == "tm_matrix":
                 setattr(self, key, Matrix(*value))
-            elif key == "font_name":
-                if value:
-                    self.font = self.font_map[value]  # if value else
-                else:
-                    self.font = None
-                    # raise Exception(
-                    #     f"font ({value}) can not be found on depth {self.depth}"
-                    # )
-
             else:
                 setattr(self, key, value)
 
@@ -862,7 +917,7 @@ class EngineState:
         # args[0] = args[0] or 1
         # args[3] = args[3] or 1
 
-        args = command.args
+        args = list(command.args)
 
         if args[0] == 0.0:  # and args[1] == 0:
             args[0] = 0.000000001  # self.scale  #
@@ -1005,17 +1060,6 @@ class EngineState:
     def convert_em_to_ts(self, em: float):
         return em / 1000 * self.font_size
 
-    def execute_command(self, command: PdfOperator):
-        func = self.functions_map.get(command.name)
-        if func:
-            args_scaled, ok = func(command)
-            if args_scaled:
-                return f"current position = {args_scaled}", True
-            return "", True
-        else:
-            return "", False
-        return "", False
-
     def set_graphics_state(self, cmd: PdfOperator):
         gstate_name = cmd.args[0]
         if gstate_name not in self.exgstate:
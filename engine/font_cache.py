@@ -0,0 +1,183 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+from os.path import sep
+
+
+class FontCache:
+    """persistent, content addressed cache for the tables `PdfFont` builds.
+
+    the key is a hash of the embedded font program plus the objects the
+    tables are derived from (ToUnicode, Encoding, widths), so the same font
+    subset embedded in different documents maps to the same entry. entries
+    are pickled dicts written atomically (temp file + rename); the cache is
+    a pure optimization, every OSError/unpickling error is a miss.
+    """
+
+    # bump when the layout or the meaning of the cached tables changes
+    VERSION = b"font-tables-2"
+    SUFFIX = ".pkl"
+    # tables kept loaded in `memory`, the least recently used go first
+    MAX_IN_MEMORY = 256
+
+    def __init__(
+        self,
+        cache_dir: str | None = None,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_age: float = 30 * 24 * 3600,
+        evict_every: int = 64,
+    ):
+        if cache_dir is None:
+            cache_dir = os.environ.get("FONT_CACHE_DIR") or (
+                f"temp{sep}font-cache"
+            )
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_every = evict_every
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        self.evicted = 0
+        # entries already loaded by this process, see `remember`
+        self.memory: dict[str, dict] = {}
+
+        self.enabled = True
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        except OSError:
+            self.enabled = False
+
+    # ****************** key ************************
+
+    @classmethod
+    def make_key(cls, *parts: bytes | str | None) -> str:
+        digest = hashlib.sha1(cls.VERSION)
+        for part in parts:
+            if part is None:
+                part = b"\x00none"
+            elif isinstance(part, str):
+                part = part.encode("utf-8")
+            # length prefix, so (b"ab", b"c") != (b"a", b"bc")
+            digest.update(len(part).to_bytes(8, "little"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _path(self, key: str):
+        return self.cache_dir + sep + key + self.SUFFIX
+
+    # ****************** get / put ************************
+
+    def get(self, key: str) -> dict | None:
+        tables = self.memory.pop(key, None)
+        if tables is not None:
+            self.memory[key] = tables  # most recently used last
+            self.hits += 1
+            return tables
+        if not self.enabled:
+            self.misses += 1
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                tables = pickle.load(f)
+            os.utime(path)  # age is counted from the last use
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:
+            self.errors += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.remember(key, tables)
+        return tables
+
+    def put(self, key: str, tables: dict):
+        self.remember(key, tables)
+        if not self.enabled:
+            return
+        fd, tmp_path = None, None
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=self.cache_dir, suffix=".tmp"
+            )
+            with os.fdopen(fd, "wb") as f:
+                fd = None
+                pickle.dump(tables, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+            tmp_path = None
+            self.writes += 1
+        except OSError:
+            self.errors += 1
+        finally:
+            if fd is not None:
+                os.close(fd)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        if self.evict_every and self.writes % self.evict_every == 0:
+            self.evict()
+
+    def remember(self, key: str, tables: dict):
+        self.memory.pop(key, None)
+        while len(self.memory) >= self.MAX_IN_MEMORY:
+            del self.memory[next(iter(self.memory))]
+        self.memory[key] = tables
+
+    # ****************** eviction ************************
+
+    def evict(self):
+        """drop entries unused for `max_age` seconds, then the least
+        recently used ones until the cache fits into `max_bytes`"""
+        if not self.enabled:
+            return 0
+        now = time.time()
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(self.SUFFIX):
+                        continue
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError:
+            self.errors += 1
+            return 0
+
+        removed = 0
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in sorted(entries):
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self.evicted += removed
+        return removed
+
+    def clear(self):
+        self.memory.clear()
+        if not self.enabled:
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(self.SUFFIX):
+                try:
+                    os.remove(self.cache_dir + sep + name)
+                except OSError:
+                    pass
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "errors": self.errors,
+            "evicted": self.evicted,
+        }
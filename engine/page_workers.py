@@ -0,0 +1,79 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from detectors.core_detectors import SequenceRecorder
+from .pdf_renderer import SymbolRenderer, get_renderer_backend
+
+# ********************************************************************
+# ************* parallel page execution ******************************
+# every worker process opens the document once (`init_worker`) and then
+# executes single pages with its own PdfEngine. the question detector of
+# that engine is replaced by a `SequenceRecorder`: workers only send back
+# the symbol sequences and drawn extents (plus the page segments, when
+# pages are rasterized), the main process replays them into the real
+# detector in page order, so the detection result does not depend on the
+# scheduling.
+
+# the engine of the current worker process
+worker_engine = None
+
+
+def init_worker(
+    pdf_path: tuple[str, str],
+    scaling,
+    clean: int,
+    segment_storage: str,
+    color_mode: str,
+):
+    global worker_engine
+    from .pdf_engine import PdfEngine
+
+    engine = PdfEngine(scaling, clean, segment_storage, color_mode)
+    engine.set_debug(0)
+    engine.initialize_file(pdf_path)
+    # as set by `extract_questions_from_pdf` in the main process
+    engine.detection_types = engine.D_DETECT_QUESTION
+    recorder = SequenceRecorder(engine.D_DETECT_QUESTION)
+    engine.question_detector = recorder
+    engine.ALL_DETECTORS = [recorder]
+    worker_engine = engine
+
+
+def process_page(page_number: int, backend: str):
+    """returns (page record, SurfaceGapsSegments or None, drawn extents);
+    the "null" backend only collects the symbols and extents"""
+    engine = worker_engine
+    segments = None
+    if get_renderer_backend(backend) is SymbolRenderer:
+        engine.detect_pdf_page(page_number)
+    else:
+        surface = engine.render_pdf_page(
+            page_number, debug=None, clean=None, backend=backend, cache=False
+        )
+        segments = engine.create_page_segments(surface)
+    return (
+        engine.question_detector.get_page_record(),
+        segments,
+        engine.renderer.drawn_extents,
+    )
+
+
+def execute_pages_in_workers(
+    pdf_path: tuple[str, str],
+    scaling,
+    clean: int,
+    segment_storage: str,
+    color_mode: str,
+    page_numbers: list[int],
+    backend: str,
+    workers: int,
+):
+    """yields the results of `process_page`, in the order of
+    `page_numbers`"""
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(pdf_path, scaling, clean, segment_storage, color_mode),
+    ) as pool:
+        yield from pool.map(
+            process_page, page_numbers, [backend] * len(page_numbers)
+        )
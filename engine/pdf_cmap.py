@@ -0,0 +1,116 @@
+import hashlib
+import re
+
+
+class ToUnicodeCMap:
+    """parser for ToUnicode CMap streams.
+
+    works on the raw stream bytes: the `begin.../end...` sections are
+    located with one regex, the `<hex>` / `[` / `]` tokens inside them with
+    another, so no per character python loop is involved. parsed maps are
+    kept per stream digest, the same ToUnicode streams are embedded again
+    and again across documents.
+    """
+
+    SECTION_REGEX = re.compile(
+        rb"begin(codespacerange|bfchar|bfrange)(.*?)end\1", re.S
+    )
+    TOKEN_REGEX = re.compile(rb"<([^<>]*)>|(\[)|(\])")
+    PAIR_REGEX = re.compile(rb"<([^<>]*)><([^<>]*)>")
+    COMMENT_REGEX = re.compile(rb"%[^\r\n]*")
+    HEX_SPACE_REGEX = re.compile(rb"[\x00\t\n\x0c\r ]+")
+
+    MAX_CACHED = 512
+    # digest -> (cid_to_unicode, codespace_ranges); shared by all fonts,
+    # the maps are never modified after parsing
+    cache: dict[bytes, tuple] = {}
+
+    @classmethod
+    def parse(cls, data: bytes) -> tuple[dict, list | None]:
+        """returns (cid_to_unicode, codespace_ranges or None)"""
+        digest = hashlib.sha1(data).digest()
+        result = cls.cache.get(digest)
+        if result is None:
+            result = cls.parse_uncached(data)
+            if len(cls.cache) >= cls.MAX_CACHED:
+                # drop the oldest entry
+                del cls.cache[next(iter(cls.cache))]
+            cls.cache[digest] = result
+        return result
+
+    @classmethod
+    def parse_uncached(cls, data: bytes) -> tuple[dict, list | None]:
+        if b"%" in data:
+            data = cls.COMMENT_REGEX.sub(b"", data)
+
+        cid_map = {}
+        codespace_ranges = []
+        for m in cls.SECTION_REGEX.finditer(data):
+            kind, body = m.groups()
+            # sections hold only <hex>, [ and ]: white space carries no
+            # meaning there, removing it once keeps the helpers simple
+            body = cls.HEX_SPACE_REGEX.sub(b"", body)
+            if kind == b"codespacerange":
+                for lo, hi in cls.PAIR_REGEX.findall(body):
+                    codespace_ranges.append(
+                        (cls._hex_int(lo), cls._hex_int(hi))
+                    )
+            elif kind == b"bfchar":
+                to_unicode = cls._hex_to_unicode
+                for src, dst in cls.PAIR_REGEX.findall(body):
+                    cid_map[int(src or b"0", 16)] = to_unicode(dst)
+            else:
+                cls._parse_bfrange(cls.TOKEN_REGEX.findall(body), cid_map)
+
+        return cid_map, codespace_ranges or None
+
+    @classmethod
+    def _parse_bfrange(cls, tokens: list, cid_map: dict):
+        to_unicode = cls._hex_to_unicode
+        i, n = 0, len(tokens)
+        while i + 2 < n:
+            src_lo, src_hi, dst = tokens[i], tokens[i + 1], tokens[i + 2]
+            if src_lo[1] or src_lo[2] or src_hi[1] or src_hi[2]:
+                i += 1  # malformed entry, resync on the next hex string
+                continue
+            lo, hi = cls._hex_int(src_lo[0]), cls._hex_int(src_hi[0])
+            i += 3
+            if dst[1]:
+                # <lo> <hi> [<dst1> <dst2> ...]
+                offset = 0
+                while i < n and not tokens[i][2]:
+                    if lo + offset <= hi and not tokens[i][1]:
+                        cid_map[lo + offset] = to_unicode(tokens[i][0])
+                    offset += 1
+                    i += 1
+                i += 1  # the closing ']'
+            elif not dst[2]:
+                # <lo> <hi> <dst>: the last code unit is incremented
+                units = to_unicode(dst[0])
+                if not units:
+                    continue
+                prefix, last = units[:-1], ord(units[-1])
+                # malformed / oversized ranges are clamped to the last
+                # code point instead of failing the whole font
+                count = min(hi - lo + 1, 0x110000 - last)
+                for offset in range(count):
+                    cid_map[lo + offset] = prefix + chr(last + offset)
+
+    # ****************** hex helpers ************************
+
+    @staticmethod
+    def _hex_int(value: bytes) -> int:
+        return int(value, 16) if value else 0
+
+    @staticmethod
+    def _hex_to_unicode(value: bytes) -> str:
+        if len(value) == 4:
+            return chr(int(value, 16))
+        if not value:
+            return ""
+        if len(value) % 4:
+            # not utf-16, a single (short) code
+            return chr(int(value, 16))
+        return bytes.fromhex(value.decode("ascii")).decode(
+            "utf-16-be", "surrogatepass"
+        )
@@ -80,8 +80,6 @@ class PdfEncoding:
     def bytes_to_string(cls, byte_text: bytes, unicode_excape=False):
         if not isinstance(byte_text, (bytes, bytearray)):
             raise Exception("the input bytes are not of correct type")
-        for b in byte_text:
-            cls.is_valid_byte(b)
         if unicode_excape:
             return byte_text.decode("unicode_escape")
         else:
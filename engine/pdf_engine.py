@@ -1,5 +1,7 @@
 import os
 import pprint
+from functools import partial
+from typing import Iterable
 from os.path import sep
 
 import cairo
@@ -9,22 +11,64 @@ from pypdf import PageObject, PdfReader
 from pypdf.generic import ArrayObject, EncodedStreamObject, IndirectObject
 
 from detectors import question_detectors
+from detectors.core_detectors import SequenceRecorder
 from detectors.question_detectors import (
     QuestionDetector,
     enable_detector_dubugging,
 )
 from engine.pdf_operator import PdfOperator
-from models.core_models import SurfaceGapsSegments, Symbol
+from models.core_models import (
+    GeometryGapsSegments,
+    SurfaceGapsSegments,
+    Symbol,
+)
 from models.question import Question
 
 from .engine_state import EngineState
+from .font_cache import FontCache
 from .pdf_encoding import PdfEncoding as pnc
 from .pdf_font import PdfFont
-from .pdf_renderer import BaseRenderer
+from .pdf_renderer import (
+    BaseRenderer,
+    RecordingRenderer,
+    SymbolRenderer,
+    get_renderer_backend,
+)
+from .page_workers import execute_pages_in_workers
 from .pdf_stream_parser import PDFStreamParser
+from .surface_cache import SurfaceCache, surface_nbytes
 from .pdf_utils import concat_cairo_surfaces, crop_image_surface
 
 
+class PageSegments(dict):
+    """page number -> SurfaceGapsSegments, rendered on first access with
+    the clean mode of the detection run that created it"""
+
+    def __init__(self, engine: "PdfEngine", clean: int):
+        super().__init__()
+        self.engine = engine
+        self.clean = clean
+
+    def __missing__(self, page_number: int):
+        segments = self.engine.render_page_segments(page_number, self.clean)
+        self[page_number] = segments
+        return segments
+
+
+class PageState:
+    """what executing a page leaves on the engine: the loaded page
+    (`PdfEngine.PAGE_ATTRS`), the renderer and its state. kept next to
+    cached page surfaces, it holds no pixels of its own (see
+    `surface_nbytes`)"""
+
+    __slots__ = ("attrs", "renderer", "state")
+
+    def __init__(self, attrs: dict, renderer, state):
+        self.attrs = attrs
+        self.renderer = renderer
+        self.state = state
+
+
 class PdfEngine:
     """
     class: PdfEngine Class v0.1
@@ -54,8 +98,38 @@ class PdfEngine:
     D_DETECT_IMAGES = 1 << 3
     D_DETECT_TABLES = 1 << 4
 
-    def __init__(self, scaling=1, clean: int = 0):
+    # upper bound for the rendered pages / questions kept in memory
+    RENDER_CACHE_BYTES = 256 * 1024 * 1024
+    # pages kept loaded and parsed for band renders, see `load_band_page`
+    BAND_PAGES = 8
+    # what `load_page_content` sets up
+    PAGE_ATTRS = (
+        "current_page",
+        "res",
+        "exgtate",
+        "xobject",
+        "scaled_page_width",
+        "scaled_page_height",
+        "color_map",
+        "current_stream",
+        "font_map",
+    )
+
+    def __init__(
+        self,
+        scaling=1,
+        clean: int = 0,
+        segment_storage: str = "surface",
+        color_mode: str = "color",
+    ):
         self.scaling = scaling
+        # how rendered pages are kept in `page_seg_dict`: "surface" (whole
+        # page), "strips" (non empty rows only) or "zlib" (compressed strips)
+        self.segment_storage = segment_storage
+        # page surfaces: "color" (ARGB32), "gray" (A8 ink coverage, colors
+        # by their luminance) or "auto" (A8, unless the page uses a non
+        # gray color or an image), see `BaseRenderer.gray`
+        self.color_mode = color_mode
         self.scaled_page_width = 595 * scaling
         self.scaled_page_height = 842 * scaling
         # self.debug = debug
@@ -63,6 +137,16 @@ class PdfEngine:
         self.page_seg_dict: dict[int, SurfaceGapsSegments] = {}
         self.question_list: list[Question] = {}
         self.current_pdf_document = None
+        self.max_show: int | None = None
+        self.counter = 0
+        # parsed font tables, shared by all documents (and runs)
+        self.font_cache = FontCache()
+        # rendered pages / questions, see `render_pdf_page`
+        self.render_cache = SurfaceCache(
+            self.RENDER_CACHE_BYTES, sizeof=surface_nbytes
+        )
+        # (pdf_path, page number) -> loaded page, see `load_band_page`
+        self.band_pages: dict[tuple, dict] = {}
 
     # *******************************************************
     # ****************   Engine API    **********************
@@ -107,24 +191,74 @@ class PdfEngine:
     #     self.page_seg_dict = {}
     #     self.detection_types = 0
 
-    def extract_questions_from_pdf(self, debug=0, clean=2):
+    def extract_questions_from_pdf(
+        self,
+        debug=0,
+        clean=2,
+        backend="null",
+        workers=1,
+        segmentation="geometry",
+    ):
+        """run the question detector over every page.
+
+        with the "null" backend the pages are executed by a
+        `SymbolRenderer` (no pixels at all); page surfaces and their
+        segments are rendered later, only for the pages a question is
+        actually drawn from (see `PageSegments`). any other backend
+        rasterizes every page during detection.
+
+        `segmentation` decides how pages of detection only runs are split
+        into segments: "geometry" uses the extents of the drawn objects
+        (`GeometryGapsSegments`, pixels are rendered per question band),
+        "pixels" renders whole pages (`PageSegments`), "verify" does both
+        and reports the differences. rasterized pages are always segmented
+        by their pixels ("verify" still compares).
+
+        with `workers` > 1 the pages are executed by that many worker
+        processes (see `page_workers`) and their symbols are replayed
+        into the detector here, in page order. detector debugging always
+        runs in this process."""
         (clean is not None) and self.set_clean(clean)
         (debug is not None) and self.set_debug(debug & self.M_DEBUG_DETECTOR)
-        self.page_seg_dict = {}
+        detection_only = get_renderer_backend(backend) is SymbolRenderer
+        self.page_seg_dict = (
+            PageSegments(self, self.clean) if detection_only else {}
+        )
         self.question_list = []
+        # crops of a previous extraction (other backend / segmentation)
+        self.clear_render_cache("question")
         self.detection_types = self.D_DETECT_QUESTION
         self.question_detector.on_restart()
 
         if self.debug & self.M_DEBUG_DETECTOR:
             enable_detector_dubugging(self.current_pdf_document)
 
-        for page_nr in range(1, len(self.pages) + 1):
+        page_numbers = list(range(1, len(self.pages) + 1))
+        if workers > 1 and not (self.debug & self.M_DEBUG_DETECTOR):
+            self.extract_pages_in_workers(
+                page_numbers, backend, workers, detection_only, segmentation
+            )
+            page_numbers = []
+
+        verify = segmentation == "verify"
+        for page_nr in page_numbers:
             # if page_nr in self.page_seg_dict:
             #     continue
-            surface = self.render_pdf_page(page_nr, debug=None, clean=None)
-            self.page_seg_dict[page_nr] = SurfaceGapsSegments(
-                surface, gap_factor=0.1, scale=self.scaling
+            if detection_only:
+                self.detect_pdf_page(page_nr)
+                if segmentation != "pixels":
+                    self.add_geometry_segments(
+                        page_nr, self.renderer.drawn_extents, verify
+                    )
+                continue
+            surface = self.render_pdf_page(
+                page_nr, debug=None, clean=None, backend=backend, cache=False
             )
+            self.page_seg_dict[page_nr] = self.create_page_segments(surface)
+            if verify:
+                self.verify_geometry_segments(
+                    page_nr, self.renderer.drawn_extents, surface
+                )
 
         self.question_detector.on_finish()
         q_list = self.question_detector.get_question_list(self.pdf_path)
@@ -134,14 +268,183 @@ class PdfEngine:
         self.question_list = q_list
         return q_list
 
-    def render_pdf_page(self, page_number, debug=0, clean=0):
-        """page_number start from 1"""
+    def extract_pages_in_workers(
+        self, page_numbers, backend, workers, detection_only, segmentation
+    ):
+        results = execute_pages_in_workers(
+            (self.pdf_name, self.pdf_path),
+            self.scaling,
+            self.clean,
+            self.segment_storage,
+            self.color_mode,
+            page_numbers,
+            backend,
+            min(workers, len(page_numbers)),
+        )
+        verify = segmentation == "verify"
+        for page_nr, result in zip(page_numbers, results):
+            record, segments, extents = result
+            SequenceRecorder.replay(record, [self.question_detector])
+            if not detection_only:
+                self.page_seg_dict[page_nr] = segments
+                if verify:
+                    self.verify_geometry_segments(
+                        page_nr, extents, segments.get_page_surface()
+                    )
+            elif segmentation != "pixels":
+                self.add_geometry_segments(page_nr, extents, verify)
+
+        # leave the engine as a sequential run would: a renderer of the
+        # last page (header/footer limits are read by `render_a_question`)
+        self.current_page = page_numbers[-1]
+        self.renderer = SymbolRenderer(self.state, [], self.clean)
+        self.renderer.initialize(
+            int(self.scaled_page_width),
+            int(self.scaled_page_height),
+            self.current_page,
+        )
+
+    def create_geometry_segments(self, page_number, extents, surface=None):
+        return GeometryGapsSegments(
+            extents,
+            int(self.scaled_page_width),
+            int(self.scaled_page_height),
+            gap_factor=0.1,
+            scale=self.scaling,
+            render_band=partial(
+                self.render_page_band, page_number, clean=self.clean
+            ),
+            surface=surface,
+        )
+
+    def add_geometry_segments(self, page_number, extents, verify=False):
+        try:
+            segments = self.create_geometry_segments(page_number, extents)
+        except Exception:
+            # empty page: left to `PageSegments`, which only fails if a
+            # question is actually drawn from it
+            return
+        self.page_seg_dict[page_number] = segments
+        if verify:
+            pixel_segments = self.render_page_segments(page_number)
+            surface = pixel_segments.get_page_surface()
+            self.verify_geometry_segments(page_number, extents, surface)
+
+    def verify_geometry_segments(self, page_number, extents, surface):
+        try:
+            segments = self.create_geometry_segments(page_number, extents)
+        except Exception as e:
+            print(f"WARN: page {page_number}, no geometry segments: {e}")
+            return
+        missing, extra = segments.verify(surface)
+        if missing or extra:
+            print(
+                f"WARN: page {page_number}, geometry segments differ from"
+                " the pixels:",
+                [(round(b.y), round(b.h)) for b in missing],
+                [(round(b.y), round(b.h)) for b in extra],
+            )
+
+    def detect_pdf_page(self, page_number):
+        """feed the detectors with the symbols of a page, without
+        rasterizing it"""
+        self.current_page = page_number
+        self.load_page_content(page_number)
+        self.execute_page_stream(renderer_class=SymbolRenderer)
+
+    def render_page_segments(self, page_number, clean=None):
+        """rasterize a page (detectors detached) and split it into
+        segments, used by `PageSegments` after detection only runs"""
+        old_clean = self.clean
+        (clean is not None) and self.set_clean(clean)
+        try:
+            self.current_page = page_number
+            self.load_page_content(page_number)
+            self.execute_page_stream(run_detectors=False)
+        finally:
+            self.set_clean(old_clean)
+        return self.create_page_segments(self.renderer.surface)
+
+    def create_page_segments(self, surface):
+        segments = SurfaceGapsSegments(
+            surface, gap_factor=0.1, scale=self.scaling
+        )
+        if self.segment_storage != "surface":
+            segments.compact(compress=self.segment_storage == "zlib")
+        return segments
+
+    def render_page_band(self, page_number, y0, y1, clean=None):
+        """rasterize only the device rows y0..y1 (engine scale) of a page;
+        returns an ImageSurface of height y1 - y0. text and images lying
+        completely outside the band are not drawn at all. the page state
+        of the engine (current page, renderer, ...) is left unchanged."""
+        old_clean = self.clean
+        old_page_state = self.save_page_state()
+        (clean is not None) and self.set_clean(clean)
+        try:
+            operators = self.load_band_page(page_number)
+            self.execute_page_stream(
+                run_detectors=False, band=(y0, y1), operators=operators
+            )
+            surface = self.renderer.surface
+        finally:
+            self.set_clean(old_clean)
+            self.restore_page_state(old_page_state)
+        # pixel row 0 is page row y0: callers address the rows themselves,
+        # the offset used while drawing would shift them a second time
+        surface.set_device_offset(0, 0)
+        return surface
+
+    def load_band_page(self, page_number) -> list[PdfOperator]:
+        """`load_page_content` for band renders: the loaded page and its
+        parsed operators are kept for the last `BAND_PAGES` pages, so a
+        page holding several question parts is loaded and parsed once.
+        returns the operators"""
+        key = (self.pdf_path, page_number)
+        page = self.band_pages.pop(key, None)
+        if page is None:
+            self.load_page_content(page_number)
+            parser = PDFStreamParser().parse_stream(self.current_stream)
+            page = {name: getattr(self, name) for name in self.PAGE_ATTRS}
+            page["operators"] = list(parser.iterate())
+            while len(self.band_pages) >= self.BAND_PAGES:
+                del self.band_pages[next(iter(self.band_pages))]
+        else:
+            for name in self.PAGE_ATTRS:
+                setattr(self, name, page[name])
+        self.band_pages[key] = page  # most recently used last
+        return page["operators"]
+
+    def render_pdf_page(
+        self, page_number, debug=0, clean=0, backend="image", cache=True
+    ):
+        """page_number start from 1; `backend` is a name from
+        RENDERER_BACKENDS. recordings are replayed to an ImageSurface at
+        the engine scale (the RecordingSurface itself stays available as
+        `self.renderer.surface`), the null backend paints nothing.
+        results are kept in `render_cache` (per document, page, scaling,
+        clean flags and backend) unless `cache` is False, callers must not
+        draw on them. a cached result restores the page state of its run
+        (loaded page, renderer and state, see `PageState`) as well."""
         (clean is not None) and self.set_clean(clean)
         (debug is not None) and self.set_debug(
             debug & (self.M_DEBUG_ALL_STREAM | self.M_DEBUG_ORIGINAL_CONTENT)
         )
 
         self.current_page = page_number
+        # debug runs exist for their side effects, never serve them cached
+        key = None
+        if cache and not self.debug:
+            # empty lines are cropped only without detectors, see below
+            key = self.render_cache_key(
+                "page", page_number, backend, self.detection_types
+            )
+            cached = self.render_cache.get(key)
+            if cached is not None:
+                surface, page_state = cached
+                self.restore_page_state(page_state)
+                return surface
+
         self.load_page_content(page_number)
         if self.debug & self.M_DEBUG_ORIGINAL_CONTENT:
             self.debug_original_stream()
@@ -149,7 +452,9 @@ class PdfEngine:
         # if page_number in self.page_seg_dict:
         #     surface = self.page_seg_dict[page_number].surface
         # else:
-        self.execute_page_stream()
+        self.execute_page_stream(
+            renderer_class=get_renderer_backend(backend)
+        )
         if False:
             self.doc_page: fitz = self.doc.load_page(page_number - 1)
             # zoom = 300 / 72
@@ -178,12 +483,16 @@ class PdfEngine:
             )
 
             self.renderer.surface = surface
+        elif isinstance(self.renderer, RecordingRenderer):
+            surface = self.renderer.replay()
         else:
             surface = self.renderer.surface
         if not self.detection_types and (self.clean & self.O_CROP_EMPTY_LINES):
             print("calling wrong function")
             surface = self.remove_empty_lines_from_current_page(surface)
 
+        if key is not None:
+            self.render_cache.put(key, (surface, self.save_page_state()))
         return surface
 
     def render_a_question(self, q_nr, devide=False):
@@ -192,6 +501,11 @@ class PdfEngine:
         if 0 > q_nr > len(self.question_list):
             raise Exception(f"question nr {q_nr}, index out of valid range")
 
+        key = self.render_cache_key("question", q_nr, devide)
+        surface = self.render_cache.get(key)
+        if surface is not None:
+            return surface
+
         q: Question = self.question_list[q_nr - 1]
         ren = self.renderer
         surf_res = q.draw_question_on_image_surface(
@@ -201,17 +515,51 @@ class PdfEngine:
             self.scaling,
             devide=True,
         )
-        if devide:
-            return surf_res
-        else:
-            return concat_cairo_surfaces(surf_res)
+        if not devide:
+            surf_res = concat_cairo_surfaces(surf_res)
+        self.render_cache.put(key, surf_res)
+        return surf_res
+
+    # ****************** render cache ************************
+
+    def render_cache_key(self, kind: str, *args):
+        return (
+            kind,
+            self.pdf_path,
+            self.scaling,
+            self.clean,
+            self.color_mode,
+        ) + args
+
+    def save_page_state(self) -> PageState:
+        return PageState(
+            {name: getattr(self, name, None) for name in self.PAGE_ATTRS},
+            self.renderer,
+            self.state,
+        )
+
+    def restore_page_state(self, page_state: PageState):
+        for name, value in page_state.attrs.items():
+            setattr(self, name, value)
+        self.renderer = page_state.renderer
+        self.state = page_state.state
+
+    def clear_render_cache(self, kind: str | None = None):
+        """drop all rendered surfaces (e.g. before the engine is replaced),
+        or only those of one `kind`"""
+        if kind is None:
+            self.render_cache.clear()
+            self.band_pages.clear()
+            return
+        for key in [k for k in self.render_cache.entries if k[0] == kind]:
+            self.render_cache.discard(key)
 
     # *******************************************************
     # **************** initialization  **********************
     # _______________________________________________________
 
     def initialize_file(self, pdf_path):
-        self.current_stream: str | None = None
+        self.current_stream: bytes | None = None
         self.pdf_path = pdf_path[1]
         self.current_pdf_document = self.pdf_path
         self.pdf_name = pdf_path[0]
@@ -230,6 +578,11 @@ class PdfEngine:
         )  # * self.scaling
 
         self.font_map: dict[str, PdfFont] | None = None
+        # every font of the document is built once, keyed by its
+        # (idnum, generation) reference, and shared by all pages/xobjects
+        self.font_registry: dict[tuple[int, int], PdfFont] = {}
+        # decoded image xobjects, shared by all pages of the document
+        self.image_cache = SurfaceCache()
 
         self.question_detector: QuestionDetector = QuestionDetector(
             self.D_DETECT_QUESTION, self.scaling
@@ -277,22 +630,17 @@ class PdfEngine:
 
         self.color_map = self.get_color_space_map(self.res)
 
-        streams_data: list[bytes] = self.get_page_stream_data(page)
+        streams_data: bytes = self.get_page_stream_data(page)
 
-        for i, b in enumerate(streams_data):
-            if b == 54:
-                pass
         if len(streams_data) == 0:
-            self.current_stream = pnc.bytes_to_string(
-                self.reader.stream.read()
-            )
+            self.current_stream = self.reader.stream.read()
             raise Exception(
                 "no data found in this pdf !!!",
                 self.pdf_path,
                 ":",
                 self.current_page,
             )
-        streams_data = pnc.bytes_to_string(streams_data, unicode_excape=True)
+        # the parser consumes the raw bytes, no decoding needed
         self.current_stream = streams_data
 
         self.debug_original_stream()
@@ -346,11 +694,11 @@ class PdfEngine:
             self.print_fonts(f, res)
             self.print_external_g_state(f, res)
             self.print_color_space(f, res)
-            f.write(self.current_stream)
+            f.write(pnc.bytes_to_string(self.current_stream))
         return self
 
     def debug_x_stream(
-        self, xres: dict, xstream: str, filename=f"output{sep}xobj_stream.txt"
+        self, xres: dict, xstream: bytes, filename=f"output{sep}xobj_stream.txt"
     ):
         # print("saving debug info into file")
         with open(filename, "w", encoding="utf-8") as f:
@@ -361,7 +709,7 @@ class PdfEngine:
             self.print_fonts(f, xres)
             self.print_external_g_state(f, xres)
             self.print_color_space(f, xres)
-            f.write(xstream)
+            f.write(pnc.bytes_to_string(xstream))
 
     def print_color_space(self, f, res):
 
@@ -444,18 +792,30 @@ class PdfEngine:
         if resources and resources.get("/Font"):
             for font_name, font_object in resources.get("/Font").items():
                 if font_name not in fonts:
-                    # if self.font_map and font_name in self.font_map:
-                    #     fonts[font_name] = self.font_map[font_name]
-                    # else:
-                    fonts[font_name] = PdfFont(
-                        font_name,
-                        self.reader.get_object(font_object),
-                        self.reader,
-                        self.execute_glyph_stream,
-                        depth,
+                    fonts[font_name] = self.get_font(
+                        font_name, font_object, depth
                     )
         return fonts
 
+    def get_font(self, font_name: str, font_object, depth=0) -> PdfFont:
+        key = None
+        if isinstance(font_object, IndirectObject):
+            key = (font_object.idnum, font_object.generation)
+            font = self.font_registry.get(key)
+            if font is not None:
+                return font
+        font = PdfFont(
+            font_name,
+            self.reader.get_object(font_object),
+            self.reader,
+            self.execute_glyph_stream,
+            depth,
+            self.font_cache,
+        )
+        if key is not None:
+            self.font_registry[key] = font
+        return font
+
     def get_external_g_state(self, res):
         exgtate = {}
         ext = res.get("/ExtGState")
@@ -494,7 +854,15 @@ class PdfEngine:
     # **************** Excecute Stream **********************
     # _______________________________________________________
 
-    def execute_page_stream(self, max_show: int | None = None) -> int:
+    def execute_page_stream(
+        self,
+        max_show: int | None = None,
+        renderer_class: type[BaseRenderer] = BaseRenderer,
+        run_detectors: bool = True,
+        band: tuple[float, float] | None = None,
+        gray: bool | None = None,
+        operators: list[PdfOperator] | None = None,
+    ) -> int:
         # if (
         #     self.font_map is None
         #     or self.current_stream is None
@@ -522,10 +890,18 @@ class PdfEngine:
         )
         used_detectors = []
         for detect in self.ALL_DETECTORS:
-            (detect.id & self.D_DETECT_QUESTION) and used_detectors.append(
-                self.question_detector
+            (
+                run_detectors and (detect.id & self.D_DETECT_QUESTION)
+            ) and used_detectors.append(self.question_detector)
+        self.renderer = renderer_class(self.state, used_detectors, self.clean)
+        self.state.skip_images = not self.renderer.DRAW_IMAGES
+        if self.renderer.SUPPORTS_BAND:
+            self.renderer.band = band
+            self.state.band = band
+        if self.renderer.SUPPORTS_GRAY:
+            self.renderer.gray = (
+                self.color_mode != "color" if gray is None else gray
             )
-        self.renderer = BaseRenderer(self.state, used_detectors, self.clean)
 
         self.state.draw_image = self.renderer.draw_inline_image
 
@@ -535,6 +911,7 @@ class PdfEngine:
             self.current_page,
         )
         self.state.ctx = self.renderer.ctx
+        self.state.image_cache = self.image_cache
 
         # ****************** create Parser ************************
 
@@ -549,49 +926,91 @@ class PdfEngine:
         )
         f = None
         if debugging:
-            f = open(f"output{sep}output.md", "w", encoding="utf-8")
+            # the color repaint of "auto" pages (see below) is appended to
+            # the log of the first pass
+            mode = "w" if gray is None else "a"
+            f = open(f"output{sep}output.md", mode, encoding="utf-8")
         self.renderer.output = f
         self.output_file = f
         if debugging:
+            if gray is not None:
+                f.write("\n\nREPAINT: " + ("gray" if gray else "color"))
+                f.write("\n\n\n")
             f.write("FILE: " + os.path.basename(self.pdf_path) + "\n")
             f.write("PAGE: " + str(self.current_page) + "\n\n\n")
 
         # ************* start Execution loop *********************
 
-        for cmd in self.parser.parse_stream(self.current_stream).iterate():
-            debugging and f.write(f"{cmd}\n")
-            explanation, ok = self.state.execute_command(cmd)
+        if operators is None:
+            self.parser.parse_stream(self.current_stream)
+            commands = self.parser.iterate()
+        else:
+            commands = iter(operators)
+        self.execute_commands(
+            commands, self.make_stream_hook(f), strict=bool(debugging)
+        )
 
-            # if debugging and explanation:
-            #     f.write(f"{explanation}\n")
+        if debugging:
+            f.flush()
+            f.close()
 
-            debugging and explanation and f.write(f"{explanation}\n")
-            explanation2, ok2 = self.renderer.execute_command(cmd)
+        if (
+            gray is None
+            and self.color_mode == "auto"
+            and self.renderer.gray
+            and self.renderer.needs_color
+        ):
+            # not a black and white page: the detectors already got its
+            # symbols, only paint it again into an ARGB32 surface
+            self.execute_page_stream(
+                max_show, renderer_class, False, band, False, operators
+            )
 
-            if debugging and explanation2:
-                f.write(f"{explanation2}\n")
+    def execute_commands(
+        self, operators: Iterable[PdfOperator], hook=None, strict: bool = True
+    ):
+        """the interpreter loop: one table lookup and one handler call per
+        operator (`PDFStreamParser.iterate` or a list kept by
+        `load_band_page`). `hook(cmd, result)` is optional (debugging /
+        max_show), a truthy return value stops the stream."""
+        renderer = self.renderer
+        get_handler = renderer.DISPATCH.get
+        for cmd in operators:
+            handler = get_handler(cmd.opcode)
+            if handler is None:
+                if strict:
+                    print("CMD:", cmd)
+                    s = f"{cmd.name} was not handled \n"
+                    s += f"args : {cmd.args}\n"
+                    raise Exception("Incomplete Implementaion\n" + s)
+                continue
+            result = handler(renderer, cmd)
+            if hook is not None and hook(cmd, result):
+                break
 
-            if cmd.name in ["Tj", "TJ", "'", '"']:
+    def make_stream_hook(self, f=None, use_max_show=True):
+        """returns None when neither debugging output nor max_show is
+        requested, so the loop runs without any per operator overhead"""
+        max_show = self.max_show if use_max_show else None
+        if not f and not max_show:
+            return None
+        text_show = self.renderer.TEXT_SHOW_OPCODES
+
+        def hook(cmd: PdfOperator, result):
+            if f:
+                f.write(f"{cmd}\n")
+                if result and result[0]:
+                    f.write(f"current position = {result[0]}\n")
+            if cmd.opcode in text_show:
                 self.counter += 1
-                if debugging:
-                    f.write(f"counter={self.counter}\n\n")
+                f and f.write(f"counter={self.counter}\n\n")
+            return bool(max_show and self.counter > max_show)
 
-            if max_show and self.counter > max_show:
-                break
-
-            if debugging and not ok and not ok2:
-                print("CMD:", cmd)
-                s = f"{cmd.name} was not handled \n"
-                s += f"args : {cmd.args}\n"
-                raise Exception("Incomplete Implementaion\n" + s)
-
-        if debugging:
-            f.flush()
-            f.close()
+        return hook
 
     def execute_xobject_stream(
         self,
-        data_stream: str,
+        data_stream: bytes,
         initial_state: dict,
         xres: dict,
         depth: int,
@@ -634,6 +1053,9 @@ class PdfEngine:
             raise ValueError("Engine not initialized properly")
 
         x_state.ctx = self.renderer.ctx
+        x_state.image_cache = self.image_cache
+        x_state.skip_images = not self.renderer.DRAW_IMAGES
+        x_state.band = self.renderer.band
 
         x_parser = PDFStreamParser()
         f = None
@@ -647,27 +1069,8 @@ class PdfEngine:
             f.write(f"X_Stream[{depth}]: {stream_name}" + "\n")
             f.write("Enter: " + "\n\n\n")
 
-        for cmd in x_parser.parse_stream(x_stream).iterate():
-            debugging and f.write(f"{cmd}\n")
-            explanation, ok = x_state.execute_command(cmd)
-            if debugging and explanation:
-                f.write(f"{explanation}\n")
-            explanation2, ok2 = self.renderer.execute_command(cmd)
-
-            (debugging and explanation2) and f.write(f"{explanation}\n")
-            if cmd.name in ["Tj", "TJ", "'", '"']:
-                self.counter += 1
-                debugging and f.write("\n\n")
-
-            if self.max_show and self.counter > self.max_show:
-                break
-
-            if not ok and not ok2:
-                print("X_CMD:", cmd)
-                print("Inside XFORM :")
-                s = f"{cmd.name} was not handled \n"
-                s += f"args : {cmd.args}\n"
-                raise Exception("Incomplete Implementaion\n" + s)
+        x_parser.parse_stream(x_stream)
+        self.execute_commands(x_parser.iterate(), self.make_stream_hook(f))
 
         if debugging:
             f.write("\n\n")
@@ -677,7 +1080,7 @@ class PdfEngine:
         self.renderer.state = old_state
 
     def execute_glyph_stream(
-        self, stream: str, ctx: cairo.Context, char_name: str, font_matrix
+        self, stream: bytes, ctx: cairo.Context, char_name: str, font_matrix
     ):
 
         debugging = (
@@ -690,7 +1093,7 @@ class PdfEngine:
                 f"output{sep}font_stream.txt", "w", encoding="utf-8"
             ) as f:
                 f.write("# page number " + str(self.current_page) + "\n\n")
-                f.write(stream)
+                f.write(pnc.bytes_to_string(stream))
 
         font_state = EngineState(
             font_map=self.font_map,
@@ -714,10 +1117,16 @@ class PdfEngine:
         )
         old_state = self.renderer.state
         old_ctx = self.renderer.ctx
+        # paths of the glyph are in glyph space, the glyph itself is
+        # already recorded by `add_text_extent` (page device space)
+        old_extents = self.renderer.drawn_extents
 
         self.renderer.state = font_state
         self.renderer.ctx = ctx
+        self.renderer.drawn_extents = []
         font_state.ctx = ctx
+        font_state.image_cache = self.image_cache
+        font_state.skip_images = not self.renderer.DRAW_IMAGES
 
         if stream is None:
             raise ValueError("Font stream is None")
@@ -735,24 +1144,10 @@ class PdfEngine:
             f.write(f"Font_Stream[{self.state.depth}]: {char_name}" + "\n")
             f.write("Enter: " + "\n\n\n")
         print("\n\nEnter Font_Stream\n")
-        for cmd in x_parser.parse_stream(stream).iterate():
-            debugging and f.write(f"{cmd}\n")
-            explanation, ok = font_state.execute_command(cmd)
-            if debugging and explanation:
-                f.write(f"{explanation}\n")
-            explanation2, ok2 = self.renderer.execute_command(cmd)
-            if debugging and explanation2:
-                f.write(f"{explanation}\n")
-            if cmd.name in ["Tj", "TJ", "'", '"']:
-                debugging and f.write("\n\n")
-                self.counter += 1
-
-            if not ok and not ok2:
-                print("Font_CMD:", cmd)
-                print("Inside Font_State :")
-                s = f"{cmd.name} was not handled \n"
-                s += f"args : {cmd.args}\n"
-                raise Exception("Incomplete Implementaion\n" + s)
+        x_parser.parse_stream(stream)
+        self.execute_commands(
+            x_parser.iterate(), self.make_stream_hook(f, False)
+        )
 
         if debugging:
             f.write("\n\n")
@@ -760,6 +1155,7 @@ class PdfEngine:
             f.write("Exit: " + "\n\n\n")
         self.renderer.state = old_state
         self.renderer.ctx = old_ctx
+        self.renderer.drawn_extents = old_extents
 
     # **********************************************************
     # *************+ Proccess ImageSurface *********************
@@ -1,3 +1,4 @@
+import io
 from math import isnan
 from pathlib import Path
 import os
@@ -14,7 +15,13 @@ from pypdf import PdfReader
 
 from .pdf_utils import open_image_in_irfan, kill_with_taskkill
 from engine import winansi
-from .create_cairo_font import create_cairo_font_face_for_file
+from .font_cache import FontCache
+from .cid_widths import CidWidths
+from .pdf_cmap import ToUnicodeCMap
+from .create_cairo_font import (
+    create_cairo_font_face_for_file,
+    create_cairo_font_face_for_memory,
+)
 import pprint
 
 # from fontTools.ttLib import TTFont
@@ -61,6 +68,7 @@ class PdfFont:
         reader: PdfReader,
         process_glyph_stream: Callable,
         depth: int,
+        font_cache: FontCache | None = None,
     ) -> None:
 
         if font_object is None:
@@ -92,6 +100,17 @@ class PdfFont:
         self.use_system_font = False
         self.adjust_glyph_width = False
 
+        # ************* Persistent tables cache ***********
+        # ---------
+        self.font_data: bytes | None = None  # embedded font program
+        self.font_cache = font_cache
+        self.cache_key = None
+        tables = None
+        if font_cache is not None:
+            self.cache_key = self.get_cache_key(font_dict, reader)
+            tables = font_cache.get(self.cache_key)
+        self.cached_tables = tables
+
         # ************* DiFF map ***********************
         # ---------
 
@@ -108,7 +127,11 @@ class PdfFont:
                         self.encoding["/BaseEncoding"]
                     ]
                 if "/Differences" in self.encoding:
-                    self.cid_to_name = self.create_diff_map_dict(font_dict)
+                    self.cid_to_name = (
+                        tables["cid_to_name"]
+                        if tables
+                        else self.create_diff_map_dict(font_dict)
+                    )
 
         # print(self.diff_map)
 
@@ -118,20 +141,30 @@ class PdfFont:
         self.valid_ranges = None
         self.cid_to_unicode = {}
 
-        self.cid_to_unicode, self.valid_ranges = (
-            self.create_tounicode_map_dict(font_dict)
-        )
+        if tables:
+            self.cid_to_unicode = tables["cid_to_unicode"]
+            self.valid_ranges = tables["valid_ranges"]
+        else:
+            self.cid_to_unicode, self.valid_ranges = (
+                self.create_tounicode_map_dict(font_dict)
+            )
 
         # ************* Width Map *******************
         # ----------
-        self.width = self.create_width_map(font_dict)
+        if tables:
+            self.widths = tables["widths"]
+            self.default_width = tables["default_width"]
+            self.width = self.widths
+        else:
+            self.width = self.create_width_map(font_dict)
 
         # ************ FONT DATA VARS *********************
         # ------------ TYPE0 , TYPE1
         self.font_face = None
+        self.scaled_fonts: dict[tuple, cairo.ScaledFont] = {}
         self.ft_encoding, self.ft_face = None, None
         self.has_char_map = False
-        self.font_path = None
+        self.font_path = None  # only used for system fonts
         self.cid_to_gid = {}
         self.char_to_gid = {}
         self.symbol_to_gid = {}
@@ -142,6 +175,11 @@ class PdfFont:
             *font_dict.get("/FontMatrix", [0.001, 0, 0, 0.001, 0, 0])
         )
         self.glyph_cache = {}
+        # ------------ code -> (glyph_id, width, char) --------------
+        # filled on first use of each code; dense for 1 byte codes
+        self.glyph_table: list | dict = (
+            {} if self.is_type0 else [None] * 256
+        )
         # ------------ Embeded Font File ----------------------------
         # for :  typ1,type0,TrueType,OpenType
         # -------------
@@ -177,6 +215,9 @@ class PdfFont:
             self.weight = cairo.FONT_WEIGHT_NORMAL
             self.setup_cairo_toy_font()
 
+        if font_cache is not None and not tables:
+            font_cache.put(self.cache_key, self.dump_tables())
+
     # ******************************************************
     # ************* FONT initialization method *************
     # ------------------------------------------------------
@@ -209,6 +250,97 @@ class PdfFont:
                 font_dict.update(desc_i)
         return font_dict
 
+    # ******************************************************
+    # ************* persistent tables cache ****************
+    # ------------------------------------------------------
+
+    def get_cache_key(self, font_dict, reader):
+        """hash of everything the cached tables are derived from; the
+        embedded font program is read here (and kept) for that purpose"""
+        font_desc = font_dict.get("/FontDescriptor") or {}
+        for font_file_key in ["/FontFile", "/FontFile2", "/FontFile3"]:
+            if font_file_key in font_desc:
+                self.font_data = self.load_embeded_font_data(
+                    font_desc[font_file_key], reader
+                )
+                break
+        tounicode = font_dict.get("/ToUnicode")
+        return FontCache.make_key(
+            self.font_type,
+            self.base_font,
+            f"{self.first_char}:{self.last_char}",
+            self.font_data,
+            tounicode.get_data() if tounicode is not None else None,
+            self._canonical(font_dict.get("/Encoding")),
+            self._canonical(font_dict.get("/Widths")),
+            self._canonical(font_dict.get("/W")),
+            self._canonical(font_dict.get("/DW")),
+            self._canonical(font_desc.get("/MissingWidth")),
+        )
+
+    @classmethod
+    def _canonical(cls, obj, depth=0) -> str:
+        """deterministic text form of a pdf object (no object ids)"""
+        if depth > 8:
+            return "..."
+        if isinstance(obj, IndirectObject):
+            obj = obj.get_object()
+        if isinstance(obj, dict):
+            return (
+                "<<"
+                + " ".join(
+                    f"{k} {cls._canonical(v, depth + 1)}"
+                    for k, v in sorted(obj.items())
+                )
+                + ">>"
+            )
+        if isinstance(obj, (list, tuple)):
+            if not any(
+                isinstance(v, (IndirectObject, dict, list)) for v in obj
+            ):
+                return repr(list(obj))  # flat arrays (widths): fast path
+            return (
+                "["
+                + " ".join(cls._canonical(v, depth + 1) for v in obj)
+                + "]"
+            )
+        if hasattr(obj, "get_data"):
+            return "stream:" + obj.get_data().hex()
+        return repr(obj)
+
+    def dump_tables(self):
+        plain = self._plain
+        return {
+            "cid_to_name": plain(self.cid_to_name),
+            "cid_to_unicode": plain(self.cid_to_unicode),
+            "valid_ranges": plain(self.valid_ranges),
+            "widths": plain(self.widths),
+            "default_width": plain(self.default_width),
+            "cid_to_gid": plain(self.cid_to_gid),
+            "char_to_gid": plain(self.char_to_gid),
+            "symbol_to_gid": plain(self.symbol_to_gid),
+        }
+
+    @classmethod
+    def _plain(cls, obj):
+        """pypdf objects -> builtin types, so cache entries stay small and
+        do not depend on pypdf classes"""
+        if isinstance(obj, bool) or obj is None:
+            return obj
+        if isinstance(obj, int):
+            return int(obj)
+        if isinstance(obj, float):
+            return float(obj)
+        if isinstance(obj, str):
+            return str(obj)
+        if isinstance(obj, dict):
+            return {cls._plain(k): cls._plain(v) for k, v in obj.items()}
+        if isinstance(obj, tuple):
+            return tuple(cls._plain(v) for v in obj)
+        if isinstance(obj, list):
+            return [cls._plain(v) for v in obj]
+        return obj
+
     # **************************************************************
     # ****************** Type1,Type0,TrueType **********************
     # --------------------------------------------------------------
@@ -223,22 +355,28 @@ class PdfFont:
         for font_file_key in ["/FontFile", "/FontFile2", "/FontFile3"]:
             if font_file_key in font_desc:
                 not_found = False
-                # ************* initilize dir *****************
+                # ************* load from memory *****************
                 # -----------
 
                 font_file = self.font_desc[font_file_key]
-                font_path = self.save_embeded_font_to_file(font_file, reader)
-                ft_face = freetype.Face(font_path)
-                self.font_path = font_path
+                font_data = self.font_data or self.load_embeded_font_data(
+                    font_file, reader
+                )
+                ft_face = freetype.Face(io.BytesIO(font_data))
+                self.font_data = font_data
                 self.ft_face = ft_face
                 if not self.is_type0:
                     self.select_char_map_for_font()
-                if self.has_char_map:
+                if self.has_char_map and self.cached_tables:
+                    self.cid_to_gid = self.cached_tables["cid_to_gid"]
+                    self.char_to_gid = self.cached_tables["char_to_gid"]
+                    self.symbol_to_gid = self.cached_tables["symbol_to_gid"]
+                elif self.has_char_map:
                     (
                         self.cid_to_gid,
                         self.char_to_gid,
                         self.symbol_to_gid,
-                    ) = self.create_glyph_map_dicts(font_path)
+                    ) = self.create_glyph_map_dicts(None)
 
         if not_found:
 
@@ -277,24 +415,10 @@ class PdfFont:
     # *************** Helper Methods *******************
     # --------------------------------------------------
 
-    def save_embeded_font_to_file(self, font_file, reader):
-        temp_dir = "temp"
-        font_path = (
-            temp_dir + sep + self.font_name + "_" + str(self.depth) + ".ttf"
-        )
-        if not os.path.exists(temp_dir):
-            os.mkdir(temp_dir)
-        elif os.path.exists(font_path):
-            os.remove(font_path)
-
+    def load_embeded_font_data(self, font_file, reader) -> bytes:
         if isinstance(font_file, IndirectObject):
             font_file = reader.get_object(font_file)
-        font_data = font_file.get_data()
-        file = open(font_path, "bw")
-        file.write(font_data)
-        file.flush()
-        file.close()
-        return font_path
+        return font_file.get_data()
 
     def select_char_map_for_font(self):
         if not self.is_type0 and len(self.ft_face.charmaps) > 0:
@@ -326,13 +450,42 @@ class PdfFont:
                 return True
         return False
 
+    MAX_SCALED_FONTS = 64
+
     def get_cairo_font_face(self):
-        """Get a Cairo font face from the embedded font if available"""
-        self.font_face = create_cairo_font_face_for_file(
-            self.font_path, encoding=self.ft_encoding
-        )
+        """Get a Cairo font face from the embedded font if available,
+        the face is created once and owned by this font"""
+        if self.font_face is None:
+            if self.font_data is not None:
+                self.font_face = create_cairo_font_face_for_memory(
+                    self.font_data,
+                    encoding=self.ft_encoding,
+                    name=self.base_font,
+                )
+            else:
+                self.font_face = create_cairo_font_face_for_file(
+                    self.font_path, encoding=self.ft_encoding
+                )
         return self.font_face
 
+    def set_scaled_font(self, ctx: cairo.Context, font_size: float):
+        """select this font in `ctx` at `font_size`, reusing the
+        cairo.ScaledFont created for the same size and CTM (the translation
+        part of the CTM does not change the glyph outlines)"""
+        m = ctx.get_matrix()
+        key = (font_size, m.xx, m.yx, m.xy, m.yy)
+        scaled_font = self.scaled_fonts.get(key)
+        if scaled_font is not None:
+            ctx.set_scaled_font(scaled_font)
+            return scaled_font
+        ctx.set_font_face(self.get_cairo_font_face())
+        ctx.set_font_size(font_size)
+        scaled_font = ctx.get_scaled_font()
+        if len(self.scaled_fonts) >= self.MAX_SCALED_FONTS:
+            self.scaled_fonts.clear()
+        self.scaled_fonts[key] = scaled_font
+        return scaled_font
+
     #
     # **************************************************************
     # **************** Create some Usefull Dict ********************
@@ -364,26 +517,7 @@ class PdfFont:
             widths = font_dict.get("/W", [])
             # if isinstance(widths, IndirectObject):
             #     widths = reader.get_object(widths)
-            self.widths = {}
-            i = 0
-            while i < len(widths) - 1:
-                el = int(widths[i])
-                n_el = widths[i + 1]
-                if isinstance(n_el, list):
-                    for j in range(len(n_el)):
-                        self.widths[el + j] = n_el[j]
-                    i = i + 2
-                elif i + 2 < len(widths):
-                    n_el = int(n_el)
-                    n2_el = widths[i + 2]
-                    if isinstance(n2_el, list):
-                        if len(n2_el) == 1:
-                            n2_el = n2_el[0]
-                        else:
-                            raise Exception
-                    for j in range(el, n_el + 1):
-                        self.widths[j] = n2_el
-                    i = i + 3
+            self.widths = CidWidths(widths)
         else:
 
             raise Exception(
@@ -396,133 +530,16 @@ class PdfFont:
 
         if "/ToUnicode" not in font_dict:
             return {}, None
-        tounicode = font_dict["/ToUnicode"]
-        data = tounicode.get_data().decode("utf-8")
-        # print(data, "\n\n")
+        data = font_dict["/ToUnicode"].get_data()
         self.cmap_data = data
-        tokens = self.tokenize_cmap(data)
-
-        cid_map = {}
-        codespace_ranges = []
-        i = 0
-        while i < len(tokens):
-            token = tokens[i]
-            if token == "begincodespacerange":
-                count = int(tokens[i - 1]) if i > 0 else 0
-                i += 1
-                for _ in range(count):
-                    # Parse <start> <end> pairs
-                    start = int(tokens[i + 1], 16)
-                    end = int(tokens[i + 4], 16)
-                    codespace_ranges.append((start, end))
-                    i += 6  # Skip past '<', start, '>', '<', end, '>'
-                # Skip past "endcodespacerange"
-                while i < len(tokens) and tokens[i] != "endcodespacerange":
-                    i += 1
-                i += 1
-            elif token == "beginbfchar":
-                count = int(tokens[i - 1]) if i > 0 else 0
-                i += 1
-                for _ in range(count):
-                    cid = int(tokens[i + 1], 16)
-                    uni_token = tokens[i + 4]
-                    unicode_char = ""
-                    for j in range(0, len(uni_token), 4):
-                        unicode_char += chr(int(uni_token[j : j + 4], 16))
-                    cid_map[cid] = unicode_char
-                    i += 6  # Skip '<', cid, '>', '<', unicode, '>'
-            elif token == "beginbfrange":
-                count = int(tokens[i - 1]) if i > 0 else 0
-                i += 1
-                for _ in range(count):
-                    cid_start = int(tokens[i + 1], 16)
-                    cid_end = int(tokens[i + 4], 16)
-
-                    # Check the format of the unicode mapping
-                    if i + 6 < len(tokens) and tokens[i + 6] == "[":
-                        # Format 2: range to array [ <unicode1> <unicode2> ... ]
-                        i += 7  # Skip past '<', start, '>', '<', end, '>', '['
-                        for offset in range(cid_end - cid_start + 1):
-                            if i < len(tokens) and tokens[i] == "<":
-                                unicode_hex = tokens[i + 1]
-                                cid = cid_start + offset
-                                cid_map[cid] = self._parse_unicode_hex(
-                                    unicode_hex
-                                )
-                                i += 3  # Skip '<', hex, '>'
-                            else:
-                                break
-                        # Skip past the closing ']'
-                        while i < len(tokens) and tokens[i] != "]":
-                            i += 1
-                        i += 1  # Skip the ']'
-
-                    else:
-                        # Format 1: range to range <cidStart> <cidEnd> <unicodeStart>
-                        # Make sure we have enough tokens and the next token is a hex number
-                        if (
-                            i + 6 < len(tokens)
-                            and tokens[i + 6] == "<"
-                            and i + 7 < len(tokens)
-                        ):
-                            uni_start = int(tokens[i + 7], 16)
-                            for offset in range(cid_end - cid_start + 1):
-                                cid = cid_start + offset
-                                cid_map[cid] = chr(uni_start + offset)
-                            i += 9  # Skip '<', start, '>', '<', end, '>', '<', uni_start, '>'
-                        else:
-                            # Unexpected format, skip this entry
-                            i += 6  # Skip past the CID range only
-                            # Try to find the end of this bfrange entry
-                            while i < len(tokens) and tokens[i] not in [
-                                "<",
-                                ">",
-                                "]",
-                                "beginbfrange",
-                                "endbfrange",
-                            ]:
-                                i += 1
-            i += 1
-
-        return cid_map, codespace_ranges or None
-
-    def tokenize_cmap(self, data):
-        tokens = []
-        current = []
-        in_comment = False
-        for char in data:
-            if char == "%":
-                in_comment = True
-            if in_comment:
-                if char == "\n":
-                    in_comment = False
-                continue
-            if char.isspace():
-                if current:
-                    tokens.append("".join(current))
-                    current = []
-            elif char in "<>":
-                if current:
-                    tokens.append("".join(current))
-                    current = []
-                tokens.append(char)
-            else:
-                current.append(char)
-        if current:
-            tokens.append("".join(current))
-        return tokens
-
-    def _parse_unicode_hex(self, hex_str):
-        """Parse a hexadecimal string into a Unicode character"""
-        if len(hex_str) % 4 == 0:
-            # Handle surrogate pairs and multi-byte Unicode
-            chars = []
-            for j in range(0, len(hex_str), 4):
-                chars.append(chr(int(hex_str[j : j + 4], 16)))
-            return "".join(chars)
-        else:
-            # Single character
-            return chr(int(hex_str, 16))
+        return ToUnicodeCMap.parse(data)
+
+    def get_cmap_data(self):
+        """the ToUnicode stream; fonts loaded from the `FontCache` never
+        read it (`cmap_data` stays None), debugging reads it here"""
+        if self.cmap_data is None and "/ToUnicode" in self.font_dict:
+            self.cmap_data = self.font_dict["/ToUnicode"].get_data()
+        return self.cmap_data
 
     def create_glyph_map_dicts(self, font_path):
         char_to_gid = {}
@@ -581,16 +598,48 @@ class PdfFont:
     # ++++++++++++++++ get Glyph Info *********************
     # _______________ used_by_the_renderer ________________
     #
-    def get_char_code_from_match(self, char: str) -> Tuple[int, int]:
+    def get_glyph_infos(self, data: bytes) -> list[tuple]:
+        """resolve a whole string to (glyph_id, width_em, char) tuples"""
+        table = self.glyph_table
         if not self.is_type0:
-            char_code = pnc.char_to_int(char)
-        else:
-            if len(char) != 2:
-                raise Exception("missing prev symbol in composite font")
-            high_byte = pnc.char_to_int(char[0])
-            low_byte = pnc.char_to_int(char[1])
-            char_code = (high_byte << 8) | low_byte
-        return char_code
+            return [
+                table[code] or self.build_glyph_info(code) for code in data
+            ]
+        codes = [
+            (data[i] << 8) | data[i + 1] for i in range(0, len(data) - 1, 2)
+        ]
+        if len(data) % 2:
+            # a dangling last byte is the low byte
+            codes.append(data[-1])
+        return [table.get(code) or self.build_glyph_info(code) for code in codes]
+
+    def build_glyph_info(self, char_code: int) -> tuple:
+        char_width = self.get_char_width_from_code(char_code)
+        glyph_id, glyph_name = self.get_glyph_id_from_char_code(char_code)
+
+        char_uni = None
+        if self.cid_to_unicode:
+            char_uni = self.cid_to_unicode.get(char_code)
+        elif self.is_type0:
+            char_uni = chr(char_code)
+        if char_width is None:
+            print(
+                "is_composite:",
+                self.is_type0,
+                "symbol:",
+                glyph_name,
+                "glyph_id",
+                glyph_id,
+                "char_code",
+                char_code,
+                "all_widths",
+                self.widths,
+            )
+            raise Exception("char width is None")
+
+        info = (glyph_id, char_width, char_uni or chr(char_code))
+        self.glyph_table[char_code] = info
+        return info
 
     def get_char_width_from_code(self, char_code: int):
         if isinstance(self.widths, (int, float)):
@@ -687,13 +736,18 @@ class PdfFont:
 
     def handle_corropted_font(self, char_code, name):
         curr_cmap = self.ft_face.charmap
+        glyph_id = None
         for cmap in self.ft_face.charmaps:
             if cmap == curr_cmap:
                 continue
             self.ft_face.set_charmap(cmap)
             glyph_id = self.ft_face.get_char_index(char_code)
             if glyph_id:
-                return glyph_id
+                break
+        # restore the selected charmap, later codes are resolved against it
+        if curr_cmap is not None:
+            self.ft_face.set_charmap(curr_cmap)
+        return glyph_id
 
     def get_symbol_name_from_char_code(self, char_code):
         symbol = UV2AGL.get(char_code, None)
@@ -721,8 +775,7 @@ class PdfFont:
 
     def render_glyph_for_type3_font(self, char_name, fill_color):
         # char_name = self.get_symbol_name_from_char_code(char_code)
-        stream_bytes = self.char_procs[char_name].get_data()
-        stream = pnc.bytes_to_string(stream_bytes, unicode_excape=True)
+        stream = self.char_procs[char_name].get_data()
         bbox = self.font_dict.get("/FontBBox", [0, 0, 1000, 1000])
         print("bbox", bbox)
         print("font_matrix", self.font_matrix)
@@ -914,7 +967,7 @@ class PdfFont:
                 pen_x += 50
                 counter += 1
             if counter == 0:
-                pprint.pprint(self.cmap_data)
+                pprint.pprint(self.get_cmap_data())
                 pprint.pprint(self.cid_to_unicode)
             face_cairo = self.get_cairo_font_face()
 
@@ -0,0 +1,229 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+# ********************************************************************
+# ************* pdf image samples -> cairo ARGB32 pixels *************
+# cairo stores ARGB32 as native endian uint32, i.e. B, G, R, A bytes on
+# little endian machines; all conversions below build a (h, w, 4) uint8
+# array in that order, the renderer hands it to cairo without copying
+# (see `pdf_renderer.bgra_to_surface`).
+
+COMPONENTS = {"/DeviceGray": 1, "/DeviceRGB": 3, "/DeviceCMYK": 4}
+
+
+def unpack_samples(
+    data: bytes, width: int, height: int, bpc: int, ncomp: int, scale=True
+):
+    """raw sample bytes -> (height, width, ncomp) uint8 array, scaled to
+    0..255 (unless `scale` is False, e.g. for palette indices). rows are
+    byte aligned, as required by the pdf spec"""
+    row_bytes = (width * ncomp * bpc + 7) // 8
+    needed = row_bytes * height
+    if len(data) < needed:
+        raise Exception("Exceeded image boundaries !!")
+    raw = np.frombuffer(data, dtype=np.uint8, count=needed)
+    raw = raw.reshape(height, row_bytes)
+
+    if bpc == 8:
+        samples = raw[:, : width * ncomp]
+    elif bpc == 16:
+        samples = raw[:, : width * ncomp * 2 : 2]  # keep the high byte
+    elif bpc in (1, 2, 4):
+        bits = np.unpackbits(raw, axis=1)[:, : width * ncomp * bpc]
+        bits = bits.reshape(height, width * ncomp, bpc)
+        weights = (1 << np.arange(bpc - 1, -1, -1)).astype(np.uint16)
+        values = bits.astype(np.uint16) @ weights
+        if scale:
+            values = values * 255 // ((1 << bpc) - 1)
+        samples = values.astype(np.uint8)
+    else:
+        raise Exception(f"unsupported bits per component {bpc}")
+    return samples.reshape(height, width, ncomp)
+
+
+def samples_to_bgra(samples: np.ndarray, color_space: str):
+    """(h, w, ncomp) samples of a device color space -> opaque BGRA"""
+    height, width, _ = samples.shape
+    out = np.empty((height, width, 4), dtype=np.uint8)
+    if color_space == "/DeviceGray":
+        out[:, :, :3] = samples  # broadcast gray over b, g, r
+    elif color_space == "/DeviceRGB":
+        out[:, :, :3] = samples[:, :, 2::-1]
+    elif color_space == "/DeviceCMYK":
+        # same simplified conversion as EngineState.set_color
+        cmyk = samples.astype(np.uint16)
+        white = 255 - cmyk[:, :, 3:4]
+        rgb = (255 - cmyk[:, :, :3]) * white // 255
+        out[:, :, :3] = rgb[:, :, ::-1]
+    else:
+        raise Exception(f"unsupported image color space {color_space}")
+    out[:, :, 3] = 255
+    return out
+
+
+def stencil_to_bgra(
+    data: bytes, width: int, height: int, fill_color: list[float]
+):
+    """1 bit stencil mask: 0 bits are painted with the fill color (0..1
+    components), 1 bits stay transparent"""
+    row_bytes = (width + 7) // 8
+    needed = row_bytes * height
+    if len(data) < needed:
+        # missing rows are left transparent
+        data = bytes(data) + b"\xff" * (needed - len(data))
+    raw = np.frombuffer(data, dtype=np.uint8, count=needed)
+    bits = np.unpackbits(raw.reshape(height, row_bytes), axis=1)[:, :width]
+
+    r, g, b = (
+        round(min(max(float(c), 0.0), 1.0) * 255) for c in fill_color[:3]
+    )
+    out = np.zeros((height, width, 4), dtype=np.uint8)
+    out[bits == 0] = (b, g, r, 255)
+    return out
+
+
+def image_to_bgra(
+    data: bytes,
+    width: int,
+    height: int,
+    bpc: int,
+    color_space: str,
+    fill_color: list[float],
+    is_mask: bool = False,
+    palette: np.ndarray | None = None,
+):
+    if bpc == 1 and (is_mask or color_space not in COMPONENTS):
+        return stencil_to_bgra(data, width, height, fill_color)
+    if bpc == 24:
+        # already expanded to 8 bit rgb by a decoder (see decode_dct)
+        bpc, color_space = 8, "/DeviceRGB"
+    if palette is not None:
+        index = unpack_samples(data, width, height, bpc, 1, scale=False)
+        index = np.minimum(index[:, :, 0], len(palette) - 1)
+        return samples_to_bgra(palette[index], color_space)
+    samples = unpack_samples(
+        data, width, height, bpc, COMPONENTS[color_space]
+    )
+    return samples_to_bgra(samples, color_space)
+
+
+# ****************** color spaces ************************
+
+
+def resolve_color_space(color_space):
+    """image color space -> (device color space, palette or None).
+
+    ICCBased spaces fall back to the device space with the same number of
+    components, Indexed spaces return their lookup table as a
+    (hival + 1, ncomp) uint8 array. anything else is returned unchanged
+    (and rejected by the caller)."""
+    if hasattr(color_space, "get_object"):
+        color_space = color_space.get_object()
+    if not isinstance(color_space, list) or not color_space:
+        return color_space, None
+    family = color_space[0]
+    if family == "/ICCBased":
+        stream = color_space[1].get_object()
+        n = int(stream.get("/N", 3))
+        alternate = stream.get("/Alternate")
+        if alternate in COMPONENTS:
+            return alternate, None
+        return {1: "/DeviceGray", 3: "/DeviceRGB", 4: "/DeviceCMYK"}.get(
+            n, "/DeviceRGB"
+        ), None
+    if family in ("/Indexed", "/I") and len(color_space) >= 4:
+        base, _ = resolve_color_space(color_space[1])
+        if base not in COMPONENTS:
+            return base, None
+        lookup = color_space[3]
+        if hasattr(lookup, "get_object"):
+            lookup = lookup.get_object()
+        if hasattr(lookup, "get_data"):
+            lookup = lookup.get_data()
+        elif isinstance(lookup, str):
+            lookup = lookup.encode("latin1")
+        ncomp = COMPONENTS[base]
+        hival = int(color_space[2])
+        table = np.frombuffer(bytes(lookup), dtype=np.uint8)
+        table = table[: (len(table) // ncomp) * ncomp].reshape(-1, ncomp)
+        return base, table[: hival + 1]
+    if family in COMPONENTS:
+        return family, None
+    return color_space, None
+
+
+# ****************** resolution ************************
+
+
+def reduction_factor(width: int, height: int, device_size) -> int:
+    """largest power of two the image can be shrunk by and still cover
+    `device_size` (w, h in device pixels)"""
+    if not device_size:
+        return 1
+    dw, dh = device_size
+    ratio = min(width / max(dw, 1), height / max(dh, 1))
+    factor = 1
+    while factor * 2 <= ratio:
+        factor *= 2
+    return factor
+
+
+def reduce_bgra(pixels: np.ndarray, factor: int) -> np.ndarray:
+    """box filter downsampling of premultiplied BGRA. PIL's "RGBa" mode
+    is premultiplied as well, so the blocks are plain averages ("RGBA"
+    would weight the colors by alpha a second time)"""
+    if factor <= 1:
+        return pixels
+    height, width, _ = pixels.shape
+    pixels = np.ascontiguousarray(pixels)
+    img = Image.frombuffer(
+        "RGBa", (width, height), pixels, "raw", "RGBa", 0, 1
+    )
+    img = img.reduce(factor)
+    reduced = bytearray(img.tobytes())
+    return np.frombuffer(reduced, dtype=np.uint8).reshape(
+        img.height, img.width, 4
+    )
+
+
+def pil_to_bgra(img: Image.Image):
+    """PIL image -> (h, w, 4) BGRA array, packed by PIL's raw encoder"""
+    if img.mode not in ("RGB", "RGBX"):
+        # L, CMYK (adobe inversion handled by PIL); RGBA has no BGRX packer
+        img = img.convert("RGB")
+    width, height = img.size
+    raw = bytearray(img.tobytes("raw", "BGRX"))
+    pixels = np.frombuffer(raw, dtype=np.uint8).reshape(height, width, 4)
+    pixels[:, :, 3] = 255
+    return pixels
+
+
+def decode_jpeg(data: bytes, target_size: tuple[int, int] | None = None):
+    """decode a DCT stream to a BGRA array.
+
+    with `target_size` (device pixels) libjpeg is asked to decode at the
+    smallest 1/2, 1/4 or 1/8 scale that still covers it, so large scans
+    drawn small are never decoded at full resolution. the result may
+    therefore be smaller than the size stored in the image dictionary.
+    """
+    img = Image.open(io.BytesIO(data))
+    if target_size is not None:
+        tw, th = target_size
+        if tw < img.width and th < img.height:
+            img.draft(img.mode, (max(int(tw), 1), max(int(th), 1)))
+    return pil_to_bgra(img)
+
+
+# ****************** gray (A8) targets ************************
+
+
+def bgra_to_ink(pixels: np.ndarray) -> np.ndarray:
+    """(h, w, 4) premultiplied BGRA -> (h, w) uint8 ink coverage, as drawn
+    into the A8 pages of `BaseRenderer.gray`: how much darker than white
+    paper the pixel makes the page (alpha - luminance)"""
+    bgr = pixels[:, :, :3].astype(np.uint16)
+    luma = (bgr[:, :, 0] * 29 + bgr[:, :, 1] * 150 + bgr[:, :, 2] * 77) >> 8
+    alpha = pixels[:, :, 3].astype(np.int16)
+    return np.clip(alpha - luma.astype(np.int16), 0, 255).astype(np.uint8)
@@ -1,39 +1,54 @@
 class PdfOperator:
+    """a single content stream operator.
+
+    kept as small as possible since one is created for every operator of
+    every stream: the operator name, its integer opcode (see `OPCODES`)
+    and the operands as a tuple. the human readable explanation is only
+    built on demand (debug output / `__str__`).
+    """
+
+    __slots__ = ("name", "opcode", "args")
 
     NEED_SCALING = 0x01
     NEED_TRANSLATION = 0x02
 
-    def __init__(self, op_name, arguements: list):
+    def __init__(self, op_name, arguements: tuple | list, opcode=None):
         self.name = op_name
+        self.opcode = (
+            opcode if opcode is not None else self.OPCODES.get(op_name, -1)
+        )
         self.args = arguements
 
-        args_string = list(map(str, arguements))
-        context = {f"operands{i}": str(op) for i, op in enumerate(arguements)}
-        context["operands"] = ", ".join(args_string)
-        explaination = self.OPERATORS.get(op_name)
-        # if explaination:  # print(context)
+    @property
+    def explaination(self):
+        explaination = self.OPERATORS.get(self.name)
         try:
-            # print(explaination)
-            self.explaination = explaination % context
+            return explaination % self._get_context(self.args)
         except Exception as e:
             print("ERROR: while parsing operator")
-            print(op_name, arguements, "\n\n")
+            print(self.name, self.args, "\n\n")
             raise ValueError(e)
 
+    @staticmethod
+    def _get_context(args):
+        context = {f"operands{i}": str(op) for i, op in enumerate(args)}
+        context["operands"] = ", ".join(map(str, args))
+        return context
+
     def get_explanation(self, *args):
 
-        args_string = list(map(str, args))
-        context = {f"operands{i}": str(op) for i, op in enumerate(args)}
-        context["operands"] = ", ".join(args_string)
         explaination = PdfOperator.OPERATORS.get(self.name)
         if explaination:
-            return explaination % context
+            return explaination % self._get_context(args)
 
         return "Operator not found"
 
     def __str__(self):
         return f"{self.name} // {self.explaination}"
 
+    def __repr__(self):
+        return f"PdfOperator({self.name!r}, {self.args!r})"
+
     def get_modification_flags(self):
         flag = 0
         if self.name in {
@@ -122,6 +137,7 @@ class PdfOperator:
             "/CS": "Set color space [colorSpace=%(operands)s] (name or array)",
             "/F": "Set filter [filter=%(operands)s] (name or array)",
             "/D": "D=Decode, Unkown operator  [filter=%(operands)s]",
+            "/I": "Set image interpolation [interpolate=%(operands)s] (true or false)",
             "/DP": " Unkown operator  [filter=%(operands)s]",
         }
 
@@ -272,3 +288,7 @@ class PdfOperator:
         | PATH_OPERATORS_SET
         | INLINE_IMAGE_OPERATORS_SET
     )
+
+    # integer opcodes, stable for the lifetime of the process
+    NAMES = tuple(sorted(OPERATORS.keys()))
+    OPCODES = {name: code for code, name in enumerate(NAMES)}
@@ -1,12 +1,17 @@
 import string
+from math import hypot
 from .pdf_encoding import PdfEncoding as pnc
 
 
 from .pdf_operator import PdfOperator
 from .engine_state import EngineState
+from .pdf_image import bgra_to_ink
+from .pdf_utils import write_surface_to_png
 import cairo
 from cairo import Context, Glyph, ImageSurface, Matrix
+import numpy as np
 import os
+import sys
 from detectors.core_detectors import BaseDetector
 from models.core_models import SymSequence, Symbol
 
@@ -15,11 +20,173 @@ SEP = os.path.sep
 doty = -30
 
 
+# ****************** pixel arrays -> surfaces ************************
+# the arrays are built by `pdf_image`, which does not depend on cairo
+
+
+def bgra_to_surface(pixels: np.ndarray) -> cairo.ImageSurface:
+    """wrap a (h, w, 4) uint8 BGRA array in an ARGB32 surface (no copy);
+    the array must stay alive as long as the surface is used"""
+    height, width, _ = pixels.shape
+    stride = cairo.ImageSurface.format_stride_for_width(
+        cairo.FORMAT_ARGB32, width
+    )
+    if stride != width * 4:
+        padded = np.zeros((height, stride // 4, 4), dtype=np.uint8)
+        padded[:, :width] = pixels
+        pixels = padded
+    if sys.byteorder == "big":
+        pixels = pixels[:, :, ::-1]  # A, R, G, B
+    pixels = np.ascontiguousarray(pixels)
+    return cairo.ImageSurface.create_for_data(
+        memoryview(pixels).cast("B"),
+        cairo.FORMAT_ARGB32,
+        width,
+        height,
+        stride,
+    )
+
+
+def ink_to_surface(ink: np.ndarray) -> cairo.ImageSurface:
+    """wrap a (h, w) uint8 array in an A8 surface (no copy, unless rows
+    have to be padded); same lifetime rule as `bgra_to_surface`"""
+    height, width = ink.shape
+    stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_A8, width)
+    if stride != width:
+        padded = np.zeros((height, stride), dtype=np.uint8)
+        padded[:, :width] = ink
+        ink = padded
+    ink = np.ascontiguousarray(ink)
+    return cairo.ImageSurface.create_for_data(
+        memoryview(ink).cast("B"),
+        cairo.FORMAT_A8,
+        width,
+        height,
+        stride,
+    )
+
+
 class BaseRenderer:
 
     O_CLEAN_DOTS_LINES = 1 << 1
     O_CLEAN_HEADER_FOOTER = 1 << 2
 
+    # honours `band` (see `initialize`)
+    SUPPORTS_BAND = True
+    # honours `gray` (see `paint_ink`)
+    SUPPORTS_GRAY = True
+    # False for renderers that never draw glyphs (see SymbolRenderer)
+    LOAD_FONT_FACES = True
+    DRAW_IMAGES = True
+
+    # ****************** operator table ************************
+    # operator -> (method name, *extra args); merged with
+    # `EngineState.OPERATOR_HANDLERS` into `DISPATCH` by `compile_dispatch`
+    OPERATOR_HANDLERS = {
+        "TJ": ("draw_string_array",),
+        "Tj": ("draw_string",),
+        "'": ("draw_string",),
+        '"': ("draw_string",),
+        "m": ("move_line_to",),
+        "l": ("draw_line_to",),
+        "y": ("draw_bezier_y_v",),
+        "v": ("draw_bezier_y_v", False),
+        "c": ("curve_to",),
+        "re": ("draw_rectangle",),
+        "f": ("fill_path",),
+        "f*": ("fill_path", False, True),
+        "S": ("stroke_path",),
+        "s": ("stroke_path", False, True),
+        "B": ("fill_and_stroke", False, False),
+        "B*": ("fill_and_stroke", False, True),
+        "b": ("fill_and_stroke", True, False),
+        "b*": ("fill_and_stroke", True, True),
+        "W": ("clip_path", False),
+        "W*": ("clip_path", True),
+        "h": ("close_path",),
+        "ID": ("draw_inline_image",),
+        "n": ("end_path",),
+        "q": ("save_state",),
+        "Q": ("restore_state",),
+        "ET": ("end_text",),
+        "BDC": ("ignore_operator",),  # not relevant
+        "EMC": ("ignore_operator",),  # not relevant
+        "i": ("ignore_operator",),  # not supported by cairo
+    }
+
+    # operators after which cairo's CTM has to follow the state matrix
+    SYNC_MATRIX_OPERATORS = frozenset(
+        ["Tm", "cm", "BT", "ET", "Q", "Td", "TD", "T*", "'", '"', "Tz", "Ts", "Tf"]
+    )
+
+    # text showing operators (used for counting / max_show)
+    TEXT_SHOW_OPCODES = frozenset(
+        PdfOperator.OPCODES[op] for op in ["Tj", "TJ", "'", '"']
+    )
+
+    DISPATCH: dict = {}
+
+    @classmethod
+    def compile_dispatch(cls, state_cls=EngineState):
+        """build the opcode -> handler table shared by all instances.
+
+        every handler has the signature `handler(renderer, cmd)` and runs,
+        in this order, the state update, the matrix sync and the cairo call
+        of its operator; the return value is the one of the state method
+        (or of the renderer method when the state does not handle it).
+        """
+
+        def bind(owner, entry):
+            if entry is None:
+                return None
+            func = getattr(owner, entry[0])
+            extra = entry[1:]
+            if not extra:
+                return func
+            return lambda obj, cmd: func(obj, cmd, *extra)
+
+        def compose(state_func, sync, render_func):
+            if state_func and not sync and not render_func:
+                return lambda r, cmd: state_func(r.state, cmd)
+            if render_func and not state_func and not sync:
+                return render_func
+
+            def handler(r, cmd):
+                result = None
+                if state_func:
+                    result = state_func(r.state, cmd)
+                if sync:
+                    r.sync_matrix()
+                if render_func:
+                    render_result = render_func(r, cmd)
+                    if result is None:
+                        result = render_result
+                return result
+
+            return handler
+
+        dispatch = {}
+        names = (
+            set(state_cls.OPERATOR_HANDLERS)
+            | set(cls.OPERATOR_HANDLERS)
+            | cls.SYNC_MATRIX_OPERATORS
+        )
+        for name in names:
+            opcode = PdfOperator.OPCODES.get(name)
+            if opcode is None:
+                raise Exception(f"unknown operator in dispatch table: {name}")
+            dispatch[opcode] = compose(
+                bind(state_cls, state_cls.OPERATOR_HANDLERS.get(name)),
+                name in cls.SYNC_MATRIX_OPERATORS,
+                bind(cls, cls.OPERATOR_HANDLERS.get(name)),
+            )
+        cls.DISPATCH = dispatch
+        return dispatch
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.compile_dispatch()
+
     def __init__(
         self,
         state: EngineState,
@@ -37,63 +204,16 @@ class BaseRenderer:
         self.page_number = -1
         self.detector_list: list[BaseDetector] = detector_lists
         self.output = None
+        # (y0, y1) in device pixels: render only that vertical band
+        self.band: tuple[float, float] | None = None
+        # device y-ranges of everything painted on the page, used to
+        # segment pages without scanning pixels (GeometryGapsSegments)
+        self.drawn_extents: list[tuple[float, float]] = []
+        # draw into an A8 surface (ink coverage) instead of ARGB32
+        self.gray = False
+        # set when a gray page used a non gray color or an image
+        self.needs_color = False
 
-        self.functions_map = {
-            "TJ": self.draw_string_array,
-            "Tj": self.draw_string,
-            "'": self.draw_string,
-            '"': self.draw_string,
-            "m": self.move_line_to,
-            "l": self.draw_line_to,
-            "y": self.draw_bezier_y_v,
-            "v": lambda x: self.draw_bezier_y_v(x, is_y_type=False),
-            "c": self.curve_to,
-            "re": self.draw_rectangle,
-            "f": self.fill_path,
-            "f*": lambda x: self.fill_path(x, False, True),
-            "S": self.stroke_path,
-            "s": lambda x: self.stroke_path(x, False, True),
-            "B": lambda x: self.fill_and_stroke(x, False, False),
-            "B*": lambda x: self.fill_and_stroke(x, False, True),
-            "b": lambda x: self.fill_and_stroke(x, True, False),
-            "b*": lambda x: self.fill_and_stroke(x, True, True),
-            "W": lambda x: self.clip_path(x, False),
-            "W*": lambda x: self.clip_path(x, True),
-            "h": self.close_path,
-            "ID": self.draw_inline_image,
-            # "W": self.draw_clip,
-            "n": self.end_path,
-            "q": self.save_state,
-            "Q": self.restore_state,
-            # "EI": self.test_surface_paint,
-            # Existing operators...
-            "ET": self.end_text,
-            "BDC": lambda x: ("", True),  # not relevant
-            "EMC": lambda x: ("", True),  # not relevant
-            "i": lambda x: ("", True),  # not supported by cairo
-        }
-
-        self.sync_functions_map = [
-            #     ( [ "cs", "CS", "k", "K", "g", "G", "rg", "RG", "sc", "SC", "scn", "SCN", ], self.sync_color,),
-            (
-                [
-                    "Tm",
-                    "cm",
-                    "BT",
-                    "ET",
-                    "Q",
-                    "Td",
-                    "TD",
-                    "T*",
-                    "'",
-                    '"',
-                    "Tz",
-                    "Ts",
-                    "Tf",
-                ],
-                self.sync_matrix,
-            )
-        ]
         self.RT_MAP = {
             0: lambda x: self.fill_path(None),
             1: lambda x: self.stroke_path(
@@ -116,16 +236,33 @@ class BaseRenderer:
         self.page_number = page
         self.footer_y = height * 0.93
         self.header_y = height * 0.065
-        self.surface = cairo.ImageSurface(
-            cairo.FORMAT_ARGB32, self.width, self.height
-        )
+        fmt = cairo.FORMAT_A8 if self.gray else cairo.FORMAT_ARGB32
+        if self.band is None:
+            self.surface = cairo.ImageSurface(fmt, self.width, self.height)
+        else:
+            # only rows y0..y1 of the page get pixels: the device origin is
+            # moved to y0, everything outside is clipped away
+            y0, y1 = self.band
+            self.surface = cairo.ImageSurface(
+                fmt, self.width, max(round(y1 - y0), 1)
+            )
+            self.surface.set_device_offset(0, -y0)
         # self.surface.set_device_scale(3.0, 3.0)  # Doubles the effective resolution
         self.ctx = cairo.Context(self.surface)
-        self.ctx.set_source_rgb(1, 1, 1)  # White
-        self.ctx.paint()
+        if self.band is not None:
+            self.ctx.rectangle(0, self.band[0], self.width, y1 - y0)
+            self.ctx.clip()
+        if not self.gray:  # A8 surfaces start without ink, i.e. white
+            self.ctx.set_source_rgb(1, 1, 1)  # White
+            self.ctx.paint()
         self.ctx.set_source_rgb(0, 0, 0)  # Black
         pass
 
+    def is_outside_band(self, y_min: float, y_max: float) -> bool:
+        """True if device rows y_min..y_max are not part of the band"""
+        band = self.band
+        return band is not None and (y_max < band[0] or y_min > band[1])
+
     def close_path(self, _: PdfOperator):
         """Close the current subpath"""
         self.ctx.close_path()
@@ -266,8 +403,14 @@ class BaseRenderer:
 
         # if self.mode == 1:
         self.run_detectors(char_seq)
-
-        if not self.state.font.is_type3:
+        if self.state.text_rendering_mode % 4 != 3 and not self.is_invisible(
+            self.state.fill_color, self.state.fill_alpha
+        ):
+            self.add_text_extent(char_seq)
+
+        if not self.state.font.is_type3 and not (
+            self.band is not None and self.is_sequence_outside_band(char_seq)
+        ):
             self.draw_glyph_array(glyph_array)
         update_text_position()
         # if self.output:
@@ -281,6 +424,48 @@ class BaseRenderer:
             True,
         )
 
+    def is_sequence_outside_band(self, char_seq: SymSequence):
+        # symbols sit on the baseline, allow a glyph height above and below
+        ys = [sym.y for sym in char_seq]
+        margin = 2 * max(abs(sym.h) for sym in char_seq)
+        return self.is_outside_band(min(ys) - margin, max(ys) + margin)
+
+    # ****************** drawn extents ************************
+
+    # glyph outlines are not known in detection only runs (no font faces),
+    # text is assumed to reach this far above / below its baseline, in em
+    TEXT_ASCENT = 0.8
+    TEXT_DESCENT = 0.25
+
+    def is_invisible(self, color, alpha):
+        # white paint on the white page does not count as content
+        return alpha == 0 or min(color[:3]) >= 0.99
+
+    def add_text_extent(self, char_seq: SymSequence):
+        m = self.state.get_current_matrix()
+        up = m.transform_distance(0, -self.state.font_size)[1]
+        ascent, descent = up * self.TEXT_ASCENT, -up * self.TEXT_DESCENT
+        ys = [sym.y for sym in char_seq]
+        self.drawn_extents.append(
+            (min(ys) + min(ascent, descent), max(ys) + max(ascent, descent))
+        )
+
+    def add_path_extent(self, line_width: float = 0):
+        """extent of the current path, widened by half the line width"""
+        ctx = self.ctx
+        pad = 0
+        if line_width:
+            pad = hypot(*ctx.user_to_device_distance(line_width, 0)) / 2
+        ctx.save()
+        ctx.identity_matrix()  # extents in device space
+        x0, y0, x1, y1 = ctx.path_extents()
+        ctx.restore()
+        if x1 > x0 or y1 > y0:
+            self.drawn_extents.append((y0 - pad, y1 + pad))
+
+    def add_image_extent(self):
+        self.drawn_extents.append(self.state.get_image_device_y_range())
+
     def run_detectors(self, char_seq: SymSequence):
         for detector in self.detector_list:
             detector.handle_sequence(char_seq, self.page_number)
@@ -310,20 +495,18 @@ class BaseRenderer:
                 face, Matrix(), self.ctx.get_matrix(), option
             )
             self.ctx.set_scaled_font(scaled_font)
-            pass
+            self.ctx.set_font_size(font_size)
         elif font.is_type3:
             """do not do anything !!"""
-            pass
-        else:
+            self.ctx.set_font_size(font_size)
+        elif self.LOAD_FONT_FACES:
             try:
-                cairo_font_face = font.get_cairo_font_face()
-                self.ctx.set_font_face(cairo_font_face)
+                font.set_scaled_font(self.ctx, font_size)
             except Exception as e:
                 pass
                 print(f"Error loading embedded font face: {e}")
                 raise Exception(f"Error loading embedded font face: {e}")
 
-        self.ctx.set_font_size(font_size)
         scaled_font = self.ctx.get_scaled_font()
         default_char_spacing = state.character_spacing
         word_spacing = state.word_spacing
@@ -340,22 +523,11 @@ class BaseRenderer:
                 x -= dx
                 # is_prev_element_number_or_none = True
                 continue
-            elif isinstance(element, str):
-                i = 0
-                while i < len(element):
-                    char = element[i]
-                    if font.is_type0:
-                        # TODO: handle 2 byte as one char , similarly modify the logic for handling symbol
-                        if i == len(element) - 1:
-                            char = "\x00" + char
-                        else:
-                            char = char + element[i + 1]
-                        i += 1
-                    i += 1
-                    glyph_id, char_width, char = self.get_glyph_id_for_char(
-                        char
-                    )
-
+            elif isinstance(element, bytes):
+                for glyph_id, char_width, char in font.get_glyph_infos(
+                    element
+                ):
+                    char_width = state.convert_em_to_ts(char_width)
                     if glyph_id is None:
                         continue
 
@@ -404,52 +576,6 @@ class BaseRenderer:
 
         return glyph_array, SymSequence(char_array), update_on_finish
 
-    def get_glyph_id_for_char(self, char):
-        font = self.state.font
-
-        # +++++++++++++++ for DEBUG ******************
-        # if not is_symbol and not char:  # check for empty match
-        #     return None, None, None
-        # if is_symbol and not symbol:  # check for empty match
-        #     return None, None, None
-        # if font.is_type0:
-        #     if not is_symbol or not symbol or not prev_symbol:
-        #         raise Exception("missing symbol[prev] for composite font")
-        # ************** END DEBUG ********************
-
-        char_code = font.get_char_code_from_match(char)
-        char_width = font.get_char_width_from_code(char_code)
-        glyph_id, glyph_name = font.get_glyph_id_from_char_code(char_code)
-
-        char_uni = None
-        if font.cid_to_unicode:
-            char_uni = font.cid_to_unicode.get(char_code)
-            # print("char_uni", char_uni)
-        elif font.is_type0:
-            # print("WARN: typ0 font without toUnicode map !!")
-            char_uni = chr(char_code)
-            # raise Exception("")
-        if char_width is None:
-            pass
-            print(
-                "is_composite:",
-                font.is_type0,
-                "symbol:",
-                glyph_name,
-                "char: ",
-                char,
-                "glyph_id",
-                glyph_id,
-                "char_code",
-                char_code,
-                "all_widths",
-                font.widths,
-            )
-            raise Exception("char width is None")
-
-        char_width = self.state.convert_em_to_ts(char_width)
-        return glyph_id, char_width, (char_uni or char)
-
     def draw_glyph_array_old(self, glyph_array):
         self.ctx.save()
         try:
@@ -469,6 +595,8 @@ class BaseRenderer:
                 for g, width in glyph_array:
                     if font.is_type3:
                         print("inside type3 rendering")
+                        # glyphs come as opaque ARGB32 images
+                        self.needs_color = True
                         recorder = font.get_glyph_for_type3(
                             g.index, self.state.fill_color
                         )
@@ -542,26 +670,42 @@ class BaseRenderer:
         self, cmd: PdfOperator, preserve: bool = False, even_odd=False
     ) -> None:
         """Fill the current path using Cairo."""
+        # glyph outlines come without cmd (RT_MAP), see add_text_extent
+        if cmd is not None and not self.is_invisible(
+            self.state.fill_color, self.state.fill_alpha
+        ):
+            self.add_path_extent()
         if even_odd:
             fill_rule = cairo.FILL_RULE_EVEN_ODD
             self.ctx.set_fill_rule(fill_rule)
 
         # self.ctx.set_source_rgb(*self.state.fill_color)
-        self.ctx.set_source_rgba(*self.state.fill_color, self.state.fill_alpha)
-        if preserve:
-            self.ctx.fill_preserve()
+        if self.gray:
+            self.paint_ink(
+                True, preserve, self.state.fill_color, self.state.fill_alpha
+            )
         else:
-            self.ctx.fill()
+            self.ctx.set_source_rgba(
+                *self.state.fill_color, self.state.fill_alpha
+            )
+            if preserve:
+                self.ctx.fill_preserve()
+            else:
+                self.ctx.fill()
         if even_odd:
             self.ctx.set_fill_rule(cairo.FILL_RULE_WINDING)
         return "", True
 
     def stroke_path(
-        self, _: PdfOperator, preserve: bool = False, close: bool = False
+        self, cmd: PdfOperator, preserve: bool = False, close: bool = False
     ) -> None:
         """Draw a line using Cairo."""
         if self.ctx is None:
             raise ValueError("Renderer is not initialized")
+        if cmd is not None and not self.is_invisible(
+            self.state.stroke_color, self.state.stroke_alpha
+        ):
+            self.add_path_extent(self.state.line_width)
         # effective_width = self.state._get_effective_line_width()
         # self.ctx.set_line_width(effective_width)
         self.ctx.set_line_width(self.state.line_width)
@@ -577,13 +721,56 @@ class BaseRenderer:
         self.ctx.set_miter_limit(self.state.miter_limit)
         if close:
             self.ctx.close_path()
-        if preserve:
+        if self.gray:
+            self.paint_ink(
+                False, False, self.state.stroke_color, self.state.stroke_alpha
+            )
+        elif preserve:
             self.ctx.stroke_preserve()
             self.ctx.new_path()
         else:
             self.ctx.stroke()
         return "", True
 
+    # ****************** gray pages ************************
+    # with `gray` the page is drawn into an A8 surface holding the ink
+    # coverage (0 = white paper, 255 = black), a quarter of the memory of
+    # ARGB32. colors are drawn by their luminance, images by their
+    # darkness (`bgra_to_ink`); `needs_color` tells the engine that the
+    # page was not black and white only (see `PdfEngine.color_mode`).
+
+    def get_ink(self, color) -> float:
+        r, g, b = color[:3]
+        if abs(r - g) > 1e-3 or abs(g - b) > 1e-3:
+            self.needs_color = True
+        return 1.0 - (0.299 * r + 0.587 * g + 0.114 * b)
+
+    def paint_ink(self, fill: bool, preserve: bool, color, alpha: float):
+        """fill / stroke the current path into the A8 surface. A8 has no
+        white, so a light paint first removes the coverage below it
+        (DEST_OUT) and then adds its own ink (ADD); for black this is the
+        same as OVER, which is done in one pass"""
+        ctx = self.ctx
+        paint = ctx.fill_preserve if fill else ctx.stroke_preserve
+        ink = min(max(self.get_ink(color), 0.0), 1.0) * alpha
+        if ink >= alpha:
+            passes = [(cairo.Operator.OVER, alpha)]
+        elif ink <= 0:
+            passes = [(cairo.Operator.DEST_OUT, alpha)]
+        else:
+            passes = [
+                (cairo.Operator.DEST_OUT, alpha),
+                (cairo.Operator.ADD, ink),
+            ]
+        operator = ctx.get_operator()
+        for op, source_alpha in passes:
+            ctx.set_operator(op)
+            ctx.set_source_rgba(0, 0, 0, source_alpha)
+            paint()
+        ctx.set_operator(operator)
+        if not preserve:
+            ctx.new_path()
+
     def move_line_to(self, cmd: PdfOperator):
         x, y = cmd.args
         self.ctx.move_to(x, y)
@@ -610,132 +797,29 @@ class BaseRenderer:
         )
 
     def draw_inline_image(self, cmd: PdfOperator):
-        color_cs = self.state.inline_image_color_space
-        bits_per_component = self.state.inline_image_bits_per_component
-
-        if bits_per_component > 1 and color_cs not in self.state.DEVICE_CS:
-            print("trying to draw image with non-spported color-spcae")
+        self.add_image_extent()
+        # the pixel array backs the surface, it has to outlive `paint`
+        pixels = self.state.decode_image_pixels()
+        if pixels is None:
             return "", True
-            raise Exception(
-                "trying to draw image with non-spported color-spcae"
-            )
-        data = self.state.inline_image_data
-        width = self.state.inline_image_width
-        height = self.state.inline_image_height
-        # is_mask = self.state.inline_image_mask
-
-        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
-        surface_data = surface.get_data()
-        stride = surface.get_stride()
-
-        if bits_per_component == 1:
-            # print("is 1 bit")
-            fill_color = self.state.fill_color
-            r, g, b = [int(c) for c in fill_color]
-
-            for y in range(height):
-                for x in range(width):
-                    byte_index = (y * width + x) // 8
-                    bit_index = 7 - ((y * width + x) % 8)
-
-                    if byte_index < len(data):
-                        bit_value = (data[byte_index] >> bit_index) & 1
-                        idx = y * stride + x * 4
-
-                        if bit_value == 0:  # Black pixel
-                            surface_data[idx] = b  # Blue
-                            surface_data[idx + 1] = g  # Green
-                            surface_data[idx + 2] = r  # Red
-                            surface_data[idx + 3] = 255  # Alpha
-                        else:
-                            surface_data[idx] = 0  # Blue
-                            surface_data[idx + 1] = 0  # Green
-                            surface_data[idx + 2] = 0  # Red
-                            surface_data[idx + 3] = 0  # Alpha (transparent)
+        if self.gray:
+            self.needs_color = True
+            pixels = bgra_to_ink(pixels)
+            surface = ink_to_surface(pixels)
         else:
-            # Handle regular image case
-
-            bytes_per_pixel = bits_per_component // 8
-
-            if bytes_per_pixel == 0:
-                bytes_per_pixel = 1
-
-            for y in range(height):
-                for x in range(width):
-                    idx_out = y * stride + x * 4
-                    idx_in = (y * width + x) * bytes_per_pixel
-
-                    if idx_in + bytes_per_pixel <= len(data):
-                        # Read pixel value based on bits_per_component
-                        if (
-                            bits_per_component <= 8
-                        ):  # assume that its always == 8 (< 8 not supported)
-                            if color_cs == "/DeviceGray":
-                                pixel = data[idx_in]
-                                pixel = (pixel * 255) // (
-                                    (1 << bits_per_component) - 1
-                                )
-                                surface_data[idx_out] = pixel  # Blue
-                                surface_data[idx_out + 1] = pixel  # Green
-                                surface_data[idx_out + 2] = pixel  # Red
-                                surface_data[idx_out + 3] = 255  # Alpha
-                            elif color_cs == "/DeviceRGB":
-                                # TODO: extract the 3 values r,g,b from the single byte
-                                pass
-
-                            elif color_cs == "/DeviceCMYK":
-                                # TODO: extract the 4 values c,m,y,k from the single byte
-                                pass
-
-                            else:
-                                raise Exception("Why are you here !!!")
-                        else:
-                            if color_cs == "/DeviceGray":
-                                raise Exception("Why are you here !!!")
-                            else:
-                                r = data[idx_in]
-                                g = (
-                                    data[idx_in + 1]
-                                    if idx_in + 1 < len(data)
-                                    else self.raise_exception(
-                                        "missing g/m value"
-                                    )
-                                )
-                                b = (
-                                    data[idx_in + 2]
-                                    if idx_in + 2 < len(data)
-                                    else self.raise_exception(
-                                        "missing b/y value"
-                                    )
-                                    # else 0
-                                )
-                                if color_cs == "/DeviceRGB":
-                                    surface_data[idx_out] = b  # Blue
-                                    surface_data[idx_out + 1] = g  # Green
-                                    surface_data[idx_out + 2] = r  # Red
-                                    surface_data[idx_out + 3] = 255  # Alpha
-                                elif color_cs == "/DeviceCMYK":
-                                    pass
-                                    # c, m, y = r, g, b
-                                    # k = (
-                                    #     data[idx_in + 3]
-                                    #     if idx_in + 3 < len(data)
-                                    #     else self.raise_exception(
-                                    #         "missing k value"
-                                    #     )
-                                    # )
-
-                    else:
-                        raise Exception("Exceeded image boundaries !!")
+            surface = bgra_to_surface(pixels)
         surface.mark_dirty()
+        height, width = pixels.shape[:2]
 
-        x, y = self.state.position
-
-        # self.ctx.save()
-        self.ctx.translate(x, y)
+        self.ctx.save()
+        # images fill the unit square of the CTM, first row at the top
+        self.ctx.set_matrix(self.state.get_current_matrix())
+        self.ctx.translate(0, 1)
+        self.ctx.scale(1 / width, -1 / height)
         self.ctx.set_source_surface(surface, 0, 0)
         source = self.ctx.get_source()
         source.set_filter(cairo.FILTER_FAST)
+        source.set_extend(cairo.EXTEND_PAD)
 
         # Other options:
         # cairo.FILTER_FAST - A high-performance filter
@@ -745,8 +829,10 @@ class BaseRenderer:
         # cairo.FILTER_BILINEAR - Linear interpolation in two dimensions
         # cairo.FILTER_GAUSSIAN - Gaussian convolution filter
 
-        self.ctx.paint()
-        # self.ctx.restore()
+        self.ctx.new_path()
+        self.ctx.rectangle(0, 0, width, height)
+        self.ctx.fill()
+        self.ctx.restore()
         surface.finish()
 
         return "", True
@@ -772,20 +858,141 @@ class BaseRenderer:
         pass
 
     def execute_command(self, cmd: PdfOperator):
-        for ops, sfunc in self.sync_functions_map:
-            if cmd.name in ops:
-                sfunc(cmd.name)
-        func = self.functions_map.get(cmd.name)
-        if func:
-            return func(cmd)
-        else:
+        handler = self.DISPATCH.get(cmd.opcode)
+        if handler is None:
             return "", False
+        return handler(self, cmd), True
+
+    def ignore_operator(self, _: PdfOperator):
+        return "", True
 
     def save_to_png(self, filename: str) -> None:
         """Save the rendered content to a PNG file."""
         if self.surface is None:
             raise ValueError("Renderer is not initialized")
-        self.surface.write_to_png(filename)
+        write_surface_to_png(self.surface, filename)
         # open_image_in_irfan(filename)
         # input("Press Enter to continue...")
         # kill_with_taskkill()
+
+
+BaseRenderer.compile_dispatch()
+
+
+class SymbolRenderer(BaseRenderer):
+    """detection only renderer: runs the state machine and the glyph
+    positioning, so detectors get the same `SymSequence`s as with
+    `BaseRenderer`, but paints nothing.
+
+    glyphs, fills, strokes and images are dropped (paths are still built,
+    their extents recorded and discarded, clipping is kept), the cairo
+    context lives on a 1x1 surface, cairo font faces are never loaded and
+    images are not decoded (`EngineState.skip_images`)."""
+
+    SUPPORTS_BAND = False
+    SUPPORTS_GRAY = False
+    LOAD_FONT_FACES = False
+    DRAW_IMAGES = False
+
+    def initialize(self, width: int, height: int, page: int) -> None:
+        self.width = width
+        self.height = height
+        for detector in self.detector_list:
+            detector.attach(width, height, page)
+        self.page_number = page
+        self.footer_y = height * 0.93
+        self.header_y = height * 0.065
+        self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1)
+        self.ctx = cairo.Context(self.surface)
+
+    def draw_glyph_array(self, glyph_array: list[Glyph]):
+        pass
+
+    def fill_path(
+        self, cmd: PdfOperator, preserve: bool = False, even_odd=False
+    ) -> None:
+        if cmd is not None and not self.is_invisible(
+            self.state.fill_color, self.state.fill_alpha
+        ):
+            self.add_path_extent()
+        if not preserve:
+            self.ctx.new_path()
+        return "", True
+
+    def stroke_path(
+        self, cmd: PdfOperator, preserve: bool = False, close: bool = False
+    ) -> None:
+        if cmd is not None and not self.is_invisible(
+            self.state.stroke_color, self.state.stroke_alpha
+        ):
+            self.add_path_extent(self.state.line_width)
+        self.ctx.new_path()
+        return "", True
+
+    def draw_inline_image(self, cmd: PdfOperator):
+        self.add_image_extent()
+        return "", True
+
+    def save_to_png(self, filename: str) -> None:
+        raise ValueError("SymbolRenderer does not produce an image")
+
+
+class RecordingRenderer(BaseRenderer):
+    """draws into a cairo RecordingSurface: the page is recorded once as
+    vector commands and can be replayed at any scale with `replay`"""
+
+    SUPPORTS_BAND = False
+    SUPPORTS_GRAY = False
+
+    def initialize(self, width: int, height: int, page: int) -> None:
+        self.width = width
+        self.height = height
+        for detector in self.detector_list:
+            detector.attach(width, height, page)
+        self.page_number = page
+        self.footer_y = height * 0.93
+        self.header_y = height * 0.065
+        self.surface = cairo.RecordingSurface(
+            cairo.CONTENT_COLOR_ALPHA, cairo.Rectangle(0, 0, width, height)
+        )
+        self.ctx = cairo.Context(self.surface)
+        self.ctx.set_source_rgb(1, 1, 1)  # White
+        self.ctx.paint()
+        self.ctx.set_source_rgb(0, 0, 0)  # Black
+
+    def replay(self, factor: float = 1.0) -> ImageSurface:
+        """rasterize the recording, `factor` relative to the scale it was
+        recorded at"""
+        surface = cairo.ImageSurface(
+            cairo.FORMAT_ARGB32,
+            max(round(self.width * factor), 1),
+            max(round(self.height * factor), 1),
+        )
+        ctx = cairo.Context(surface)
+        ctx.scale(factor, factor)
+        ctx.set_source_surface(self.surface, 0, 0)
+        ctx.paint()
+        surface.flush()
+        return surface
+
+    def save_to_png(self, filename: str) -> None:
+        self.replay().write_to_png(filename)
+
+
+# ****************** backends ************************
+# name -> renderer class, selected per call by PdfEngine
+RENDERER_BACKENDS: dict[str, type[BaseRenderer]] = {
+    "image": BaseRenderer,
+    "recording": RecordingRenderer,
+    "null": SymbolRenderer,
+}
+
+
+def get_renderer_backend(name: str) -> type[BaseRenderer]:
+    backend = RENDERER_BACKENDS.get(name)
+    if backend is None:
+        raise Exception(
+            f"unknown renderer backend {name!r}, "
+            f"expected one of {list(RENDERER_BACKENDS)}"
+        )
+    return backend
@@ -1,278 +1,277 @@
-import pprint
 import re
+from binascii import unhexlify
 from .pdf_operator import PdfOperator
-import string
-import os
-from .pdf_encoding import PdfEncoding as pnc
 
 
 class PDFStreamParser:
+    """single pass lexer for pdf content streams.
+
+    the stream is scanned once from left to right; operands are pushed on
+    an operand stack (arrays and dicts on a container stack) and flushed
+    into a `PdfOperator` as soon as an operator keyword is reached.
+
+    the parser works on the raw `bytes` (or a memoryview of them):
+    names and operators become `str`, literal/hex strings and inline image
+    data stay `bytes` until a font maps them to char codes.
+    """
+
+    WHITE_SPACE = b"\x00\t\n\x0c\r "
+
+    # ****************** token regex ************************
+    # every match skips leading white space and comments, then captures
+    # exactly one token; `lastindex` tells which one.
+
+    T_REGULAR = 1
+    T_NAME = 2
+    T_ARRAY_OPEN = 3
+    T_ARRAY_CLOSE = 4
+    T_DICT_OPEN = 5
+    T_DICT_CLOSE = 6
+    T_HEX = 7
+    T_STRING = 8
+    T_BRACE = 9
+
+    TOKEN_REGEX = re.compile(
+        rb"[\x00\t\n\x0c\r ]*(?:%[^\r\n]*[\x00\t\n\x0c\r ]*)*"
+        rb"(?:"
+        rb"([^\x00\t\n\x0c\r ()<>\[\]{}/%]+)"  # 1 regular (number/keyword)
+        rb"|(/[^\x00\t\n\x0c\r ()<>\[\]{}/%]*)"  # 2 name
+        rb"|(\[)"  # 3
+        rb"|(\])"  # 4
+        rb"|(<<)"  # 5
+        rb"|(>>)"  # 6
+        rb"|<([0-9a-fA-F\x00\t\n\x0c\r ]*)>"  # 7 hex string
+        rb"|(\()"  # 8 literal string
+        rb"|([{}])"  # 9 ignored (postscript calculator braces)
+        rb"|$)"
+    )
+    STRING_SPECIAL_REGEX = re.compile(rb"[()\\]")
+    STRING_ESCAPE_REGEX = re.compile(
+        rb"\\(?:([0-7]{1,3})|(\r\n?|\n)|(.))", re.S
+    )
+    HEX_SPACE_REGEX = re.compile(rb"[\x00\t\n\x0c\r ]+")
+    NAME_ESCAPE_REGEX = re.compile(rb"#([0-9a-fA-F]{2})")
+    INLINE_IMAGE_END_REGEX = re.compile(
+        rb"[\x00\t\n\x0c\r ]EI(?=[\x00\t\n\x0c\r ()<>\[\]{}/%]|$)"
+    )
+    NUMBER_START = frozenset(b"0123456789+-.")
+
+    STRING_ESCAPES = {
+        b"n": b"\n",
+        b"r": b"\r",
+        b"t": b"\t",
+        b"b": b"\b",
+        b"f": b"\f",
+        b"(": b"(",
+        b")": b")",
+        b"\\": b"\\",
+    }
+
+    KEYWORDS = {b"true": True, b"false": False, b"null": None}
+    OPERATOR_NAMES = {
+        op.encode("latin1"): (op, PdfOperator.OPCODES[op])
+        for op in PdfOperator.OPERTORS_SET
+    }
+
+    # full length inline image keys are mapped to the abbreviations
+    # handled by EngineState
+    INLINE_IMAGE_KEYS = {
+        "/Width": "/W",
+        "/Height": "/H",
+        "/BitsPerComponent": "/BPC",
+        "/ColorSpace": "/CS",
+        "/Filter": "/F",
+        "/ImageMask": "/IM",
+        "/DecodeParms": "/DP",
+        "/Decode": "/D",
+        "/Interpolate": "/I",
+    }
 
     def __init__(self):
-        OR = "|"
-        NOT_ESCAPE = (
-            r"(?:[^\\]|[^\\](?:\\{2})+|[\\](?=\)\]\s*TJ)|[\\](?=\)\s*Tj))"
-        )
-
-        self.HEX_REGEX = r"<(?P<hex>[0-9a-fA-F]+)>"
-        self.NAME_REGEX = r"(?P<name>/\w+)"
-        self.STRING_REGEX = (
-            r"(?:\((?P<string>(?:.*?" + NOT_ESCAPE + r"))(?:\)))"
-        )
-        self.EMPTY_STRING_REGEX = r"\((?P<stringO>)(?:\))"
-        self.BOOL_REGEX = r"(?P<bool>true|false)"
-        #  r"(?:\((?P<string>(?:.*?[^\\]))(?=\)))|"
-        self.NUMBER_REGEX = r"(?:(?:(?<=[^_\-\n\d\.\w])|^)(?P<number>[\d.]+))|(?P<numberO>-[\d.]+)"
-        self.IMAGE_REGEX = r"(?P<image>ID[\s\S]*?)(?=EI)"
-        self.INLINE_IMAGE_OP_REGEX = (
-            r"(?P<inline>\/(?:W|H|IM|BPC|CS|D|F|DP))(?=\W|$)"  # (?: |^)
-        )
-
-        """
-    <(?P<hex>[0-9a-fA-F]+)>|(?P<name>/\w+)|\((?P<stringO>)(?:\))|(?:\((?P<string>(?:.*?(?:[^\\]|[^\\](?:\\{2})+)))(?:\)))|(?:(?:(?<=[^_\-\n\d\.])|^)(?P<number>(?:-)?[\d.]+))|(?<=ID)(?P<image>[\s\S]*?)(?=EI)
-        """
-        self.PRIMATIVE_REGEX = (
-            self.HEX_REGEX
-            # + OR
-            # + self.INLINE_IMAGE_OP_REGEX
-            + OR
-            + self.NAME_REGEX
-            + OR
-            + self.STRING_REGEX
-            + OR
-            + self.EMPTY_STRING_REGEX
-            + OR
-            + self.BOOL_REGEX
-            + OR
-            + self.NUMBER_REGEX
-            + OR
-            + self.IMAGE_REGEX
-        )
-        self.ARRAY_REGEX = (
-            r"(?:(?:(?<=[^\\])|^)\[(?P<array>[\s\S]*?(?:[^\\]|\\{2})?)\])"
-        )
-
-        # r"(?:(?:(?<=[^\\])|^)\[(?P<array>.*?(?:[^\\]|\\{2})?)\])"
-        # r"(?:(?:(?<=[^\\])|^)\[(?P<array>(?:.*[^\\]))\])"
-        # r"^[^(]*(?:(?:(?<=[^\\])|^)(?P<array>\[(?:.*[^\\])?\]))"
-
-        self.DICT_REGEX = r"\s*<<(?P<obj>.*?)>>"  # (?P<name>/\w+)?
-        self.DICT_CONTENT = (
-            self.NAME_REGEX.replace("name", "key")
-            + r"\s*(?:"
-            + self.ARRAY_REGEX
-            + OR
-            + self.PRIMATIVE_REGEX
-            + ")"
-        )
-        self.TYPES_MAP = {
-            "number": float,
-            "hex": str,
-            "image": str,
-            "string": str,
-            "name": str,
-            "inline": str,
-            "binary": str,
-            "bool": lambda v: True if v == "true" else False,
-        }
-        self.SPLIT_REGEX = r"\s+"  # r"(?:\r\n)|\n| |\s"
-        self.ID_REGEX = r"ARRAY___\d+|DICT___\d+|NUMBER___\d+|STRING___\d+|NAME___\d+|BOOL___\d+|BINARY___\d+|HEX___\d+|IMAGE___\d+"
-        self.INLINE_ID_REGEX = r"INLINE___\d+"
-        self.TRUNCATED_HEX = r"<[0-9a-fA-F]+\s(?=[0-9a-fA-F]+>)"
-
-        # self.INVALID_ESCAPE = re.compile(
-        #     r"(?:[^\\]|^)\\(?![()\\rntb0-7])", re.MULTILINE | re.DOTALL  # f
-        # )
-
-        self.primatives_counter = 0
-        self.arrays_counter = 0
-        self.dict_counter = 0
-        self.variables_dict = {}
-        self.data: str = ""
-        self.tokens = []
+        self.data: bytes | memoryview | None = None
+
+    def parse_stream(self, stream_content: bytes | memoryview):
+        if isinstance(stream_content, str):
+            stream_content = stream_content.encode("latin1")
+        self.data = stream_content
+        return self
 
     def iterate(self):
-        if not self.tokens:
-            raise ValueError("No tokens to parse")
+        if self.data is None:
+            raise ValueError("No stream to parse")
 
-        arguements = []
-        ignore_next = False
+        data = self.data
+        self.data = None
+        end = len(data)
+        match_token = self.TOKEN_REGEX.match
+        operator_names = self.OPERATOR_NAMES
+        keywords = self.KEYWORDS
+        number_start = self.NUMBER_START
 
+        operands = []
+        containers = []  # stack of open arrays / dicts
+        current = operands  # list receiving the next parsed object
         inline_image = False
-        for idx, token in enumerate(self.tokens):
-            if not token:  # or token == ")":
-                continue
-            if ignore_next:
-                ignore_next = False
-                continue
-            if re.match(self.ID_REGEX, token):
-                data = self.variables_dict[token]
+        pos = 0
 
-                if (
-                    "NAME" in token
-                    and inline_image
-                    and re.match(self.INLINE_IMAGE_OP_REGEX, data)
-                ):
-                    if len(arguements) > 0:
-                        print("args = ", arguements)
-                        raise Exception("unhandled args")
-                    cmd = self.variables_dict[token]
-                    args = self.variables_dict[self.tokens[idx + 1]]
-                    command = PdfOperator(cmd, [args])
-                    ignore_next = True
-                    yield command
-                else:
-                    if token.startswith("IMAGE"):
-                        img_data = data.lstrip("\n ")[2:].strip("\r\n")
-                        command = PdfOperator("ID", [img_data])
-                        yield command
-                    else:
-                        arguements.append(data)
-            elif token in PdfOperator.OPERTORS_SET:  # .lstrip() in
-
-                cmd = token  # .lstrip(")")
-                # if cmd == "Tf":
-                #     print(self.tokens[: idx + 3])
-                if cmd == "BI":
-                    inline_image = True
-                elif cmd == "EI" or cmd == "ID":
+        while pos < end:
+            m = match_token(data, pos)
+            if m is None:
+                raise Exception(
+                    f"unexpected character at {pos}" + self._context(data, pos)
+                )
+            kind = m.lastindex
+            if kind is None:
+                break  # trailing white space / comment
+            pos = m.end()
+
+            if kind == self.T_REGULAR:
+                token = m.group(1)
+                if token[0] in number_start:
+                    try:
+                        current.append(float(token))
+                    except ValueError:
+                        raise Exception(
+                            f"invalid number {token!r}"
+                            + self._context(data, pos)
+                        )
+                elif token in keywords:
+                    current.append(keywords[token])
+                elif containers:
+                    raise Exception(
+                        f"operator {token!r} inside array/dict"
+                        + self._context(data, pos)
+                    )
+                elif token == b"ID":
+                    image_data, pos = self._read_inline_image_data(data, pos)
                     inline_image = False
-                command = PdfOperator(cmd, arguements)
-                arguements = []
-                yield command
-            else:
-                print("----", token)
-                mi = max(idx - 10, 0)
-                ma = min(idx + 10, len(self.tokens))
-                token_range = self.tokens[mi:ma]
-                token_resolved = [
-                    (self.variables_dict.get(s) or s) for s in token_range
-                ]
-                print("prev_token", token_resolved)
-                raise Exception("----" + token)
-        self.tokens = []
-
-    def parse_stream(self, stream_content: str):
-        self.variables_dict = {}
-        self.arrays_counter = 0
-        self.dict_counter = 0
-        self.primatives_counter = 0
-        stream_content = stream_content.replace("\\\r", "")
-        stream_content = re.sub(
-            self.TRUNCATED_HEX,
-            lambda m: m.group(0).strip("\n"),  # \r
-            stream_content,
-            flags=re.DOTALL | re.MULTILINE,
-        )
-
-        def replace_primatives_v2(match: re.Match):
-            for p_type, p_value in match.groupdict().items():
-                if p_value is None:
+                    yield PdfOperator("ID", (image_data,))
+                    operands = current = []
                     continue
-
-                self.primatives_counter += 1
-                p_type = p_type.replace("O", "")
-                value = self.TYPES_MAP[p_type](p_value)
-
-                if p_type.startswith("string"):
-                    value = value.replace("\\(", "(").replace("\\)", ")")
-                    value = re.sub(
-                        r"\\([1234567]{3})",
-                        lambda m: pnc.octal_to_char(m.group(1)),
-                        value,
-                        flags=re.DOTALL | re.MULTILINE,
+                elif token in operator_names:
+                    if token == b"BI":
+                        inline_image = True
+                    elif token == b"EI":
+                        inline_image = False
+                    name, opcode = operator_names[token]
+                    yield PdfOperator(name, tuple(operands), opcode)
+                    operands = current = []
+                    continue
+                else:
+                    raise Exception(
+                        "----" + token.decode("latin1") + self._context(data, pos)
                     )
-                elif p_type == "hex":
-                    value = re.sub(
-                        r"([0-9a-fA-F]{2})",
-                        lambda m: pnc.hex_to_char(m.group(1)),
-                        value,
-                        flags=re.DOTALL | re.MULTILINE,
+
+            elif kind == self.T_NAME:
+                name = m.group(2)
+                if b"#" in name:
+                    name = self.NAME_ESCAPE_REGEX.sub(
+                        lambda h: unhexlify(h.group(1)), name
                     )
+                current.append(name.decode("latin1"))
 
-                primative_id = (
-                    f"{p_type.upper()}___{self.primatives_counter:06}"
-                )
-                self.variables_dict[primative_id] = value
-                return f" {primative_id} "
-            return " "
-
-        def replace_array_v2(match: re.Match):
-            p_value = match.group("array")
-            if p_value is None:
-                return ""  # WARN: potential bug
-
-            self.arrays_counter += 1
-            array = []
-            for prim_key in p_value.replace("\n", "").split(" "):
-                if prim_key:  # WARN:
-                    if prim_key in self.variables_dict:
-                        prim_value = self.variables_dict.pop(prim_key)
-                        array.append(prim_value)
-                    else:
-                        print("match = ", match.group("array"))
-                        print("error_key =", prim_key)
-                        raise Exception
-            # print(array)
-            array_id = f"ARRAY___{self.arrays_counter}"
-            self.variables_dict[array_id] = array
-            return f" {array_id} "
-
-        def replace_dict_v2(match: re.Match):
-            p_value = match.group("obj")
-            if p_value is None:
-                return ""  # WARN: potential bug
-            # print(match.group(0))
-            self.dict_counter += 1
-            dict_obj = {}
-            current_Key = None
-            for prim_key in p_value.replace("\n", "").split(" "):
-                if not prim_key:
-                    continue
-                if prim_key not in self.variables_dict:
-                    print("match = ", match.group("obj"))
-                    print("error_key =", prim_key)
-                    raise Exception
-                if current_Key:
-                    dict_obj[current_Key] = self.variables_dict.pop(prim_key)
-                    current_Key = None
+            elif kind == self.T_STRING:
+                value, pos = self._read_literal_string(data, pos)
+                current.append(value)
+
+            elif kind == self.T_HEX:
+                current.append(self._decode_hex(m.group(7)))
+
+            elif kind == self.T_ARRAY_OPEN or kind == self.T_DICT_OPEN:
+                new = []
+                containers.append((kind, current))
+                current = new
+                continue
+
+            elif kind == self.T_ARRAY_CLOSE or kind == self.T_DICT_CLOSE:
+                if not containers:
+                    raise Exception(
+                        "unbalanced array/dict close" + self._context(data, pos)
+                    )
+                open_kind, parent = containers.pop()
+                if (open_kind == self.T_ARRAY_OPEN) != (
+                    kind == self.T_ARRAY_CLOSE
+                ):
+                    raise Exception(
+                        "mismatched array/dict" + self._context(data, pos)
+                    )
+                if kind == self.T_ARRAY_CLOSE:
+                    obj = current
                 else:
-                    current_Key = self.variables_dict.pop(prim_key)
-
-            dict_id = f"DICT___{self.dict_counter}"
-            self.variables_dict[dict_id] = dict_obj
-            return f" {dict_id} "
-
-        stream_content = re.sub(
-            self.PRIMATIVE_REGEX,
-            replace_primatives_v2,
-            stream_content,
-            flags=re.DOTALL | re.MULTILINE,
-        )
-
-        # print(stream_content)
-        # print("\n" * 4)
-        stream_content = re.sub(
-            self.ARRAY_REGEX,
-            replace_array_v2,
-            stream_content,
-            flags=re.DOTALL | re.MULTILINE,
-        )
-
-        # print(stream_content)
-
-        stream_content = re.sub(
-            self.DICT_REGEX,
-            replace_dict_v2,
-            stream_content,
-            flags=re.DOTALL | re.MULTILINE,
-        )
-
-        self.tokens.extend(
-            re.split(
-                self.SPLIT_REGEX,
-                stream_content,
-                flags=re.MULTILINE | re.DOTALL,
-            )
-        )
-        return self
+                    obj = dict(zip(current[::2], current[1::2]))
+                current = parent
+                current.append(obj)
+
+            else:  # T_BRACE
+                continue
+
+            # inline image parameters are emitted as key/value pairs
+            if inline_image and not containers and len(operands) == 2:
+                key, value = operands
+                key = self.INLINE_IMAGE_KEYS.get(key, key)
+                yield PdfOperator(key, (value,))
+                operands = current = []
+
+        if containers:
+            raise Exception("unterminated array/dict at end of stream")
+
+    # ****************** token helpers ************************
+
+    def _read_literal_string(self, data: bytes, pos: int):
+        """`pos` points right after the opening parenthesis"""
+        search = self.STRING_SPECIAL_REGEX.search
+        depth = 1
+        start = pos
+        has_escape = False
+        while True:
+            m = search(data, pos)
+            if m is None:
+                raise Exception("unterminated string" + self._context(data, start))
+            c = m.group()
+            pos = m.end()
+            if c == b"\\":
+                has_escape = True
+                pos += 1
+            elif c == b"(":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    break
+        value = bytes(data[start : pos - 1])
+        if has_escape:
+            value = self.STRING_ESCAPE_REGEX.sub(self._unescape, value)
+        return value, pos
+
+    def _unescape(self, m: re.Match):
+        octal, eol, char = m.groups()
+        if octal:
+            return bytes((int(octal, 8) & 0xFF,))
+        if eol:
+            return b""  # line continuation
+        return self.STRING_ESCAPES.get(char, char)
+
+    def _decode_hex(self, value: bytes):
+        value = self.HEX_SPACE_REGEX.sub(b"", value)
+        if len(value) % 2:
+            value += b"0"
+        return unhexlify(value)
+
+    def _read_inline_image_data(self, data: bytes, pos: int):
+        """`pos` points right after the ID keyword; returns (data, new_pos)
+        where new_pos points to the white space preceding EI"""
+        if data[pos : pos + 2] == b"\r\n":
+            pos += 2
+        elif pos < len(data) and data[pos] in self.WHITE_SPACE:
+            pos += 1
+        m = self.INLINE_IMAGE_END_REGEX.search(data, pos)
+        if m is None:
+            raise Exception("inline image without EI" + self._context(data, pos))
+        image_data = bytes(data[pos : m.start()])
+        if image_data.endswith(b"\r"):
+            image_data = image_data[:-1]
+        return image_data, m.start()
+
+    @staticmethod
+    def _context(data, pos, size=40):
+        return "\nnear: " + repr(bytes(data[max(pos - size, 0) : pos + size]))
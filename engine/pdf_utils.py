@@ -6,6 +6,7 @@ from sys import exc_info
 
 import cairo
 import numpy as np
+from PIL import Image
 
 if os.name == "nt":  # Windows
     d_drive = "D:"
@@ -42,6 +43,47 @@ def _surface_as_uint32(surface: cairo.ImageSurface, y0, y1):
     return array[y0:y1]
 
 
+def _surface_as_uint8(surface: cairo.ImageSurface, y0, y1):
+    """
+    Return a (h, stride) view of an A8 surface, one byte of ink coverage
+    per pixel (0 = nothing drawn, i.e. white paper).
+    """
+    surface.flush()
+    h, stride = surface.get_height(), surface.get_stride()
+    buf = surface.get_data()
+    array = np.frombuffer(buf, dtype=np.uint8).reshape(h, stride)
+    if y1 is None:
+        y1 = len(array) - 1
+    return array[y0:y1]
+
+
+def _surface_as_pixels(surface: cairo.ImageSurface, y0, y1):
+    """`_surface_as_uint8` for A8 surfaces (gray pages, see
+    `BaseRenderer.gray`), `_surface_as_uint32` otherwise"""
+    if surface.get_format() == cairo.FORMAT_A8:
+        return _surface_as_uint8(surface, y0, y1)
+    return _surface_as_uint32(surface, y0, y1)
+
+
+def write_surface_to_png(surface: cairo.ImageSurface, filename: str):
+    """like `surface.write_to_png`, but A8 surfaces are written as 8 bit
+    gray images (cairo would write the coverage itself, i.e. white ink on
+    black paper)"""
+    if surface.get_format() != cairo.FORMAT_A8:
+        surface.write_to_png(filename)
+        return
+    surface.flush()
+    image = Image.frombytes(
+        "L",
+        (surface.get_width(), surface.get_height()),
+        surface.get_data().tobytes(),
+        "raw",
+        "L;I",
+        surface.get_stride(),
+    )
+    image.save(filename, format="png")
+
+
 def concat_cairo_surfaces(surf_dict: dict[str, cairo.ImageSurface]):
     height = sum([s.get_height() for s in surf_dict.values()])
     width = max([s.get_width() for s in surf_dict.values()])
@@ -113,7 +155,7 @@ def crop_image_surface(out_surf: cairo.ImageSurface, y_start, y_end, padding):
     # print(len(data), "vs", surf_height * surf_width * 4)
     out_surf = cairo.ImageSurface.create_for_data(
         data,
-        cairo.FORMAT_ARGB32,
+        o.get_format(),
         surf_width,
         surf_height,
         o.get_stride(),
@@ -0,0 +1,79 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+def array_nbytes(pixels: np.ndarray) -> int:
+    return pixels.nbytes
+
+
+def surface_nbytes(surface) -> int:
+    """memory held by an ImageSurface, or a list / dict of them"""
+    if isinstance(surface, dict):
+        return sum(surface_nbytes(s) for s in surface.values())
+    if isinstance(surface, (list, tuple)):
+        return sum(surface_nbytes(s) for s in surface)
+    if hasattr(surface, "get_stride"):
+        return surface.get_stride() * surface.get_height()
+    return 0  # recording / vector surfaces, negligible
+
+
+class SurfaceCache:
+    """LRU cache of decoded images (BGRA pixel arrays, wrapped by cairo
+    surfaces without copying), bounded by the total size in bytes.
+
+    keys are chosen by the caller, for image XObjects
+    (idnum, generation, reduction factor): the same XObject drawn again at
+    a similar size is decoded once per document. with
+    `sizeof=surface_nbytes` it holds rendered cairo surfaces instead (see
+    `PdfEngine.render_cache`).
+    """
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024, sizeof=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or array_nbytes
+        self.entries: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def get(self, key: tuple) -> np.ndarray | None:
+        pixels = self.entries.get(key)
+        if pixels is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return pixels
+
+    def put(self, key: tuple, pixels: np.ndarray):
+        size = self.sizeof(pixels)
+        # the old value is replaced even if the new one is not kept
+        self.discard(key)
+        if size > self.max_bytes:
+            return  # would evict everything else, not worth keeping
+        self.entries[key] = pixels
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, dropped = self.entries.popitem(last=False)
+            self.total_bytes -= self.sizeof(dropped)
+            self.evicted += 1
+
+    def discard(self, key: tuple):
+        pixels = self.entries.pop(key, None)
+        if pixels is not None:
+            self.total_bytes -= self.sizeof(pixels)
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+        }
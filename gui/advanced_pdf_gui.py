@@ -37,6 +37,7 @@ from engine.pdf_utils import (
     concat_cairo_surfaces,
     open_pdf_using_sumatra,
     splitt_ocr_response,
+    write_surface_to_png,
 )
 from external.markdown import render_markdown_to_png
 from gui.browser_manager import BrowserManager
@@ -448,7 +449,7 @@ class AdvancedPDFViewer(tk.Tk):
 
         if self.current_surface:
             img_path = sep.join([".", "output", "gui_saved_image.png"])
-            self.current_surface.write_to_png(img_path)
+            write_surface_to_png(self.current_surface, img_path)
             self.update_status_bar("image saved Successfully")
             print("image saved Successfully")
             return img_path
@@ -465,16 +466,27 @@ class AdvancedPDFViewer(tk.Tk):
         image_data_buffer = cairo_image_surface.get_data()
 
         pil_image = None
-        if surface_format != cairo.FORMAT_ARGB32:
-            raise Exception("make sure to use ARGB32")
-        pil_image = Image.frombytes(
-            "RGBA",
-            (width, height),
-            image_data_buffer.tobytes(),
-            "raw",
-            "BGRA",
-            stride,
-        )
+        if surface_format == cairo.FORMAT_A8:
+            # gray pages hold ink coverage, see PdfEngine.color_mode
+            pil_image = Image.frombytes(
+                "L",
+                (width, height),
+                image_data_buffer.tobytes(),
+                "raw",
+                "L;I",
+                stride,
+            )
+        elif surface_format != cairo.FORMAT_ARGB32:
+            raise Exception("make sure to use ARGB32 or A8")
+        else:
+            pil_image = Image.frombytes(
+                "RGBA",
+                (width, height),
+                image_data_buffer.tobytes(),
+                "raw",
+                "BGRA",
+                stride,
+            )
         bytes_png = io.BytesIO()
         pil_image.save(bytes_png, format="png")
         return bytes_png.getvalue()
@@ -895,6 +907,15 @@ class AdvancedPDFViewer(tk.Tk):
                     "BGRX",
                     stride,
                 )
+            elif cairo_format == cairo.FORMAT_A8:
+                pil_image = Image.frombytes(
+                    "L",
+                    (width, height),
+                    data_buffer.tobytes(),
+                    "raw",
+                    "L;I",
+                    stride,
+                )
             else:
                 error_msg = f"Unsupported Cairo format: {cairo_format}."
                 print(error_msg)
@@ -1451,6 +1472,8 @@ class AdvancedPDFViewer(tk.Tk):
             # current_pdf_name = os.path.basename(current_pdf_path) # Not strictly needed for restore
 
         try:
+            # the old engine's surfaces may come from code being replaced
+            self.engine.clear_render_cache()
             self.update_status_bar("Reloading engine module...")
             for module in ALL_MODULES:
                 importlib.reload(module)
@@ -205,7 +205,7 @@ def show_page(
 
     Args:
         cairo_image_surface (cairo.ImageSurface): The Cairo surface containing the rendered page.
-                                                 Assumed to be cairo.FORMAT_ARGB32 or cairo.FORMAT_RGB24.
+                                                 Assumed to be cairo.FORMAT_ARGB32, cairo.FORMAT_RGB24 or cairo.FORMAT_A8.
 
     Returns:
         bool or None: True if user clicked "Yes", False if "No".
@@ -266,6 +266,16 @@ def show_page(
                 f"Warning: Unsupported RGB24 stride ({stride}) for width ({width}). Image might be incorrect."
             )
             pil_image = Image.new("RGB", (width, height), "purple")
+    elif surface_format == cairo.FORMAT_A8:
+        # gray pages hold ink coverage (0 = white)
+        pil_image = Image.frombytes(
+            "L",
+            (width, height),
+            image_data_buffer.tobytes(),
+            "raw",
+            "L;I",
+            stride,
+        )
 
     else:
         print(f"Unsupported Cairo surface format: {surface_format}")
@@ -78,6 +78,7 @@ class CmdArgs:
                 print("setting clean")
                 self.clean = int(args.clean) or 6
             self.debug = args.debug
+            self.workers = max(args.workers, 1)
             self.size = self.TEST_SIZE.get(args.size) or None
             self.subjects = args.subjects or all_subjects
             self.max = args.max
@@ -343,6 +344,13 @@ class CmdArgs:
         test.add_argument("--debug", "-d", action="store_true", default=False)
         test.add_argument("--pause", action="store_true", default=False)
         test.add_argument("--summatra", action="store_true", default=False)
+        test.add_argument(
+            "--workers",
+            "-w",
+            type=int,
+            default=1,
+            help="extract-questions: number of exams processed in parallel",
+        )
 
         test.add_argument(
             "--force",
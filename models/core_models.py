@@ -1,12 +1,13 @@
 import json
 import os
+import zlib
 from collections import defaultdict
 from os.path import sep
 
 import cairo
 import numpy as np  # speeds things up; pure-Python fallback shown later
 
-from engine.pdf_utils import _surface_as_uint32, all_subjects
+from engine.pdf_utils import _surface_as_pixels, all_subjects
 
 # ********************************************************************
 # ********************* Detecotr Data-classes
@@ -317,6 +318,71 @@ class Paragraph:
         return rep
 
 
+class SurfaceStrips:
+    """the rows y0..y1 of an ARGB32 (or A8) surface, for a few row ranges
+    only, optionally zlib compressed; everything else is treated as white.
+    `get_band` puts the rows back into a (small) new surface."""
+
+    WHITE = 0xFFFFFFFF
+    # A8 pages hold ink coverage, white paper is 0
+    WHITE_A8 = 0
+
+    def __init__(
+        self,
+        surface: cairo.ImageSurface,
+        ranges: list[tuple[int, int]],
+        compress: bool = False,
+    ):
+        pix = _surface_as_pixels(surface, 0, surface.get_height())
+        self.width = surface.get_width()
+        self.height = surface.get_height()
+        self.stride = surface.get_stride()
+        self.format = surface.get_format()
+        self.dtype = pix.dtype
+        self.white = (
+            self.WHITE_A8 if self.format == cairo.FORMAT_A8 else self.WHITE
+        )
+        self.compress = compress
+        self.strips: list[tuple[int, int, bytes]] = []
+        for y0, y1 in ranges:
+            data = pix[y0:y1].tobytes()
+            if compress:
+                data = zlib.compress(data, 1)
+            self.strips.append((y0, y1, data))
+
+    def nbytes(self):
+        return sum(len(data) for _, _, data in self.strips)
+
+    def get_rows(self, strip):
+        y0, y1, data = strip
+        if self.compress:
+            data = zlib.decompress(data)
+        return np.frombuffer(data, dtype=self.dtype).reshape(
+            y1 - y0, self.stride // self.dtype.itemsize
+        )
+
+    def get_band(self, y0: int, y1: int) -> cairo.ImageSurface:
+        pix = np.full(
+            (y1 - y0, self.stride // self.dtype.itemsize),
+            self.white,
+            self.dtype,
+        )
+        for strip in self.strips:
+            s0, s1 = strip[0], strip[1]
+            if s1 <= y0 or s0 >= y1:
+                continue
+            rows = self.get_rows(strip)
+            lo, hi = max(s0, y0), min(s1, y1)
+            pix[lo - y0 : hi - y0] = rows[lo - s0 : hi - s0]
+        return cairo.ImageSurface.create_for_data(
+            memoryview(pix).cast("B"),
+            self.format,
+            self.width,
+            y1 - y0,
+            self.stride,
+        )
+
+
 class SurfaceGapsSegments(BoxSegments):
 
     def __init__(
@@ -328,7 +394,16 @@ class SurfaceGapsSegments(BoxSegments):
         factor == 100   => the whole page will be treated as one segment
         """
         self.surface = surface
-        s_height = surface.get_height()
+        # rows kept after `compact`, replacing the surface
+        self.strips: SurfaceStrips | None = None
+        self.setup(
+            surface.get_width(), surface.get_height(), gap_factor, scale
+        )
+
+    def setup(self, width: int, height: int, gap_factor: float, scale):
+        self.width = width
+        self.height = height
+        s_height = height
         self.net_height = s_height
         self.empty_segments: list[Box] = []
         self.non_empty_segments: list[Box] = []
@@ -351,37 +426,62 @@ class SurfaceGapsSegments(BoxSegments):
         # segments = get_segments( 0, s_height, d0, factor=gap_factor)
         # out_height += sum(seg_h + 2 * d2 for _, seg_h, d2 in segments)
 
-    def find_empty_gaps(self, min_y=0):
+    def __getstate__(self):
+        # cairo surfaces can not be pickled, send the raw pixels instead
+        # (segments computed in worker processes, see `page_workers`)
+        state = self.__dict__.copy()
         surface = self.surface
-        mask = self.build_blank_mask(surface)
-        gaps: list[Box] = []
-        h_px = len(mask)
-        MIN_COUNT = round(0.1 * self.d0)
-        start = None
-        not_blanck_count = 0
-        blanck_count = 0
-        is_blank_mode = True
-        start = min_y
-        for y, blank in enumerate(mask):
-            if blank:
-                blanck_count += 1
-                not_blanck_count = 0
+        if surface is None:
+            return state
+        surface.flush()
+        state["surface"] = (
+            bytes(surface.get_data()),
+            surface.get_format(),
+            surface.get_width(),
+            surface.get_height(),
+            surface.get_stride(),
+        )
+        return state
+
+    def __setstate__(self, state):
+        if state["surface"] is None:
+            self.__dict__.update(state)
+            return
+        data, fmt, width, height, stride = state["surface"]
+        state["surface"] = cairo.ImageSurface.create_for_data(
+            bytearray(data), fmt, width, height, stride
+        )
+        self.__dict__.update(state)
+
+    def compact(self, compress: bool = False):
+        """keep only the rows of the non empty segments in `strips` and
+        drop the page surface. the padding covers the rows
+        `clip_segments_from_surface_into_contex` adds above a segment"""
+        if self.surface is None:
+            return
+        pad = int(0.2 * self.d0 * Symbol.LINE_HEIGHT_FACTOR) + 1
+        ranges: list[list[int]] = []
+        for box in self.non_empty_segments:
+            y0 = max(int(box.y) - pad, 0)
+            y1 = min(int(box.y + box.h) + pad, self.height)
+            if ranges and y0 <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], y1)
             else:
-                not_blanck_count += 1
-                blanck_count = 0
-
-            if blanck_count > MIN_COUNT:
-                is_blank_mode = True
-            elif not_blanck_count > MIN_COUNT:
-                is_blank_mode = False
-
-            if is_blank_mode and start is None:
-                start = y
-            elif not is_blank_mode and start is not None:
-                gaps.append(Box(0, start, surface.get_width(), y - start))
-                start = None
-        if start is not None:  # ran off bottom still in blank
-            gaps.append(Box(0, start, surface.get_width(), h_px - start))
+                ranges.append([y0, y1])
+        self.strips = SurfaceStrips(self.surface, ranges, compress)
+        self.surface = None
+
+    def get_page_surface(self) -> cairo.ImageSurface:
+        return self.get_band_surface(0, self.height)[0]
+
+    def find_empty_gaps(self, min_y=0):
+        mask = self.build_page_blank_mask()
+        MIN_COUNT = round(0.1 * self.d0)
+        width = self.width
+        gaps = [
+            Box(0, y0, width, y1 - y0)
+            for y0, y1 in self.find_blank_runs(mask, MIN_COUNT, min_y)
+        ]
 
         fgaps = [
             box
@@ -390,6 +490,33 @@ class SurfaceGapsSegments(BoxSegments):
         ]
         self.empty_segments = fgaps
 
+    @staticmethod
+    def find_blank_runs(mask: np.ndarray, min_count: int, min_y=0):
+        """(y0, y1) row ranges spent in "blank mode" over a row mask.
+
+        hysteresis: the mode only flips once min_count + 1 consecutive
+        rows agree, at the last of those rows; the scan starts in blank
+        mode at min_y. works on the run lengths of the mask instead of
+        walking it row by row."""
+        mask = np.asarray(mask, dtype=bool)
+        h_px = len(mask)
+        run_starts = np.concatenate(
+            ([0], np.flatnonzero(np.diff(mask.view(np.int8))) + 1)
+        )
+        run_lengths = np.diff(np.append(run_starts, h_px))
+        long_runs = run_starts[run_lengths > min_count]
+        flip_rows = long_runs + min_count
+        flip_modes = mask[long_runs]
+        # keep the rows where the mode actually changes
+        changed = flip_modes != np.append(True, flip_modes[:-1])
+        flip_rows, flip_modes = flip_rows[changed], flip_modes[changed]
+
+        starts = [min_y] + flip_rows[flip_modes].tolist()
+        ends = flip_rows[~flip_modes].tolist()
+        if len(ends) < len(starts):  # ran off bottom still in blank
+            ends.append(h_px)
+        return list(zip(starts, ends))
+
     def get_non_empty_gaps(self, min_y, max_y):
         segments = []
         cursor = min_y
@@ -398,25 +525,23 @@ class SurfaceGapsSegments(BoxSegments):
             gy, gh = box.y, box.h
             if gy > cursor:
                 h_curr = gy - cursor
-                segments.append(
-                    Box(0, cursor, self.surface.get_width(), h_curr)
-                )
+                segments.append(Box(0, cursor, self.width, h_curr))
                 net_height += h_curr
             cursor = gy + gh
 
         if cursor < max_y:  # rows after the last gap
             h_curr = max_y - cursor
-            segments.append(Box(0, cursor, self.surface.get_width(), h_curr))
+            segments.append(Box(0, cursor, self.width, h_curr))
             net_height += h_curr
 
-        if net_height < self.surface.get_height() - 2 * self.d0:
+        if net_height < self.height - 2 * self.d0:
             net_height += 2 * self.d0
 
         return segments, net_height
 
     def filter_question_segments(self, min_y, max_y, page_range, curr_page):
         q_segs = []
-        q_y_min, q_y_max = 0, self.surface.get_height()
+        q_y_min, q_y_max = 0, self.height
         if page_range[0] == curr_page:
             q_y_min = min_y  # - 40 * self.d0  # q.h
         if page_range[-1] == curr_page:
@@ -459,14 +584,42 @@ class SurfaceGapsSegments(BoxSegments):
 
         return q_segs
 
+    def build_page_blank_mask(self):
+        return self.build_blank_mask(self.surface)
+
+    def get_band_surface(self, y_min: float, y_max: float):
+        """(surface, y offset) holding the page rows y_min..y_max"""
+        if self.surface is not None:
+            return self.surface, 0
+        y0 = max(int(y_min), 0)
+        y1 = min(int(y_max) + 1, self.height)
+        return self.strips.get_band(y0, y1), y0
+
     def build_blank_mask(self, surface, y0=0, y1=None):
-        pix = _surface_as_uint32(surface, y0, y1)
+        """one bool per row, see `row_is_blank`; evaluated for all rows
+        at once"""
+        pix = _surface_as_pixels(surface, y0, y1)
         w = surface.get_width()
-        return np.fromiter(
-            (self.row_is_blank(r, w) for r in pix),
-            dtype=bool,
-            count=pix.shape[0],
-        )
+        s_right = round((1 - 0.15) * w)
+        if surface.get_format() == cairo.FORMAT_A8:
+            # ink coverage: a row is white iff the OR of its pixels is 0
+            middle = np.bitwise_or.reduce(pix[:, :s_right], axis=1)
+            blank = middle == 0
+            rows = np.flatnonzero(blank)
+            sides_white = np.count_nonzero(pix[rows, s_right:w] == 0, axis=1)
+            blank[rows] = sides_white / (w - s_right) > 0.94
+            return blank
+        # premultiplied: white rgb means opaque white or ANY_ALPHA0_WHITE,
+        # so a row is white iff the AND of its pixels keeps all rgb bits
+        rgb = self.ANY_ALPHA0_WHITE
+        middle = np.bitwise_and.reduce(pix[:, :s_right], axis=1)
+        blank = (middle & rgb) == rgb
+        # the sides are only counted for rows with an empty middle
+        rows = np.flatnonzero(blank)
+        sides = pix[rows, s_right:w]
+        sides_white = np.count_nonzero((sides & rgb) == rgb, axis=1)
+        blank[rows] = sides_white / (w - s_right) > 0.94
+        return blank
 
     OPAQUE_WHITE = 0xFFFFFFFF
     ANY_ALPHA0_WHITE = 0x00FFFFFF  # alpha 0 + white RGB
@@ -497,35 +650,30 @@ class SurfaceGapsSegments(BoxSegments):
     #     surf.get_data()[]
     #     self.row_is_blank()
 
-    def clip_segments_from_surface_into_contex(
+    def layout_segments(
         self,
-        out_ctx: cairo.Context,
         out_y_start: float,
-        scale: int,
-        segments: list[Box] | None = None,
+        segments: list[Box],
         q_part: Box = None,
     ):
-        """return (y_after) the y-location after drawing the segments into the output Context"""
-        if not segments:
-            """use the whole page segments"""
-            segments = self.non_empty_segments
-
-        segments: SurfaceGapsSegments = segments
-        input_surf: cairo.ImageSurface = self.surface
-
+        """where `clip_segments_from_surface_into_contex` puts `segments`
+        in the output, without drawing anything. returns (placements,
+        y_after, y_bottom): one (box, src_y, h0, out_y, trim_x, is_first)
+        per segment, the y-location after the segments and the lowest
+        output row drawn on (the label cover included)"""
         # TODO: FIX ME FOR FULL PAGE RENDERING , the line_height is independent of page_height , following line should be change
         # for instande by adding a char_height (d0) to Box class
         # if not line_height:
         line_height = self.d0 * Symbol.LINE_HEIGHT_FACTOR  # * self.scale
 
-        image_counter = 0
+        placements = []
+        y_bottom = out_y_start
         trim_start_x = 0
         trim_factor = 0
         for i, box in enumerate(segments):
 
             # box : Box = box
             src_y, seg_h = box.y, box.h
-            src_x, src_w = box.x, box.w
             next_box: Box = segments[i + 1] if i + 1 < len(segments) else None
             """subtract 0.20 , why ?? 0.1 for shifting by 0.1 * h0 pixel , because the detecting 
             has some delayed response by this ammount , and +0.1 for padding"""
@@ -539,6 +687,69 @@ class SurfaceGapsSegments(BoxSegments):
             is_first = False
 
             if q_part and abs(q_part.y - src_y) < 0.5 * line_height:
+                is_first = True
+                trim_start_x = q_part.x
+                trim_factor = 2.5 * line_height
+                out_y_start = 1.0 * line_height
+
+            placements.append(
+                (
+                    box,
+                    y0,
+                    h0,
+                    out_y_start,
+                    trim_start_x - trim_factor,
+                    is_first,
+                )
+            )
+            y_bottom = max(y_bottom, out_y_start + h0)
+            if is_first:
+                y_bottom = max(
+                    y_bottom, out_y_start + round(line_height * 2.2)
+                )
+
+            """this 0.25 is for spacing between lines, it require the surface to
+            be paint white at beginning"""
+            """if the space between 2 line is really small , then keep using its actual value  without trimming , other wise trim and add this approximated value """
+            padding_after = 2.0 * line_height  # approximated value
+            if next_box is not None:
+                diff = next_box.y - (y0 + h0)
+                # assert diff > 0
+                # print("diff vs line_height ", diff, line_height)
+                if diff <= 2.12 * line_height:
+                    padding_after = diff - 0.12 * line_height
+            out_y_start += h0 + padding_after
+
+        return placements, out_y_start, y_bottom
+
+    def clip_segments_from_surface_into_contex(
+        self,
+        out_ctx: cairo.Context,
+        out_y_start: float,
+        scale: int,
+        segments: list[Box] | None = None,
+        q_part: Box = None,
+    ):
+        """return (y_after) the y-location after drawing the segments into the output Context"""
+        if not segments:
+            """use the whole page segments"""
+            segments = self.non_empty_segments
+
+        segments: SurfaceGapsSegments = segments
+        input_surf, src_offset = self.get_band_surface(
+            min(box.y for box in segments) - self.d0 * 2,
+            max(box.y + box.h for box in segments) + self.d0 * 2,
+        )
+
+        line_height = self.d0 * Symbol.LINE_HEIGHT_FACTOR  # * self.scale
+        placements, y_after, _ = self.layout_segments(
+            out_y_start, segments, q_part
+        )
+
+        image_counter = 0
+        for box, y0, h0, out_y_start, trim_x, is_first in placements:
+
+            if is_first:
                 print(
                     "is_first is True",
                     "line_height =",
@@ -546,10 +757,6 @@ class SurfaceGapsSegments(BoxSegments):
                     "for label ",
                     q_part.label,
                 )
-                is_first = True
-                trim_start_x = q_part.x
-                trim_factor = 2.5 * line_height
-                out_y_start = 1.0 * line_height
 
             """handle case: seg is Image/diagram"""
 
@@ -557,9 +764,9 @@ class SurfaceGapsSegments(BoxSegments):
                 image_counter += 1
 
             sub = input_surf.create_for_rectangle(
-                0 + trim_start_x - trim_factor,
-                y0,
-                input_surf.get_width() + trim_start_x - trim_factor,
+                trim_x,
+                y0 - src_offset,
+                input_surf.get_width() + trim_x,
                 h0,
             )
             out_ctx.set_source_surface(sub, 0, out_y_start)
@@ -591,7 +798,7 @@ class SurfaceGapsSegments(BoxSegments):
 
                 out_ctx.set_source_surface(
                     cover_surf,
-                    -1 * trim_start_x + trim_factor,  # src_x
+                    -trim_x,  # src_x
                     out_y_start,
                 )
                 out_ctx.paint()
@@ -605,19 +812,77 @@ class SurfaceGapsSegments(BoxSegments):
                         print("found empty line")
                         continue
 
-            """this 0.25 is for spacing between lines, it require the surface to
-            be paint white at beginning"""
-            """if the space between 2 line is really small , then keep using its actual value  without trimming , other wise trim and add this approximated value """
-            padding_after = 2.0 * line_height  # approximated value
-            if next_box is not None:
-                diff = next_box.y - (y0 + h0)
-                # assert diff > 0
-                # print("diff vs line_height ", diff, line_height)
-                if diff <= 2.12 * line_height:
-                    padding_after = diff - 0.12 * line_height
-            out_y_start += h0 + padding_after
+        return y_after
+
+
+class GeometryGapsSegments(SurfaceGapsSegments):
+    """the segments of `SurfaceGapsSegments`, found without pixels: a row
+    is content if it lies inside the device y-range of anything drawn on
+    the page (`BaseRenderer.drawn_extents`), the gaps are then found by the
+    same hysteresis as for rendered pages.
+
+    `surface` is optional: the pixels of the rows a question is cut from
+    are rendered on demand by `render_band(y0, y1)` (e.g.
+    `PdfEngine.render_page_band`). `verify` compares the result with the
+    pixel based segmentation of a rendered page.
+    """
+
+    def __init__(
+        self,
+        extents: list[tuple[float, float]],
+        width: int,
+        height: int,
+        gap_factor: float = 0.5,
+        scale=None,
+        render_band=None,
+        surface: cairo.ImageSurface | None = None,
+    ) -> None:
+        self.extents = np.asarray(extents, dtype=float).reshape(-1, 2)
+        self.render_band = render_band
+        self.surface = surface
+        self.strips = None
+        self.setup(int(width), int(height), gap_factor, scale)
+
+    def build_page_blank_mask(self):
+        # as many rows as the pixel mask, see `_surface_as_pixels`
+        rows = self.height - 1
+        y0 = np.clip(np.floor(self.extents[:, 0]), 0, rows).astype(int)
+        y1 = np.clip(np.ceil(self.extents[:, 1]), 0, rows).astype(int)
+        coverage = np.zeros(rows + 1, dtype=np.int32)
+        np.add.at(coverage, y0, 1)
+        np.add.at(coverage, y1, -1)
+        return np.cumsum(coverage[:rows]) == 0
+
+    def get_band_surface(self, y_min: float, y_max: float):
+        if self.surface is not None or self.strips is not None:
+            return super().get_band_surface(y_min, y_max)
+        if self.render_band is None:
+            raise Exception("segments have neither a surface nor a renderer")
+        y0 = max(int(y_min), 0)
+        y1 = min(int(y_max) + 1, self.height)
+        return self.render_band(y0, y1), y0
+
+    def verify(self, surface: cairo.ImageSurface, tolerance=None):
+        """segment `surface` by its pixels and return the boxes that do
+        not match a geometry segment within `tolerance` rows (default
+        half a d0), as (geometry boxes, pixel boxes)"""
+        if tolerance is None:
+            tolerance = 0.5 * self.d0
+        pixels = SurfaceGapsSegments(surface, self.gap_factor, self.scale)
+
+        def unmatched(boxes, others):
+            return [
+                b
+                for b in boxes
+                if not any(
+                    abs(b.y - o.y) <= tolerance
+                    and abs(b.y + b.h - o.y - o.h) <= tolerance
+                    for o in others
+                )
+            ]
 
-        return out_y_start
+        mine, theirs = self.non_empty_segments, pixels.non_empty_segments
+        return unmatched(mine, theirs), unmatched(theirs, mine)
 
 
 # **************************************************************************
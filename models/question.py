@@ -1,3 +1,4 @@
+import math
 import os
 from pprint import pprint
 from typing import override
@@ -190,40 +191,24 @@ class Question(QuestionBase):
         print(f"label {self.label} has_pre = {has_pre}")
         result = {}
         if not devide or has_pre or len(self.parts) == 0:
-            out_ctx = None
-            out_surf = None
-
-            total_height = sum(
-                [s.net_height for s in page_segments_dict.values()]
-            )
-            if total_height <= 0:
-                raise Exception("Total Height = 0")
-
-            self.current_y = 0
-
             all_pages = [self.pages[0]] if only_render_pre else self.pages
-            for i, page in enumerate(all_pages):
+
+            # filter the segments of every page first: the output surface
+            # gets the exact height they are drawn with (see
+            # `SurfaceGapsSegments.layout_segments`) instead of the height
+            # of all the pages
+            page_segments: list[tuple[SurfaceGapsSegments, list[Box]]] = []
+            for page in all_pages:
 
                 page_seg = page_segments_dict[page]
 
-                page_surf = page_seg.surface
-                if i == 0:
-                    out_ctx, out_surf = self.create_output_surface(
-                        page_surf.get_width(), total_height
-                    )
-                    # out_ctx.save()
-                    # out_ctx.set_font_size(11 * scale)
-                    # # out_ctx.get_font_matrix().scale(scale, scale)
-                    # out_ctx.move_to(self.line_height * 4, self.line_height * 2)
-                    # out_ctx.show_text(f"<Question {self.number}>")
-                    # out_ctx.restore()
                 last_y = (
                     self.y1
                     if (not only_render_pre or not has_pre)
                     else (
                         self.parts[0].y - (0.2) * self.line_height
                         if self.parts[0].pages[0] == self.pages[0]
-                        else page_surf.get_height()
+                        else page_seg.height
                     )
                 )
 
@@ -244,6 +229,33 @@ class Question(QuestionBase):
                         f"WARN: skipping page {page}, no Segments found for question {self.__str__()}"
                     )
                     continue
+                page_segments.append((page_seg, q_segments))
+
+            padding = 3 * (self.line_height)
+            y_after, total_height = 0, 0
+            for page_seg, q_segments in page_segments:
+                _, y_after, y_bottom = page_seg.layout_segments(
+                    y_after, q_segments, self
+                )
+                total_height = max(total_height, y_after, y_bottom)
+
+            self.current_y = 0
+
+            if page_segments:
+                # + padding: kept below the last segment by
+                # `crop_image_surface`
+                out_ctx, out_surf = self.create_output_surface(
+                    page_segments_dict[all_pages[0]].width,
+                    math.ceil(total_height + padding) + 1,
+                )
+                # out_ctx.save()
+                # out_ctx.set_font_size(11 * scale)
+                # # out_ctx.get_font_matrix().scale(scale, scale)
+                # out_ctx.move_to(self.line_height * 4, self.line_height * 2)
+                # out_ctx.show_text(f"<Question {self.number}>")
+                # out_ctx.restore()
+
+            for page_seg, q_segments in page_segments:
                 self.current_y = (
                     page_seg.clip_segments_from_surface_into_contex(
                         out_ctx, self.current_y, scale, q_segments, self
@@ -257,7 +269,6 @@ class Question(QuestionBase):
                     print(seg)
                 print("no heigth for question", self.__str__())
             else:
-                padding = 3 * (self.line_height)
                 croped_surface = crop_image_surface(
                     out_surf, 0, self.current_y, padding
                 )
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# engine.pdf_utils lists the past papers folder when it is imported
+os.environ.setdefault("IGCSE_PATH", tempfile.mkdtemp(prefix="igcse-"))
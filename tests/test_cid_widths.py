@@ -0,0 +1,60 @@
+import pickle
+
+import pytest
+
+from engine.cid_widths import CidWidths
+
+
+def test_array_and_range_entries():
+    widths = CidWidths([1, [500, 600, 700], 10, 20, 250])
+    assert len(widths) == 2
+    assert [widths.get(c) for c in (0, 1, 2, 3, 4)] == [None, 500, 600, 700, None]
+    assert widths[10] == widths[15] == widths[20] == 250
+    assert 21 not in widths
+    with pytest.raises(KeyError):
+        widths[9]
+
+
+def test_single_element_list_in_range_entry():
+    assert CidWidths([5, 7, [300]])[6] == 300
+
+
+def test_empty_and_reversed_entries_are_skipped():
+    widths = CidWidths([1, [], 9, 3, 100, 4, [10]])
+    assert len(widths) == 1
+    assert widths[4] == 10 and 9 not in widths
+
+
+def test_later_entries_override_overlapping_ones():
+    # same result as filling a per cid dict in /W order
+    w_array = [0, 100, 1000, 10, [1, 2, 3, 4, 5], 50, 60, 7, 12, [9]]
+    expected = {}
+    for c in range(0, 101):
+        expected[c] = 1000
+    for i, w in enumerate([1, 2, 3, 4, 5]):
+        expected[10 + i] = w
+    for c in range(50, 61):
+        expected[c] = 7
+    expected[12] = 9
+
+    widths = CidWidths(w_array)
+    assert {c: widths[c] for c in range(0, 101)} == expected
+    assert widths.starts == sorted(widths.starts)
+    assert all(s <= e for s, e in zip(widths.starts, widths.ends))
+
+
+def test_hot_cache_is_cleared_by_new_intervals():
+    widths = CidWidths([0, 10, 500])
+    assert widths[5] == 500
+    widths.add_interval(5, 5, 42.0)
+    assert widths[5] == 42.0
+    assert widths[4] == widths[6] == 500
+
+
+def test_pickle_round_trip():
+    widths = CidWidths([1, [500, 600], 10, 20, 250])
+    widths.get(1)
+    copy = pickle.loads(pickle.dumps(widths))
+    assert copy == widths
+    assert copy.hot == {}
+    assert copy[2] == 600
@@ -0,0 +1,80 @@
+import json
+import os
+import re
+import shutil
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("cairo")
+pytest.importorskip("fitz")
+cli_actions = pytest.importorskip("cli_actions")
+
+from pypdf import PdfWriter  # noqa: E402
+from pypdf.generic import (  # noqa: E402
+    DecodedStreamObject,
+    DictionaryObject,
+    NameObject,
+)
+
+PDF_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "PDFs")
+EXAMS = ["9702_m23_qp_12.pdf", "9709_m23_qp_12.pdf"]
+
+
+@pytest.fixture
+def exams(tmp_path, monkeypatch):
+    """the exams of PDFs, plus one without any question (an error)"""
+    # loading a page writes debugging files into ./output
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "output").mkdir()
+
+    writer = PdfWriter()
+    for _ in range(2):
+        page = writer.add_blank_page(595, 842)
+        content = DecodedStreamObject()
+        content.set_data(b"1 0 0 1 0 0 cm 0 0 0 rg 20 240 100 10 re f")
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject()}
+        )
+        page.compress_content_streams()
+    blank = str(tmp_path / "0000_s00_qp_11.pdf")
+    with open(blank, "wb") as f:
+        writer.write(f)
+    data = [(name, os.path.join(PDF_DIR, name)) for name in EXAMS]
+    return data[:1] + [("0000_s00_qp_11.pdf", blank)] + data[1:]
+
+
+def extract(exams, workers, capsys):
+    args = SimpleNamespace(
+        test="extract-questions",
+        debug=False,
+        clean=6,
+        workers=workers,
+        range=None,
+        data=exams,
+    )
+    capsys.readouterr()
+    cli_actions.show_question(args)
+    total_error = int(
+        re.search(r"total error files =\s+(\d+)", capsys.readouterr().out)[1]
+    )
+
+    outputs = {}
+    root = cli_actions.igcse_path
+    for sub_id in os.listdir(root):
+        extraction = os.path.join(root, sub_id, "pdf-extraction")
+        for exam_id in os.listdir(extraction):
+            with open(os.path.join(extraction, exam_id, "v1.json")) as f:
+                outputs[exam_id] = json.load(f)
+        shutil.rmtree(os.path.join(root, sub_id))
+    return total_error, outputs
+
+
+def test_workers_match_the_sequential_run(exams, capsys):
+    errors, outputs = extract(exams, 1, capsys)
+    assert errors == 1
+    assert sorted(outputs) == ["9702_m23_qp_12", "9709_m23_qp_12"]
+    assert all(out["questions"] for out in outputs.values())
+
+    assert extract(exams, 2, capsys) == (errors, outputs)
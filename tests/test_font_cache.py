@@ -0,0 +1,113 @@
+import os
+import time
+
+from engine.font_cache import FontCache
+
+
+def make_cache(path, **kwargs):
+    return FontCache(str(path), **kwargs)
+
+
+def test_make_key():
+    key = FontCache.make_key(b"font", "to unicode", None)
+    assert key == FontCache.make_key(b"font", b"to unicode", None)
+    assert key != FontCache.make_key(b"font", "to unicode", b"")
+    # parts are length prefixed
+    assert FontCache.make_key(b"ab", b"c") != FontCache.make_key(b"a", b"bc")
+
+
+def test_round_trip(tmp_path):
+    tables = {"widths": [1.0, 2.0], "cmap": {1: "A"}}
+    cache = make_cache(tmp_path)
+    assert cache.get("k") is None
+    cache.put("k", tables)
+    assert cache.get("k") is tables
+
+    # a new process reads the pickled entry
+    other = make_cache(tmp_path)
+    assert other.get("k") == tables
+    assert other.get("k") is other.get("k")
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "writes": 1,
+        "errors": 0,
+        "evicted": 0,
+    }
+    assert other.stats()["hits"] == 3
+    assert not [p for p in os.listdir(tmp_path) if p.endswith(".tmp")]
+
+
+def test_corrupt_entry_is_an_error_and_a_miss(tmp_path):
+    cache = make_cache(tmp_path)
+    with open(cache._path("k"), "wb") as f:
+        f.write(b"not a pickle")
+    assert cache.get("k") is None
+    assert cache.stats()["errors"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_unusable_cache_dir_disables_the_disk(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_bytes(b"")
+    cache = make_cache(blocker / "cache")
+    assert not cache.enabled
+    cache.put("k", {"a": 1})
+    assert cache.get("k") == {"a": 1}
+    assert cache.stats()["writes"] == 0
+    assert cache.evict() == 0
+
+
+def test_memory_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(FontCache, "MAX_IN_MEMORY", 2)
+    cache = make_cache(tmp_path)
+    cache.put("a", {"a": 1})
+    cache.put("b", {"b": 1})
+    cache.get("a")  # "b" is now the least recently used
+    cache.put("c", {"c": 1})
+    assert list(cache.memory) == ["a", "c"]
+    # dropped tables are read back from disk
+    assert cache.get("b") == {"b": 1}
+    assert list(cache.memory) == ["c", "b"]
+
+
+def test_evict_by_age(tmp_path):
+    cache = make_cache(tmp_path, max_age=3600, evict_every=0)
+    cache.put("old", {"a": 1})
+    cache.put("new", {"b": 1})
+    past = time.time() - 7200
+    os.utime(cache._path("old"), (past, past))
+    assert cache.evict() == 1
+    assert not os.path.exists(cache._path("old"))
+    assert os.path.exists(cache._path("new"))
+    assert cache.stats()["evicted"] == 1
+
+
+def test_evict_by_size_drops_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, evict_every=0)
+    for i, key in enumerate("abc"):
+        cache.put(key, {"data": bytes(1000)})
+        t = time.time() - 100 + i
+        os.utime(cache._path(key), (t, t))
+    size = os.path.getsize(cache._path("a"))
+    cache.max_bytes = 2 * size
+    assert cache.evict() == 1
+    assert sorted(os.listdir(tmp_path)) == ["b.pkl", "c.pkl"]
+
+
+def test_evict_every(tmp_path):
+    cache = make_cache(tmp_path, max_age=-1, evict_every=2)
+    cache.put("a", {})
+    assert os.path.exists(cache._path("a"))
+    cache.put("b", {})  # second write: everything is too old
+    assert not os.listdir(tmp_path)
+
+
+def test_clear(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("a", {})
+    (tmp_path / "other.txt").write_bytes(b"")
+    cache.clear()
+    assert cache.memory == {}
+    assert os.listdir(tmp_path) == ["other.txt"]
+    assert cache.get("a") is None
@@ -0,0 +1,122 @@
+import pickle
+
+import numpy as np
+import pytest
+
+cairo = pytest.importorskip("cairo")
+pytest.importorskip("fitz")
+
+from pypdf import PdfWriter  # noqa: E402
+from pypdf.generic import (  # noqa: E402
+    DecodedStreamObject,
+    DictionaryObject,
+    NameObject,
+)
+
+from engine import page_workers  # noqa: E402
+from models.core_models import SurfaceGapsSegments  # noqa: E402
+
+# one black bar per page, at another height on every page
+PAGE_STREAMS = [
+    b"1 0 0 1 0 0 cm 0 0 0 rg 20 %d 100 10 re f" % y for y in (700, 400, 100)
+]
+
+
+@pytest.fixture
+def pdf_path(tmp_path, monkeypatch):
+    # loading a page writes debugging files into ./output
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "output").mkdir()
+    # `init_worker` sets the engine of the (main) process as well
+    monkeypatch.setattr(page_workers, "worker_engine", None)
+
+    writer = PdfWriter()
+    for stream in PAGE_STREAMS:
+        page = writer.add_blank_page(595, 842)
+        content = DecodedStreamObject()
+        content.set_data(stream)
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject()}
+        )
+        # the engine reads (flate) encoded content streams
+        page.compress_content_streams()
+    path = tmp_path / "pages.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+    return ("pages.pdf", str(path))
+
+
+def page_surface(height, ink_rows, width=40):
+    """a white ARGB32 page with the rows `ink_rows` (y0, y1) painted
+    black"""
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    pix = np.frombuffer(surface.get_data(), np.uint32).reshape(height, -1)
+    pix[:] = 0xFFFFFFFF
+    for y0, y1 in ink_rows:
+        pix[y0:y1, 2 : width // 2] = 0xFF000000
+    surface.mark_dirty()
+    return surface
+
+
+def rows(surface):
+    surface.flush()
+    return np.frombuffer(surface.get_data(), np.uint8).reshape(
+        surface.get_height(), surface.get_stride()
+    )
+
+
+def boxes(segments):
+    return [(b.y, b.h) for b in segments.non_empty_segments]
+
+
+@pytest.mark.parametrize("storage", ["surface", "strips", "zlib"])
+def test_segments_survive_pickling(storage):
+    segments = SurfaceGapsSegments(
+        page_surface(1000, [(100, 120), (400, 430)])
+    )
+    page = rows(segments.get_page_surface()).copy()
+    if storage != "surface":
+        segments.compact(compress=storage == "zlib")
+
+    copy = pickle.loads(pickle.dumps(segments))
+    assert boxes(copy) == boxes(segments)
+    assert (copy.surface is None) == (storage != "surface")
+    assert (rows(copy.get_page_surface()) == page).all()
+    band, y0 = copy.get_band_surface(90, 130)
+    assert (rows(band) == page[y0 : y0 + band.get_height()]).all()
+
+
+def in_process(pdf_path, page_numbers, backend):
+    page_workers.init_worker(pdf_path, 1, 0, "strips", "color")
+    return [page_workers.process_page(n, backend) for n in page_numbers]
+
+
+@pytest.mark.parametrize("backend", ["null", "image"])
+def test_worker_results_come_in_page_order(pdf_path, backend):
+    page_numbers = [3, 1, 2, 3]
+    results = list(
+        page_workers.execute_pages_in_workers(
+            pdf_path, 1, 0, "strips", "color", page_numbers, backend, 2
+        )
+    )
+    expected = in_process(pdf_path, page_numbers, backend)
+    assert len(results) == len(page_numbers)
+    for (record, segments, extents), (
+        record_0,
+        segments_0,
+        extents_0,
+    ) in zip(results, expected):
+        # (width, height, page number, sequences)
+        assert record[:3] == record_0[:3]
+        assert len(record[3]) == len(record_0[3])
+        assert extents == pytest.approx(extents_0)
+        if backend == "null":
+            assert segments is None
+            continue
+        assert boxes(segments) == boxes(segments_0)
+        assert (
+            rows(segments.get_page_surface())
+            == rows(segments_0.get_page_surface())
+        ).all()
+    assert [r[0][2] for r in results] == page_numbers
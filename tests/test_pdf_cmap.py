@@ -0,0 +1,108 @@
+import pytest
+
+from engine.pdf_cmap import ToUnicodeCMap
+
+
+def cmap(body: bytes) -> bytes:
+    return (
+        b"/CIDInit /ProcSet findresource begin\n"
+        b"12 dict begin\nbegincmap\n"
+        b"1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+        + body
+        + b"\nendcmap\nend\nend\n"
+    )
+
+
+def test_codespace_and_bfchar():
+    cid_map, ranges = ToUnicodeCMap.parse_uncached(
+        cmap(b"2 beginbfchar\n<0003> <0020>\n<0011><00660066>\nendbfchar")
+    )
+    assert ranges == [(0, 0xFFFF)]
+    assert cid_map == {3: " ", 0x11: "ff"}
+
+
+def test_no_codespace_range():
+    cid_map, ranges = ToUnicodeCMap.parse_uncached(
+        b"beginbfchar <01> <0041> endbfchar"
+    )
+    assert ranges is None
+    assert cid_map == {1: "A"}
+
+
+def test_bfrange_increment_and_array():
+    cid_map, _ = ToUnicodeCMap.parse_uncached(
+        cmap(
+            b"2 beginbfrange\n"
+            b"<0024> <0026> <0041>\n"
+            b"<0030> <0032> [<0061> <00660069> <0063>]\n"
+            b"endbfrange"
+        )
+    )
+    assert cid_map == {
+        0x24: "A",
+        0x25: "B",
+        0x26: "C",
+        0x30: "a",
+        0x31: "fi",
+        0x32: "c",
+    }
+
+
+def test_bfrange_increments_last_code_unit_only():
+    cid_map, _ = ToUnicodeCMap.parse_uncached(
+        cmap(b"beginbfrange <01> <02> <00410061> endbfrange")
+    )
+    assert cid_map == {1: "Aa", 2: "Ab"}
+
+
+def test_surrogate_pairs():
+    cid_map, _ = ToUnicodeCMap.parse_uncached(
+        cmap(b"beginbfchar <01> <D835DC00> endbfchar")
+    )
+    assert cid_map == {1: "\U0001d400"}
+
+
+def test_comments_and_white_space_inside_hex():
+    cid_map, _ = ToUnicodeCMap.parse_uncached(
+        cmap(b"beginbfchar % a comment <05> <0099>\n<01> <00 4\n1> endbfchar")
+    )
+    assert cid_map == {1: "A"}
+
+
+def test_bfrange_past_last_code_point_is_clamped():
+    cid_map, _ = ToUnicodeCMap.parse_uncached(
+        cmap(
+            b"beginbfrange <0000> <00FF> <DBFFDFFD> endbfrange\n"
+            b"beginbfchar <0100> <0041> endbfchar"
+        )
+    )
+    assert cid_map[0] == "\U0010fffd"
+    assert cid_map[2] == "\U0010ffff"
+    assert 3 not in cid_map
+    # the rest of the font is still parsed
+    assert cid_map[0x100] == "A"
+
+
+def test_malformed_bfrange_entry_resyncs():
+    cid_map, _ = ToUnicodeCMap.parse_uncached(
+        cmap(b"beginbfrange [ <01> <02> <0041> endbfrange")
+    )
+    assert cid_map == {1: "A", 2: "B"}
+
+
+def test_parse_is_cached_per_stream(monkeypatch):
+    monkeypatch.setattr(ToUnicodeCMap, "cache", {})
+    data = cmap(b"beginbfchar <01> <0041> endbfchar")
+    first = ToUnicodeCMap.parse(data)
+    assert ToUnicodeCMap.parse(bytes(data)) is first
+    assert len(ToUnicodeCMap.cache) == 1
+
+
+def test_parse_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(ToUnicodeCMap, "cache", {})
+    monkeypatch.setattr(ToUnicodeCMap, "MAX_CACHED", 2)
+    streams = [cmap(b"beginbfchar <01> <%04X> endbfchar" % c) for c in (65, 66, 67)]
+    for data in streams:
+        ToUnicodeCMap.parse(data)
+    assert len(ToUnicodeCMap.cache) == 2
+    assert ToUnicodeCMap.parse(streams[2])[0] == {1: "C"}
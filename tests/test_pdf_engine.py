@@ -0,0 +1,290 @@
+import numpy as np
+import pytest
+
+cairo = pytest.importorskip("cairo")
+pytest.importorskip("fitz")
+
+from pypdf import PdfWriter  # noqa: E402
+from pypdf.generic import (  # noqa: E402
+    DecodedStreamObject,
+    DictionaryObject,
+    NameObject,
+    NumberObject,
+)
+
+from engine.engine_state import EngineState  # noqa: E402
+from engine.pdf_engine import PdfEngine  # noqa: E402
+from engine.pdf_renderer import (  # noqa: E402
+    BaseRenderer,
+    RecordingRenderer,
+    SymbolRenderer,
+)
+
+# a 200 x 300 page with two black bars, at device rows 50..60 and 200..230
+# (cairo gets the flipped page matrix with the first `cm`)
+PAGE_STREAM = b"1 0 0 1 0 0 cm 0 0 0 rg 20 240 100 10 re f 20 70 150 30 re f"
+# the second page has one bar, at device rows 130..150
+PAGE_STREAM_2 = b"1 0 0 1 0 0 cm 0 0 0 rg 20 150 50 20 re f"
+# a 64 x 64 black image xobject drawn 16 x 16, twice on the first page and
+# once on the second
+IMAGE_STREAMS = (
+    b"1 0 0 1 0 0 cm q 16 0 0 16 20 20 cm /Im0 Do Q "
+    b"q 16 0 0 16 100 20 cm /Im0 Do Q",
+    b"1 0 0 1 0 0 cm q 16 0 0 16 20 200 cm /Im0 Do Q",
+)
+
+
+def write_pdf(path, streams, xobjects=None):
+    writer = PdfWriter()
+    resources = {NameObject("/Font"): DictionaryObject()}
+    if xobjects:
+        resources[NameObject("/XObject")] = DictionaryObject(
+            {
+                NameObject(name): writer._add_object(xobj)
+                for name, xobj in xobjects.items()
+            }
+        )
+    for stream in streams:
+        page = writer.add_blank_page(200, 300)
+        content = DecodedStreamObject()
+        content.set_data(stream)
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject(resources)
+        # the engine reads (flate) encoded content streams
+        page.compress_content_streams()
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def open_pdf(path):
+    engine = PdfEngine(scaling=1)
+    engine.set_files([(path.name, str(path))])
+    engine.proccess_next_pdf_file()
+    engine.set_debug(0)
+    return engine
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    # loading a page writes debugging files into ./output
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "output").mkdir(exist_ok=True)
+    path = tmp_path / "page.pdf"
+    write_pdf(path, (PAGE_STREAM, PAGE_STREAM_2))
+    return open_pdf(path)
+
+
+@pytest.fixture
+def image_engine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "output").mkdir(exist_ok=True)
+    image = DecodedStreamObject()
+    image.set_data(bytes(64 * 64))
+    image.update(
+        {
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Image"),
+            NameObject("/Width"): NumberObject(64),
+            NameObject("/Height"): NumberObject(64),
+            NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+            NameObject("/BitsPerComponent"): NumberObject(8),
+        }
+    )
+    path = tmp_path / "image.pdf"
+    write_pdf(path, IMAGE_STREAMS, {"/Im0": image})
+    return open_pdf(path)
+
+
+def surface_rows(surface):
+    surface.flush()
+    return np.frombuffer(surface.get_data(), np.uint8).reshape(
+        surface.get_height(), surface.get_stride()
+    )
+
+
+def test_drawn_extents(engine):
+    engine.render_pdf_page(1, backend="image", cache=False)
+    extents = sorted(engine.renderer.drawn_extents)
+    assert extents == [
+        pytest.approx((50, 60)),
+        pytest.approx((200, 230)),
+    ]
+
+
+def test_glyph_stream_paths_are_not_page_extents(engine):
+    engine.render_pdf_page(1, backend="image", cache=False)
+    renderer = engine.renderer
+    extents = list(renderer.drawn_extents)
+    ctx, state = renderer.ctx, renderer.state
+
+    glyph_ctx = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 10, 10))
+    engine.execute_glyph_stream(
+        b"0 0 750 750 re f",
+        glyph_ctx,
+        "/a",
+        cairo.Matrix(0.001, 0, 0, 0.001, 0, 0),
+    )
+    # the glyph paths are in glyph space, only the text extent counts
+    assert renderer.drawn_extents == extents
+    assert renderer.ctx is ctx and renderer.state is state
+
+
+def test_page_band_rows_match_the_page(engine):
+    page = surface_rows(
+        engine.render_pdf_page(1, backend="image", cache=False)
+    )
+    for y0, y1 in [(40, 70), (0, 300), (195, 215)]:
+        band = engine.render_page_band(1, y0, y1)
+        assert band.get_height() == y1 - y0
+        assert tuple(band.get_device_offset()) == (0, 0)
+        assert (surface_rows(band) == page[y0:y1]).all()
+
+
+def test_page_band_keeps_the_engine_page_state(engine):
+    page = engine.render_pdf_page(1, backend="image", cache=False)
+    renderer, stream = engine.renderer, engine.current_stream
+    engine.render_page_band(2, 120, 160)
+    assert engine.current_page == 1
+    assert engine.current_stream is stream
+    assert engine.renderer is renderer and renderer.surface is page
+
+
+def test_band_pages_are_loaded_once(engine, monkeypatch):
+    loads = []
+    load_page_content = engine.load_page_content
+    monkeypatch.setattr(
+        engine,
+        "load_page_content",
+        lambda n: loads.append(n) or load_page_content(n),
+    )
+    engine.render_page_band(1, 40, 70)
+    engine.render_page_band(1, 190, 240)
+    assert loads == [1]
+
+
+def test_render_cache_keys(engine):
+    first = engine.render_pdf_page(1, backend="image")
+    assert engine.render_pdf_page(1, backend="image") is first
+    engine.detection_types = engine.D_DETECT_QUESTION
+    assert engine.render_pdf_page(1, backend="image") is not first
+    assert len(engine.render_cache.entries) == 2
+
+
+def test_cache_hit_restores_the_page_state(engine):
+    first = engine.render_pdf_page(1, backend="image")
+    renderer = engine.renderer
+    engine.render_pdf_page(2, backend="image")
+    assert engine.current_page == 2
+
+    assert engine.render_pdf_page(1, backend="image") is first
+    assert engine.current_page == 1
+    assert engine.current_stream.endswith(PAGE_STREAM)
+    assert engine.renderer is renderer and engine.renderer.surface is first
+    assert sorted(engine.renderer.drawn_extents) == [
+        pytest.approx((50, 60)),
+        pytest.approx((200, 230)),
+    ]
+
+
+def test_clear_render_cache_by_kind(engine):
+    engine.render_pdf_page(1, backend="image")
+    page_bytes = engine.render_cache.total_bytes
+    question = cairo.ImageSurface(cairo.FORMAT_ARGB32, 10, 10)
+    engine.render_cache.put(
+        engine.render_cache_key("question", 1, True), {"1": question}
+    )
+    assert engine.render_cache.total_bytes == page_bytes + 400
+
+    engine.clear_render_cache("question")
+    assert [k[0] for k in engine.render_cache.entries] == ["page"]
+    assert engine.render_cache.total_bytes == page_bytes
+
+    engine.render_page_band(1, 40, 70)
+    engine.clear_render_cache()
+    assert not engine.render_cache.entries and not engine.band_pages
+    assert engine.render_cache.total_bytes == 0
+
+
+def test_image_xobjects_are_decoded_once_per_document(
+    image_engine, monkeypatch
+):
+    decoded = []
+    decode = EngineState.decode_inline_image
+    monkeypatch.setattr(
+        EngineState,
+        "decode_inline_image",
+        lambda self, op, data=None: decoded.append(len(data))
+        or decode(self, op, data),
+    )
+    image_engine.render_pdf_page(1, backend="image", cache=False)
+    # drawn into the unit square of the CTM
+    assert image_engine.renderer.drawn_extents == [
+        pytest.approx((264, 280)),
+        pytest.approx((264, 280)),
+    ]
+    image_engine.render_pdf_page(2, backend="image", cache=False)
+    assert decoded == [64 * 64]
+
+    # reduced to the drawn size at decode time
+    ((key, pixels),) = image_engine.image_cache.entries.items()
+    assert key[2:] == (4,)
+    assert pixels.shape == (16, 16, 4)
+    assert not pixels[..., :3].any() and (pixels[..., 3] == 255).all()
+
+
+def test_null_backend_records_without_painting(engine, image_engine):
+    engine.render_pdf_page(1, backend="image", cache=False)
+    extents = engine.renderer.drawn_extents
+    surface = engine.render_pdf_page(1, backend="null", cache=False)
+    assert isinstance(engine.renderer, SymbolRenderer)
+    assert (surface.get_width(), surface.get_height()) == (1, 1)
+    assert engine.renderer.drawn_extents == extents
+
+    # images are neither decoded nor drawn, their extent still counts
+    image_engine.render_pdf_page(1, backend="null", cache=False)
+    assert image_engine.renderer.drawn_extents == [
+        pytest.approx((264, 280)),
+        pytest.approx((264, 280)),
+    ]
+    assert not image_engine.image_cache.entries
+
+
+def test_backend_is_selected_per_call(engine):
+    image = engine.render_pdf_page(1, backend="image")
+    assert type(engine.renderer) is BaseRenderer
+    extents = engine.renderer.drawn_extents
+
+    # recordings are replayed at the engine scale
+    replayed = engine.render_pdf_page(1, backend="recording")
+    assert isinstance(engine.renderer, RecordingRenderer)
+    assert replayed is not image
+    assert (replayed.get_width(), replayed.get_height()) == (200, 300)
+    assert engine.renderer.drawn_extents == extents
+
+    engine.render_pdf_page(1, backend="null")
+    assert isinstance(engine.renderer, SymbolRenderer)
+    assert engine.render_pdf_page(1, backend="image") is image
+    with pytest.raises(Exception, match="unknown renderer backend"):
+        engine.render_pdf_page(1, backend="pdf")
+
+
+def test_color_modes(engine, tmp_path):
+    engine.color_mode = "gray"
+    surface = engine.render_pdf_page(1, cache=False)
+    assert surface.get_format() == cairo.FORMAT_A8
+    # black and white pages stay A8 in auto mode
+    engine.color_mode = "auto"
+    surface = engine.render_pdf_page(1, cache=False)
+    assert surface.get_format() == cairo.FORMAT_A8
+
+    # others are painted again, in color
+    path = tmp_path / "red.pdf"
+    write_pdf(path, [PAGE_STREAM.replace(b"0 0 0 rg", b"1 0 0 rg")])
+    red = open_pdf(path)
+    red.color_mode = "auto"
+    surface = red.render_pdf_page(1, cache=False)
+    assert surface.get_format() == cairo.FORMAT_ARGB32
+    assert sorted(red.renderer.drawn_extents) == [
+        pytest.approx((50, 60)),
+        pytest.approx((200, 230)),
+    ]
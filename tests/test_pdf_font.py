@@ -0,0 +1,204 @@
+import os
+
+import pytest
+
+cairo = pytest.importorskip("cairo")
+pytest.importorskip("fitz")
+
+from pypdf.generic import IndirectObject  # noqa: E402
+
+from engine import pdf_engine, pdf_font  # noqa: E402
+from engine.pdf_engine import PdfEngine  # noqa: E402
+from engine.pdf_font import PdfFont  # noqa: E402
+
+PDF_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "PDFs")
+# pages 2..4 share most of their (TrueType and Type1) fonts, partly under
+# other resource names
+EXAM = os.path.join(PDF_DIR, "9702_m23_qp_12.pdf")
+PAGES = (2, 3, 4)
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    # loading a page writes debugging files into ./output
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "output").mkdir()
+
+    engine = PdfEngine(scaling=1)
+    engine.set_files([("9702_m23_qp_12.pdf", EXAM)])
+    engine.proccess_next_pdf_file()
+    engine.set_debug(0)
+    return engine
+
+
+def page_fonts(engine):
+    """the fonts of all `PAGES`, by id"""
+    fonts = {}
+    for page in PAGES:
+        engine.load_page_content(page)
+        for font in engine.font_map.values():
+            fonts[id(font)] = font
+    return fonts
+
+
+def test_fonts_are_shared_by_reference(engine):
+    for page in PAGES:
+        engine.load_page_content(page)
+        for name, ref in engine.res["/Font"].items():
+            assert isinstance(ref, IndirectObject)
+            font = engine.font_registry[(ref.idnum, ref.generation)]
+            assert engine.font_map[name] is font
+
+
+def test_fonts_are_built_once_per_document(engine, monkeypatch):
+    built = []
+
+    class CountingFont(PdfFont):
+        def __init__(self, *args, **kwargs):
+            built.append(args[0])
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(pdf_engine, "PdfFont", CountingFont)
+    engine.font_registry = {}
+    fonts = page_fonts(engine)
+    assert len(built) == len(fonts) == len(engine.font_registry)
+    # the same resource, looked up again (e.g. by a form xobject)
+    name, ref = next(iter(engine.res["/Font"].items()))
+    assert engine.get_font(name, ref, depth=1) is engine.font_map[name]
+    assert len(built) == len(fonts)
+
+
+class FakeContext:
+    """the part of cairo.Context used by `PdfFont.set_scaled_font`"""
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.selected = []
+
+    def get_matrix(self):
+        return self.matrix
+
+    def set_font_face(self, face):
+        self.face = face
+
+    def set_font_size(self, size):
+        self.size = size
+
+    def get_scaled_font(self):
+        return (self.face, self.size, self.matrix.xx)
+
+    def set_scaled_font(self, scaled_font):
+        self.selected.append(scaled_font)
+
+
+@pytest.fixture
+def font(engine):
+    engine.load_page_content(PAGES[0])
+    return next(f for f in engine.font_map.values() if f.font_data)
+
+
+def test_font_face_is_created_once(font, monkeypatch):
+    faces = []
+    monkeypatch.setattr(
+        pdf_font,
+        "create_cairo_font_face_for_memory",
+        lambda data, **kwargs: faces.append(data) or object(),
+    )
+    face = font.get_cairo_font_face()
+    assert font.get_cairo_font_face() is face
+    assert faces == [font.font_data]
+
+
+def test_scaled_fonts_are_cached_per_size_and_matrix(font, monkeypatch):
+    monkeypatch.setattr(font, "get_cairo_font_face", lambda: "face")
+    ctx = FakeContext(cairo.Matrix(2, 0, 0, -2, 10, 20))
+    first = font.set_scaled_font(ctx, 12)
+    assert first == ("face", 12, 2)
+    assert ctx.selected == []
+
+    # only the translation differs: same outlines, same scaled font
+    ctx.matrix = cairo.Matrix(2, 0, 0, -2, 50, 70)
+    assert font.set_scaled_font(ctx, 12) is first
+    assert ctx.selected == [first]
+
+    assert font.set_scaled_font(ctx, 10) is not first
+    ctx.matrix = cairo.Matrix(3, 0, 0, -3, 50, 70)
+    assert font.set_scaled_font(ctx, 12) is not first
+    assert len(font.scaled_fonts) == 3
+
+
+def test_embedded_fonts_are_loaded_from_memory(engine, tmp_path):
+    embedded = [
+        font
+        for font in page_fonts(engine).values()
+        if font.font_desc and font.font_data is not None
+    ]
+    assert embedded
+    for font in embedded:
+        key = next(
+            k
+            for k in ("/FontFile", "/FontFile2", "/FontFile3")
+            if k in font.font_desc
+        )
+        assert font.font_data == font.font_desc[key].get_data()
+        assert font.ft_face.num_glyphs > 0
+    # nothing is written next to the process
+    assert not [p for p in tmp_path.rglob("*") if p.suffix == ".ttf"]
+
+
+def test_simple_font_codes_resolve_through_the_table(engine, monkeypatch):
+    engine.load_page_content(PAGES[0])
+    # a TrueType subset without ToUnicode map
+    font = next(
+        f for f in engine.font_map.values() if f.base_font.endswith("+Arial")
+    )
+    assert isinstance(font.glyph_table, list)
+    data = b"The diagram 1"
+    expected = [
+        (
+            font.get_glyph_id_from_char_code(code)[0],
+            font.get_char_width_from_code(code),
+            chr(code),
+        )
+        for code in data
+    ]
+    assert font.get_glyph_infos(data) == expected
+    assert [c for c in range(256) if font.glyph_table[c]] == sorted(set(data))
+
+    # later strings are resolved by indexing only
+    def build(code):
+        raise AssertionError(f"code {code} was resolved twice")
+
+    monkeypatch.setattr(font, "build_glyph_info", build)
+    assert font.get_glyph_infos(data[::-1]) == expected[::-1]
+
+
+def test_type0_codes_are_two_bytes_and_memoized():
+    font = PdfFont.__new__(PdfFont)
+    font.is_type0 = True
+    font.glyph_table = {}
+    built = []
+
+    def build(code):
+        built.append(code)
+        font.glyph_table[code] = (code, 500, chr(code))
+        return font.glyph_table[code]
+
+    font.build_glyph_info = build
+    # a dangling last byte is the low byte
+    infos = font.get_glyph_infos(b"\x01\x02\x00\x41\x01\x02\x07")
+    assert [info[0] for info in infos] == [0x0102, 0x41, 0x0102, 0x07]
+    assert built == [0x0102, 0x41, 0x07]
+
+
+def test_null_backend_loads_no_font_faces(engine, monkeypatch):
+    def load(font):
+        raise AssertionError(f"{font.base_font} face loaded")
+
+    monkeypatch.setattr(PdfFont, "get_cairo_font_face", load)
+    monkeypatch.setattr(PdfFont, "set_scaled_font", load)
+    # the question detector expects the pages in order
+    for page in (1, *PAGES):
+        engine.render_pdf_page(page, backend="null", cache=False)
+        # the text is still positioned (and its extent recorded)
+        assert engine.renderer.drawn_extents
@@ -0,0 +1,277 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+from pypdf.generic import (
+    ArrayObject,
+    ByteStringObject,
+    DecodedStreamObject,
+    NameObject,
+    NumberObject,
+    TextStringObject,
+)
+
+from engine.pdf_image import (
+    bgra_to_ink,
+    decode_jpeg,
+    image_to_bgra,
+    pil_to_bgra,
+    reduce_bgra,
+    reduction_factor,
+    resolve_color_space,
+    samples_to_bgra,
+    stencil_to_bgra,
+    unpack_samples,
+)
+
+
+def gray(samples):
+    return samples[:, :, 0].tolist()
+
+
+@pytest.mark.parametrize(
+    "bpc, data, expected",
+    [
+        # the padding bits at the end of each row are ignored
+        (1, b"\xbf\x5f", [[255, 0, 255], [0, 255, 0]]),
+        (2, b"\x1b\x1b", [[0, 85, 170], [0, 85, 170]]),
+        (4, b"\x0f\x8f\xf0\x0f", [[0, 255, 136], [255, 0, 0]]),
+        (8, b"\x00\x7f\xff\x01\x02\x03", [[0, 127, 255], [1, 2, 3]]),
+        # the high byte of each sample is kept
+        (16, b"\x00\xff\x12\x34\xff\x00" * 2, [[0, 18, 255], [0, 18, 255]]),
+    ],
+)
+def test_unpack_gray_samples(bpc, data, expected):
+    samples = unpack_samples(data, 3, 2, bpc, 1)
+    assert samples.shape == (2, 3, 1) and samples.dtype == np.uint8
+    assert gray(samples) == expected
+
+
+def test_unpack_multi_component_samples():
+    # two rgb pixels at 4 bits, the row is padded to 3 bytes
+    samples = unpack_samples(b"\xf0\x81\x2f\xff", 2, 1, 4, 3)
+    assert samples.tolist() == [[[255, 0, 136], [17, 34, 255]]]
+
+
+def test_unpack_palette_indices_are_not_scaled():
+    samples = unpack_samples(b"\x0f\x80", 3, 1, 4, 1, scale=False)
+    assert gray(samples) == [[0, 15, 8]]
+
+
+def test_unpack_rejects_short_data_and_odd_depths():
+    with pytest.raises(Exception):
+        unpack_samples(b"\x00" * 5, 3, 2, 8, 1)
+    with pytest.raises(Exception):
+        unpack_samples(b"\x00" * 6, 3, 2, 3, 1)
+
+
+def test_samples_to_bgra():
+    assert samples_to_bgra(
+        np.array([[[10]]], np.uint8), "/DeviceGray"
+    ).tolist() == [[[10, 10, 10, 255]]]
+    assert samples_to_bgra(
+        np.array([[[1, 2, 3]]], np.uint8), "/DeviceRGB"
+    ).tolist() == [[[3, 2, 1, 255]]]
+    cmyk = np.array(
+        [[[0, 255, 0, 0], [0, 0, 0, 255], [51, 0, 0, 51]]], np.uint8
+    )
+    assert samples_to_bgra(cmyk, "/DeviceCMYK").tolist() == [
+        [[255, 0, 255, 255], [0, 0, 0, 255], [204, 204, 163, 255]]
+    ]
+    with pytest.raises(Exception):
+        samples_to_bgra(np.zeros((1, 1, 3), np.uint8), "/Lab")
+
+
+def test_stencil_paints_zero_bits():
+    pixels = stencil_to_bgra(b"\x5f", 3, 1, [1, 0, 0.5])
+    assert pixels.tolist() == [
+        [[128, 0, 255, 255], [0, 0, 0, 0], [128, 0, 255, 255]]
+    ]
+
+
+def test_stencil_missing_rows_are_transparent():
+    pixels = stencil_to_bgra(b"\x00", 2, 2, [0, 0, 0])
+    assert pixels[0, :, 3].tolist() == [255, 255]
+    assert pixels[1, :, 3].tolist() == [0, 0]
+
+
+def test_image_to_bgra_masks_and_one_bit_gray():
+    # image masks are stencils, 1 bit device gray is a plain image
+    assert image_to_bgra(b"\x7f", 2, 1, 1, "/DeviceGray", [0, 0, 0], True)[
+        :, :, 3
+    ].tolist() == [[255, 0]]
+    assert image_to_bgra(
+        b"\x7f", 2, 1, 1, "/DeviceGray", [0, 0, 0]
+    ).tolist() == [[[0, 0, 0, 255], [255, 255, 255, 255]]]
+
+
+def test_image_to_bgra_palette():
+    palette = np.array([[255, 0, 0], [0, 0, 255]], np.uint8)
+    # 2 bit indices, 3 is past the end of the table and clamped
+    pixels = image_to_bgra(
+        b"\x1c", 3, 1, 2, "/DeviceRGB", [0, 0, 0], palette=palette
+    )
+    assert pixels.tolist() == [
+        [[0, 0, 255, 255], [255, 0, 0, 255], [255, 0, 0, 255]]
+    ]
+
+
+def test_image_to_bgra_expanded_rgb():
+    pixels = image_to_bgra(b"\x01\x02\x03", 1, 1, 24, "/DeviceGray", [0, 0, 0])
+    assert pixels.tolist() == [[[3, 2, 1, 255]]]
+
+
+def icc_stream(n, alternate=None):
+    stream = DecodedStreamObject()
+    stream[NameObject("/N")] = NumberObject(n)
+    if alternate:
+        stream[NameObject("/Alternate")] = NameObject(alternate)
+    return stream
+
+
+def test_resolve_device_and_icc_spaces():
+    assert resolve_color_space(NameObject("/DeviceRGB")) == (
+        "/DeviceRGB",
+        None,
+    )
+    assert resolve_color_space(ArrayObject([NameObject("/DeviceGray")])) == (
+        "/DeviceGray",
+        None,
+    )
+    for n, expected in (
+        (1, "/DeviceGray"),
+        (3, "/DeviceRGB"),
+        (4, "/DeviceCMYK"),
+    ):
+        space = ArrayObject([NameObject("/ICCBased"), icc_stream(n)])
+        assert resolve_color_space(space) == (expected, None)
+    space = ArrayObject(
+        [NameObject("/ICCBased"), icc_stream(3, "/DeviceGray")]
+    )
+    assert resolve_color_space(space) == ("/DeviceGray", None)
+    lab = ArrayObject([NameObject("/Lab"), NumberObject(0)])
+    assert resolve_color_space(lab)[0] is lab
+
+
+@pytest.mark.parametrize(
+    "lookup",
+    [
+        ByteStringObject(b"\xff\x00\x00\x00\x00\xff\x00\xff\x00"),
+        TextStringObject("\xff\x00\x00\x00\x00\xff\x00\xff\x00"),
+    ],
+)
+def test_resolve_indexed_space(lookup):
+    space = ArrayObject(
+        [
+            NameObject("/Indexed"),
+            ArrayObject([NameObject("/ICCBased"), icc_stream(3)]),
+            NumberObject(1),
+            lookup,
+        ]
+    )
+    base, palette = resolve_color_space(space)
+    assert base == "/DeviceRGB"
+    # hival 1: the third table entry is not part of the palette
+    assert palette.tolist() == [[255, 0, 0], [0, 0, 255]]
+
+
+def test_resolve_indexed_space_with_lookup_stream():
+    lookup = DecodedStreamObject()
+    lookup.set_data(b"\x00\x80")
+    space = ArrayObject(
+        [NameObject("/I"), NameObject("/DeviceGray"), NumberObject(1), lookup]
+    )
+    base, palette = resolve_color_space(space)
+    assert base == "/DeviceGray"
+    assert palette.tolist() == [[0], [128]]
+
+
+def test_reduction_factor():
+    assert reduction_factor(1000, 800, None) == 1
+    assert reduction_factor(1000, 800, (300, 100)) == 2
+    assert reduction_factor(1000, 800, (120, 90)) == 8
+    assert reduction_factor(1000, 800, (2000, 10)) == 1
+
+
+def test_reduce_bgra_averages_premultiplied_blocks():
+    pixels = np.zeros((2, 2, 4), np.uint8)
+    pixels[0, 0] = (200, 0, 0, 200)  # three transparent neighbours
+    assert reduce_bgra(pixels, 2).tolist() == [[[50, 0, 0, 50]]]
+
+
+def test_reduce_bgra_keeps_colors_below_alpha():
+    rng = np.random.default_rng(0)
+    alpha = rng.integers(0, 256, size=(8, 12, 1))
+    color = rng.integers(0, 256, size=(8, 12, 3)) * alpha // 255
+    pixels = np.concatenate((color, alpha), axis=2).astype(np.uint8)
+    reduced = reduce_bgra(pixels, 4)
+    assert reduced.shape == (2, 3, 4)
+    assert (reduced[:, :, :3] <= reduced[:, :, 3:]).all()
+
+
+def test_reduce_bgra_covers_partial_blocks():
+    pixels = np.full((5, 6, 4), 255, np.uint8)
+    assert reduce_bgra(pixels, 1) is pixels
+    reduced = reduce_bgra(pixels, 4)
+    assert reduced.shape == (2, 2, 4)
+    assert (reduced == 255).all()
+
+
+def jpeg(mode, size, color):
+    out = io.BytesIO()
+    Image.new(mode, size, color).save(out, "JPEG", quality=95)
+    return out.getvalue()
+
+
+def test_decode_jpeg_full_size():
+    pixels = decode_jpeg(jpeg("RGB", (64, 48), (200, 50, 10)))
+    assert pixels.shape == (48, 64, 4)
+    assert (pixels[:, :, 3] == 255).all()
+    # b, g, r order
+    assert np.abs(pixels[24, 32, :3].astype(int) - (10, 50, 200)).max() <= 3
+
+
+@pytest.mark.parametrize("target", [(10, 10), (15, 4), (63, 47)])
+def test_decode_jpeg_draft_covers_the_target(target):
+    pixels = decode_jpeg(jpeg("RGB", (64, 48), (200, 50, 10)), target)
+    height, width, _ = pixels.shape
+    assert width >= target[0] and height >= target[1]
+    assert (pixels[:, :, 3] == 255).all()
+    assert np.abs(pixels[2, 2, :3].astype(int) - (10, 50, 200)).max() <= 3
+
+
+def test_decode_jpeg_draft_reduces_large_images():
+    pixels = decode_jpeg(jpeg("RGB", (64, 48), (0, 0, 0)), (10, 10))
+    assert pixels.shape[:2] == (12, 16)  # decoded at 1/4
+    # not smaller than the stored size
+    pixels = decode_jpeg(jpeg("RGB", (64, 48), (0, 0, 0)), (100, 10))
+    assert pixels.shape[:2] == (48, 64)
+
+
+def test_decode_gray_jpeg():
+    pixels = decode_jpeg(jpeg("L", (16, 16), 100))
+    assert pixels.shape == (16, 16, 4)
+    assert np.abs(pixels[8, 8].astype(int) - (100, 100, 100, 255)).max() <= 2
+
+
+def test_pil_to_bgra_drops_alpha():
+    img = Image.new("RGBA", (2, 1), (1, 2, 3, 0))
+    assert pil_to_bgra(img).tolist() == [[[3, 2, 1, 255], [3, 2, 1, 255]]]
+
+
+def test_bgra_to_ink():
+    pixels = np.array(
+        [
+            [
+                [255, 255, 255, 255],  # white paper
+                [0, 0, 0, 255],  # black
+                [0, 0, 0, 0],  # transparent
+                [0, 0, 0, 128],  # half transparent black
+                [0, 0, 255, 255],  # red, by its luminance
+                [100, 100, 100, 255],
+            ]
+        ],
+        np.uint8,
+    )
+    assert bgra_to_ink(pixels).tolist() == [[0, 255, 0, 128, 179, 155]]
@@ -0,0 +1,39 @@
+import pytest
+
+from engine.pdf_operator import PdfOperator
+
+
+def test_opcodes_cover_every_operator():
+    assert sorted(PdfOperator.OPCODES) == sorted(PdfOperator.OPERATORS)
+    assert sorted(PdfOperator.OPCODES.values()) == list(
+        range(len(PdfOperator.NAMES))
+    )
+    assert all(
+        PdfOperator.NAMES[code] == name
+        for name, code in PdfOperator.OPCODES.items()
+    )
+
+
+def test_operator_record():
+    op = PdfOperator("re", (1.0, 2.0, 3.0, 4.0))
+    assert op.opcode == PdfOperator.OPCODES["re"]
+    assert op.args == (1.0, 2.0, 3.0, 4.0)
+    # slotted: no per instance dict
+    assert not hasattr(op, "__dict__")
+    with pytest.raises(AttributeError):
+        op.extra = 1
+
+
+def test_unknown_and_given_opcodes():
+    assert PdfOperator("xyz", ()).opcode == -1
+    assert PdfOperator("re", (), opcode=7).opcode == 7
+
+
+def test_explanation_is_built_on_demand():
+    op = PdfOperator("cm", (1.0, 0.0, 0.0, 1.0, 5.0, 6.0))
+    assert "e=5.0" in op.explaination and "f=6.0" in op.explaination
+    assert str(op).startswith("cm // ")
+    assert repr(op) == "PdfOperator('cm', (1.0, 0.0, 0.0, 1.0, 5.0, 6.0))"
+    assert PdfOperator("Tj", ()).get_explanation(b"x") == (
+        "Show text [string=b'x']"
+    )
@@ -0,0 +1,119 @@
+import pytest
+
+pytest.importorskip("cairo")
+
+from engine.engine_state import EngineState  # noqa: E402
+from engine.pdf_operator import PdfOperator  # noqa: E402
+from engine.pdf_renderer import (  # noqa: E402
+    BaseRenderer,
+    RecordingRenderer,
+    SymbolRenderer,
+    get_renderer_backend,
+)
+
+# ExtGState dictionary keys listed with the graphics operators, they are
+# handled through `gs` and never reach the dispatch table
+EXT_GSTATE_KEYS = {
+    name
+    for name in PdfOperator.GRAPHICS_OPERATORS
+    if name.startswith("/")
+    and name not in PdfOperator.INLINE_IMAGE_OPERATORS_SET
+}
+
+
+@pytest.mark.parametrize(
+    "renderer_class", [BaseRenderer, SymbolRenderer, RecordingRenderer]
+)
+def test_dispatch_covers_every_operator(renderer_class):
+    names = {PdfOperator.NAMES[code] for code in renderer_class.DISPATCH}
+    assert names == set(PdfOperator.OPERATORS) - EXT_GSTATE_KEYS
+
+
+def test_handler_tables_name_known_operators_and_methods():
+    for owner in (EngineState, BaseRenderer):
+        for name, (method, *_) in owner.OPERATOR_HANDLERS.items():
+            assert name in PdfOperator.OPCODES
+            assert callable(getattr(owner, method))
+    assert BaseRenderer.SYNC_MATRIX_OPERATORS <= set(PdfOperator.OPCODES)
+
+
+def test_subclasses_get_their_own_table():
+    fill = PdfOperator.OPCODES["f"]
+    assert SymbolRenderer.DISPATCH is not BaseRenderer.DISPATCH
+    assert SymbolRenderer.DISPATCH[fill] is SymbolRenderer.fill_path
+    assert BaseRenderer.DISPATCH[fill] is BaseRenderer.fill_path
+
+
+def test_unknown_operator_is_rejected():
+    with pytest.raises(Exception, match="unknown operator"):
+
+        class BadRenderer(BaseRenderer):
+            OPERATOR_HANDLERS = {"nope": ("ignore_operator",)}
+
+
+class FakeState:
+    OPERATOR_HANDLERS = {
+        "cm": ("set_matrix",),
+        "Q": ("restore",),
+        "w": ("set_width", 2),
+    }
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def set_matrix(self, cmd):
+        self.calls.append(("state", cmd.name))
+
+    def restore(self, cmd):
+        self.calls.append(("state", cmd.name))
+        return "restored"
+
+    def set_width(self, cmd, factor):
+        self.calls.append(("state", cmd.name, factor))
+        return "width"
+
+
+class FakeRenderer:
+    OPERATOR_HANDLERS = {
+        "Q": ("render",),
+        "f": ("render", True),
+    }
+    SYNC_MATRIX_OPERATORS = frozenset(["cm", "Q"])
+    compile_dispatch = classmethod(BaseRenderer.compile_dispatch.__func__)
+
+    def __init__(self):
+        self.calls = []
+        self.state = FakeState(self.calls)
+
+    def sync_matrix(self):
+        self.calls.append(("sync",))
+
+    def render(self, cmd, even_odd=False):
+        self.calls.append(("render", cmd.name, even_odd))
+        return "rendered"
+
+
+def run(name):
+    r = FakeRenderer()
+    dispatch = FakeRenderer.compile_dispatch(FakeState)
+    result = dispatch[PdfOperator.OPCODES[name]](r, PdfOperator(name, ()))
+    return result, r.calls
+
+
+def test_handlers_run_state_sync_render_in_order():
+    assert run("Q") == (
+        "restored",
+        [("state", "Q"), ("sync",), ("render", "Q", False)],
+    )
+    assert run("cm") == (None, [("state", "cm"), ("sync",)])
+    assert run("w") == ("width", [("state", "w", 2)])
+    assert run("f") == ("rendered", [("render", "f", True)])
+    assert len(FakeRenderer.DISPATCH) == 4
+
+
+def test_backends_by_name():
+    assert get_renderer_backend("image") is BaseRenderer
+    assert get_renderer_backend("recording") is RecordingRenderer
+    assert get_renderer_backend("null") is SymbolRenderer
+    with pytest.raises(Exception, match="unknown renderer backend 'pdf'"):
+        get_renderer_backend("pdf")
@@ -0,0 +1,116 @@
+import pytest
+
+from engine.pdf_stream_parser import PDFStreamParser
+
+
+def parse(data: bytes):
+    return [
+        (op.name, op.args)
+        for op in PDFStreamParser().parse_stream(data).iterate()
+    ]
+
+
+def test_numbers_and_operators():
+    assert parse(b"q 1 0 0 -1.5 .5 +3 cm Q") == [
+        ("q", ()),
+        ("cm", (1.0, 0.0, 0.0, -1.5, 0.5, 3.0)),
+        ("Q", ()),
+    ]
+
+
+def test_opcode_matches_name():
+    (op,) = PDFStreamParser().parse_stream(b"BT").iterate()
+    assert op.opcode == op.OPCODES["BT"]
+
+
+def test_comments_and_white_space_are_skipped():
+    assert parse(b"% header\n\x00q\t% inline\r\nQ % end") == [
+        ("q", ()),
+        ("Q", ()),
+    ]
+
+
+def test_names_with_hex_escapes():
+    assert parse(b"/F#201 12 Tf") == [("Tf", ("/F 1", 12.0))]
+
+
+def test_literal_strings():
+    # nested parentheses, escaped parentheses, octal and named escapes
+    assert parse(rb"(a(b)c\101\n\(x\)) Tj") == [("Tj", (b"a(b)cA\n(x)",))]
+
+
+def test_line_continuation_in_string():
+    assert parse(b"(ab\\\ncd) Tj") == [("Tj", (b"abcd",))]
+
+
+def test_hex_strings_with_white_space_and_odd_length():
+    assert parse(b"<48 65\n6> Tj") == [("Tj", (b"He`",))]
+
+
+def test_arrays_and_dicts():
+    assert parse(b"[(A) -250 <42>] TJ /P <</MCID 0 /On true>> BDC") == [
+        ("TJ", ([b"A", -250.0, b"B"],)),
+        ("BDC", ("/P", {"/MCID": 0.0, "/On": True})),
+    ]
+
+
+def test_inline_image():
+    ops = parse(b"BI /W 2 /Height 1 /BPC 8 /CS /G ID \x00\xff EI Q")
+    assert ops == [
+        ("BI", ()),
+        ("/W", (2.0,)),
+        ("/H", (1.0,)),
+        ("/BPC", (8.0,)),
+        ("/CS", ("/G",)),
+        ("ID", (b"\x00\xff",)),
+        ("EI", ()),
+        ("Q", ()),
+    ]
+
+
+def test_inline_image_data_may_contain_ei():
+    ops = parse(b"BI /W 4 ID xEIx EI")
+    assert ("ID", (b"xEIx",)) in ops
+
+
+def test_memoryview_input():
+    assert parse(memoryview(b"1 w")) == [("w", (1.0,))]
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"[1 2 re",  # unterminated array
+        b"1 2 ] re",  # unbalanced close
+        b"[1 >> re",  # mismatched close
+        b"(abc Tj",  # unterminated string
+        b"foo",  # unknown operator
+        b"BI /W 1 ID abc",  # inline image without EI
+    ],
+)
+def test_malformed_streams_raise(data):
+    with pytest.raises(Exception):
+        parse(data)
+
+
+def test_string_bytes_are_kept_as_is():
+    # no text decoding: any byte value survives
+    assert parse(b"(\xe9\xff\x00) Tj <00ff80> Tj") == [
+        ("Tj", (b"\xe9\xff\x00",)),
+        ("Tj", (b"\x00\xff\x80",)),
+    ]
+
+
+def test_high_bytes_in_names_and_comments():
+    assert parse(b"% caf\xe9 \xff\n/F\xe91 1 Tf") == [("Tf", ("/F\xe91", 1.0))]
+
+
+def test_string_escapes():
+    assert parse(rb"(a\\b\r\t\b\f\x) Tj") == [("Tj", (b"a\\b\r\t\x08\x0cx",))]
+    # octal escapes take at most three digits
+    assert parse(rb"(\0\12\1234) Tj") == [("Tj", (b"\x00\nS4",))]
+
+
+def test_binary_inline_image_data():
+    ops = parse(b"BI /W 2 /H 1 ID \xff\x00\n\x80 EI")
+    assert ("ID", (b"\xff\x00\n\x80",)) in ops
@@ -0,0 +1,227 @@
+import numpy as np
+import pytest
+
+cairo = pytest.importorskip("cairo")
+
+from models.core_models import (  # noqa: E402
+    Box,
+    GeometryGapsSegments,
+    SurfaceGapsSegments,
+    SurfaceStrips,
+    Symbol,
+)
+
+
+def blank_runs_loop(mask, min_count, min_y=0):
+    """the row by row scan `find_blank_runs` replaced"""
+    runs = []
+    not_blank_count = blank_count = 0
+    is_blank_mode = True
+    start = min_y
+    for y, blank in enumerate(mask):
+        if blank:
+            blank_count += 1
+            not_blank_count = 0
+        else:
+            not_blank_count += 1
+            blank_count = 0
+        if blank_count > min_count:
+            is_blank_mode = True
+        elif not_blank_count > min_count:
+            is_blank_mode = False
+        if is_blank_mode and start is None:
+            start = y
+        elif not is_blank_mode and start is not None:
+            runs.append((start, y))
+            start = None
+    if start is not None:
+        runs.append((start, len(mask)))
+    return runs
+
+
+def page_surface(height, ink_rows, width=40, fmt=cairo.FORMAT_ARGB32):
+    """a white page with the rows `ink_rows` (y0, y1) painted black"""
+    surface = cairo.ImageSurface(fmt, width, height)
+    dtype = np.uint8 if fmt == cairo.FORMAT_A8 else np.uint32
+    pix = np.frombuffer(surface.get_data(), dtype=dtype).reshape(height, -1)
+    if fmt == cairo.FORMAT_A8:
+        pix[:] = 0
+        for y0, y1 in ink_rows:
+            pix[y0:y1, 2 : width // 2] = 0xFF
+    else:
+        pix[:] = 0xFFFFFFFF
+        for y0, y1 in ink_rows:
+            pix[y0:y1, 2 : width // 2] = 0xFF000000
+    surface.mark_dirty()
+    return surface
+
+
+@pytest.mark.parametrize("min_count", [0, 1, 2, 5])
+@pytest.mark.parametrize("min_y", [0, 3])
+def test_find_blank_runs_matches_row_scan(min_count, min_y):
+    rng = np.random.default_rng(min_count)
+    for _ in range(200):
+        # long and short runs of both kinds
+        lengths = rng.integers(1, 2 * min_count + 3, size=rng.integers(1, 12))
+        mask = np.repeat(rng.integers(0, 2, size=len(lengths)), lengths)
+        mask = mask.astype(bool)
+        assert SurfaceGapsSegments.find_blank_runs(
+            mask, min_count, min_y
+        ) == blank_runs_loop(mask, min_count, min_y)
+
+
+def test_find_blank_runs_edge_cases():
+    find = SurfaceGapsSegments.find_blank_runs
+    assert find(np.ones(5, bool), 1) == blank_runs_loop(np.ones(5, bool), 1)
+    assert find(np.zeros(5, bool), 1) == blank_runs_loop(np.zeros(5, bool), 1)
+
+
+@pytest.mark.parametrize("fmt", [cairo.FORMAT_ARGB32, cairo.FORMAT_A8])
+def test_surface_segments(fmt):
+    ink = [(100, 120), (160, 200), (400, 430)]
+    segments = SurfaceGapsSegments(page_surface(1000, ink, fmt=fmt))
+    # the mode flips on the second row of a run (d0 = 10, min count 1)
+    boxes = [(b.y, b.y + b.h) for b in segments.non_empty_segments]
+    assert boxes[:3] == [(101, 121), (161, 201), (401, 431)]
+
+
+def surface_rows(surface):
+    surface.flush()
+    return np.frombuffer(surface.get_data(), np.uint8).reshape(
+        surface.get_height(), surface.get_stride()
+    )
+
+
+@pytest.mark.parametrize("fmt", [cairo.FORMAT_ARGB32, cairo.FORMAT_A8])
+@pytest.mark.parametrize("compress", [False, True])
+def test_surface_strips(fmt, compress):
+    surface = page_surface(100, [(10, 20), (60, 70)], fmt=fmt)
+    page = surface_rows(surface).copy()
+    strips = SurfaceStrips(surface, [(8, 22), (40, 50)], compress)
+    raw = 24 * surface.get_stride()
+    assert strips.nbytes() < raw if compress else strips.nbytes() == raw
+
+    band = strips.get_band(15, 45)
+    assert band.get_format() == fmt
+    assert (band.get_width(), band.get_height()) == (40, 30)
+    assert band.get_stride() == surface.get_stride()
+    assert (surface_rows(band) == page[15:45]).all()
+
+    # rows outside the strips come back white
+    white = page_surface(100, [], fmt=fmt)
+    band = strips.get_band(0, 100)
+    assert (surface_rows(band)[:60] == page[:60]).all()
+    assert (surface_rows(band)[60:] == surface_rows(white)[60:]).all()
+
+
+def test_compact_keeps_the_padded_segments():
+    ink = [(100, 120), (125, 130), (400, 430)]
+    segments = SurfaceGapsSegments(page_surface(1000, ink))
+    page = surface_rows(segments.surface).copy()
+    ranges = [(b.y, b.y + b.h) for b in segments.non_empty_segments]
+
+    segments.compact(compress=True)
+    assert segments.surface is None
+    pad = int(0.2 * segments.d0 * Symbol.LINE_HEIGHT_FACTOR) + 1
+    kept = [(y0, y1) for y0, y1, _ in segments.strips.strips]
+    assert kept[0] == (ranges[0][0] - pad, ranges[0][1] + pad)
+    assert kept == sorted(kept) and len(kept) <= len(ranges)
+    assert segments.strips.nbytes() < page.nbytes // 10
+
+    band, y0 = segments.get_band_surface(95, 135)
+    assert y0 == 95 and band.get_height() == 41
+    assert (surface_rows(band) == page[95:136]).all()
+    assert (surface_rows(segments.get_page_surface()) == page).all()
+
+
+def test_a8_blank_mask_matches_argb32():
+    rng = np.random.default_rng(24)
+    height, width = 200, 40
+    # ink in the middle and the right side (15%), sparse and dense rows
+    ink = rng.random((height, width)) < rng.random((height, 1)) ** 8
+    ink[rng.random(height) < 0.5] = False
+    masks = []
+    for fmt, paper, black in [
+        (cairo.FORMAT_ARGB32, 0xFFFFFFFF, 0xFF000000),
+        (cairo.FORMAT_A8, 0, 0xFF),
+    ]:
+        surface = cairo.ImageSurface(fmt, width, height)
+        dtype = np.uint8 if fmt == cairo.FORMAT_A8 else np.uint32
+        pix = np.frombuffer(surface.get_data(), dtype).reshape(height, -1)
+        pix[:] = paper
+        pix[:, :width][ink] = black
+        surface.mark_dirty()
+        segments = SurfaceGapsSegments.__new__(SurfaceGapsSegments)
+        masks.append(segments.build_blank_mask(surface).tolist())
+    argb32, a8 = masks
+    assert a8 == argb32
+    assert 0 < sum(a8) < height
+
+
+def test_geometry_segments_match_pixels():
+    ink = [(100, 120), (160, 200), (400, 430)]
+    geometry = GeometryGapsSegments(ink, 40, 1000)
+    pixels = SurfaceGapsSegments(page_surface(1000, ink))
+    assert geometry.build_page_blank_mask().tolist() == (
+        pixels.build_page_blank_mask().tolist()
+    )
+    assert geometry.verify(page_surface(1000, ink)) == ([], [])
+
+
+def test_geometry_extents_are_clipped_to_the_page():
+    geometry = GeometryGapsSegments([(-50, 10), (990, 2000)], 40, 1000)
+    mask = geometry.build_page_blank_mask()
+    assert len(mask) == 999
+    assert not mask[:10].any() and mask[10:990].all() and not mask[990:].any()
+
+
+def test_geometry_segments_render_bands_on_demand():
+    ink = [(100, 120), (400, 430)]
+    bands = []
+
+    def render_band(y0, y1):
+        bands.append((y0, y1))
+        return page_surface(1000, ink).create_for_rectangle(0, y0, 40, y1 - y0)
+
+    geometry = GeometryGapsSegments(ink, 40, 1000, render_band=render_band)
+    _, y0 = geometry.get_band_surface(90, 130)
+    assert bands == [(90, 131)] and y0 == 90
+
+    geometry = GeometryGapsSegments(ink, 40, 1000)
+    with pytest.raises(Exception):
+        geometry.get_band_surface(90, 130)
+
+
+def test_layout_segments():
+    segments = SurfaceGapsSegments(page_surface(1000, [(100, 110)]))
+    line_height = segments.d0 * Symbol.LINE_HEIGHT_FACTOR
+    boxes = [Box(0, 100, 40, 10), Box(0, 118, 40, 10), Box(0, 500, 40, 30)]
+
+    placements, y_after, y_bottom = segments.layout_segments(7, boxes)
+    assert [p[0] for p in placements] == boxes
+    assert not any(p[5] for p in placements)
+
+    (_, src0, h0, out0, _, _), (_, src1, h1, out1, _, _), last = placements
+    assert out0 == 7
+    assert src0 == round(100 - 0.12 * line_height)
+    # close lines keep their spacing, far ones get two line heights
+    assert out1 == pytest.approx(out0 + h0 + 118 - (src0 + h0) - 0.12 * line_height)
+    assert last[3] == pytest.approx(out1 + h1 + 2 * line_height)
+    assert y_after == pytest.approx(last[3] + last[2] + 2 * line_height)
+    assert y_bottom == pytest.approx(last[3] + last[2])
+
+
+def test_layout_segments_label_cover():
+    segments = SurfaceGapsSegments(page_surface(1000, [(100, 110)]))
+    line_height = segments.d0 * Symbol.LINE_HEIGHT_FACTOR
+    q_part = Box(12, 100, 20, 10)
+
+    placements, _, y_bottom = segments.layout_segments(
+        0, [Box(0, 100, 40, 1)], q_part
+    )
+    (_, _, h0, out_y, trim_x, is_first), = placements
+    assert is_first
+    assert out_y == line_height
+    assert trim_x == 12 - 2.5 * line_height
+    # the white cover over the label is taller than the segment
+    assert y_bottom == line_height + round(2.2 * line_height) > out_y + h0
@@ -0,0 +1,102 @@
+import numpy as np
+
+from engine.surface_cache import SurfaceCache, surface_nbytes
+
+
+class FakeSurface:
+    def __init__(self, stride: int, height: int):
+        self.stride = stride
+        self.height = height
+
+    def get_stride(self):
+        return self.stride
+
+    def get_height(self):
+        return self.height
+
+
+def test_surface_nbytes():
+    a, b, c = FakeSurface(40, 10), FakeSurface(8, 2), FakeSurface(4, 4)
+    assert surface_nbytes(a) == 400
+    assert surface_nbytes([a, b]) == 416
+    assert surface_nbytes((a, [b, c])) == 432
+    # rendered questions are dicts of surfaces
+    assert surface_nbytes({"q": a, "parts": [b, c]}) == 432
+    assert surface_nbytes(object()) == 0
+
+
+def test_lru_eviction_by_bytes():
+    cache = SurfaceCache(max_bytes=300)
+    for key in "abc":
+        cache.put((key,), np.zeros(100, np.uint8))
+    assert cache.total_bytes == 300
+
+    cache.get(("a",))  # "b" is now the least recently used
+    cache.put(("d",), np.zeros(100, np.uint8))
+    assert list(cache.entries) == [("c",), ("a",), ("d",)]
+    assert cache.total_bytes == 300
+    assert cache.stats()["evicted"] == 1
+
+
+def test_replacing_a_key_recounts_its_size():
+    cache = SurfaceCache(max_bytes=1000)
+    cache.put(("a",), np.zeros(100, np.uint8))
+    cache.put(("a",), np.zeros(250, np.uint8))
+    assert cache.total_bytes == 250
+    assert len(cache.entries) == 1
+
+
+def test_oversized_entries_are_not_kept():
+    cache = SurfaceCache(max_bytes=100)
+    cache.put(("a",), np.zeros(50, np.uint8))
+    cache.put(("b",), np.zeros(101, np.uint8))
+    assert list(cache.entries) == [("a",)]
+    assert cache.total_bytes == 50
+
+
+def test_oversized_value_drops_the_old_one():
+    cache = SurfaceCache(max_bytes=100)
+    cache.put(("a",), np.zeros(50, np.uint8))
+    cache.put(("a",), np.zeros(101, np.uint8))
+    assert cache.get(("a",)) is None
+    assert cache.total_bytes == 0
+
+
+def test_dict_entries_are_accounted_and_evicted():
+    cache = SurfaceCache(max_bytes=1000, sizeof=surface_nbytes)
+    cache.put(("page", 1), [FakeSurface(100, 4)])
+    cache.put(
+        ("question", 1), {"a": FakeSurface(100, 3), "b": FakeSurface(100, 2)}
+    )
+    assert cache.total_bytes == 900
+
+    cache.put(("question", 2), {"a": FakeSurface(100, 2)})
+    # the page went first, the byte count stays exact
+    assert list(cache.entries) == [("question", 1), ("question", 2)]
+    assert cache.total_bytes == 700
+
+
+def test_discard():
+    cache = SurfaceCache(max_bytes=1000, sizeof=surface_nbytes)
+    cache.put(("question", 1), {"a": FakeSurface(10, 10)})
+    cache.put(("page", 1), FakeSurface(10, 20))
+    cache.discard(("question", 1))
+    cache.discard(("question", 1))  # missing keys are ignored
+    assert list(cache.entries) == [("page", 1)]
+    assert cache.total_bytes == 200
+
+
+def test_hits_misses_and_clear():
+    cache = SurfaceCache()
+    pixels = np.zeros(4, np.uint8)
+    cache.put((1,), pixels)
+    assert cache.get((1,)) is pixels
+    assert cache.get((2,)) is None
+    cache.clear()
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "evicted": 0,
+        "entries": 0,
+        "bytes": 0,
+    }